@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, List, Tuple, Callable, Optional
+from fabric import Connection
+from src.io import IO
+from src.controller import ActionSubmit, ActionUpdateDashboard, ActionKillJobs
+from .server import StandInServer, USER, PASSWORD, REMOTE_ROOT_DIR, PIPELINE, FQ_DIR
+
+
+PROG = 'python -m bench'
+DESCRIPTION = 'Time the SSH round trips of the Qiime2App actions against a local stand-in server'
+BASELINE_JSON = os.path.join(os.path.dirname(__file__), 'baseline.json')
+OPTIONAL = [
+    {
+        'keys': ['-l', '--latencies'],
+        'properties': {
+            'type': str,
+            'required': False,
+            'default': '0,50,200',
+            'help': 'comma-separated injected round-trip times in ms (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['-b', '--bandwidth-mbps'],
+        'properties': {
+            'type': float,
+            'required': False,
+            'default': None,
+            'help': 'bandwidth cap of the link in Mbit/s (default: unlimited)',
+        }
+    },
+    {
+        'keys': ['-r', '--repeats'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 3,
+            'help': 'repeats per measurement, the median is reported (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['-u', '--upload-mb'],
+        'properties': {
+            'type': int,
+            'required': False,
+            'default': 16,
+            'help': 'size of the file uploaded for the throughput measurement (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['-t', '--threshold'],
+        'properties': {
+            'type': float,
+            'required': False,
+            'default': 1.5,
+            'help': 'fail when a measurement is this many times worse than the baseline (default: %(default)s)',
+        }
+    },
+    {
+        'keys': ['--update-baseline'],
+        'properties': {
+            'action': 'store_true',
+            'help': f'overwrite {os.path.basename(BASELINE_JSON)} with this run',
+        }
+    },
+    {
+        'keys': ['-h', '--help'],
+        'properties': {
+            'action': 'help',
+            'help': 'show this help message',
+        }
+    },
+]
+
+
+class EntryPoint:
+
+    parser: argparse.ArgumentParser
+
+    def main(self):
+        self.set_parser()
+        self.add_optional_arguments()
+        self.run()
+
+    def set_parser(self):
+        self.parser = argparse.ArgumentParser(
+            prog=PROG,
+            description=DESCRIPTION,
+            add_help=False,
+            formatter_class=argparse.RawTextHelpFormatter)
+
+    def add_optional_arguments(self):
+        group = self.parser.add_argument_group('optional arguments')
+        for item in OPTIONAL:
+            group.add_argument(*item['keys'], **item['properties'])
+
+    def run(self):
+        args = self.parser.parse_args()
+        ok = Benchmark().main(
+            latencies=[float(x) for x in args.latencies.split(',')],
+            bandwidth_mbps=args.bandwidth_mbps,
+            repeats=args.repeats,
+            upload_mb=args.upload_mb,
+            threshold=args.threshold,
+            update_baseline=args.update_baseline)
+        sys.exit(0 if ok else 1)
+
+
+class FakeDashboard:
+
+    jobs: List[Tuple[str, str]]
+    host_to_jobs: Dict[str, list]
+
+    def __init__(self):
+        self.jobs = []
+        self.host_to_jobs = {}
+
+    def get_selected_jobs(self) -> List[Tuple[str, str]]:
+        return self.jobs
+
+
+class FakeView:
+    """
+    Answers every dialog the way a user clicking through the app would
+    """
+
+    def __init__(self, port: int, sample_sheet: str):
+        self.sample_sheet = sample_sheet
+        self.ssh_key_values = {
+            'User': USER,
+            'Host': '127.0.0.1',
+            'Port': str(port),
+            'Dashboard Hosts': '',
+            'Qiime2 Pipeline': PIPELINE,
+            'Scratch Dir': '/tmp',
+            'Scratch Min Free GB': '0',
+            'Reference Cache Dir': '',
+            'Reference Cache GB': '50',
+            'Pin CPUs': 'no',
+            'Nice': '0',
+            'IO Priority': 'best-effort',
+            'Cgroup Memory GB': '',
+            'Samples Per Shard': '200',
+            'Quick Look Reads': '10000',
+            'Job Backend': 'screen',
+        }
+        self.qiime2_key_values = {
+            'fq-dir': FQ_DIR,
+            'fq1-suffix': '_R1.fastq.gz',
+            'fq2-suffix': '_R2.fastq.gz',
+            'outdir': 'output',
+            'threads': '4',
+            'skip-otu': False,
+        }
+        self.dashboard = FakeDashboard()
+        self.jobs = []
+        self.errors = []
+        self.schema = None
+
+    def file_dialog_open(self, title: str) -> str:
+        return self.sample_sheet
+
+    def password_dialog(self) -> str:
+        return PASSWORD
+
+    def message_box_yes_no(self, msg: str) -> bool:
+        return True
+
+    def message_box_choice(self, msg: str, choices: List[str]) -> str:
+        return 'Run Anyway'
+
+    def message_box_info(self, msg: str):
+        pass
+
+    def message_box_error(self, msg: str):
+        self.errors.append(msg)
+
+    def get_ssh_key_values(self) -> Dict[str, str]:
+        return dict(self.ssh_key_values)
+
+    def get_qiime2_key_values(self) -> Dict[str, str]:
+        return dict(self.qiime2_key_values)
+
+    def set_schema(self, schema):
+        self.schema = schema
+
+    def display_jobs(self, host_to_jobs, replace=False):
+        self.jobs = [job for jobs in host_to_jobs.values() for job in jobs]
+
+    def show_dashboard(self):
+        pass
+
+
+class FakeWatcher:
+    """
+    The event watcher runs in the background of the app, it is not part of the timed actions
+    """
+
+    def watch(self, ssh_key_values: Dict[str, str], ssh_password: str):
+        pass
+
+
+class FakeController:
+
+    def __init__(self, view: FakeView):
+        self.io = IO()
+        self.view = view
+        self.watcher = FakeWatcher()
+
+
+class Benchmark:
+
+    server: StandInServer
+    view: FakeView
+    results: Dict[str, float]
+
+    def main(
+            self,
+            latencies: List[float],
+            bandwidth_mbps: Optional[float],
+            repeats: int,
+            upload_mb: int,
+            threshold: float,
+            update_baseline: bool) -> bool:
+
+        self.results = {}
+        for rtt_ms in latencies:
+            with StandInServer(rtt_ms=rtt_ms, bandwidth_mbps=bandwidth_mbps) as self.server:
+                self.set_view()
+                self.time_actions(rtt_ms=rtt_ms, repeats=repeats)
+                self.time_upload(rtt_ms=rtt_ms, repeats=repeats, upload_mb=upload_mb)
+
+        print('\nSummary (seconds, or Mbit/s for upload):', flush=True)
+        for key, value in self.results.items():
+            print(f'{key:<28}{value:10.3f}', flush=True)
+
+        if update_baseline:
+            with open(BASELINE_JSON, 'w') as fh:
+                json.dump(self.results, fh, indent=4)
+            print(f'Baseline written to "{BASELINE_JSON}"', flush=True)
+            return True
+
+        return self.compare(threshold=threshold)
+
+    def set_view(self):
+        sample_sheet = os.path.join(self.server.home.path, 'sample-sheet.csv')  # local side of the upload
+        with open(sample_sheet, 'w') as fh:
+            fh.write('Sample,Group\nS1,A\nS2,B\n')
+        self.view = FakeView(port=self.server.port, sample_sheet=sample_sheet)
+
+    def time_actions(self, rtt_ms: float, repeats: int):
+        controller = FakeController(view=self.view)
+
+        def submit():
+            ActionSubmit(controller).exec()
+
+        def update():
+            ActionUpdateDashboard(controller).exec()
+
+        def kill():
+            self.view.dashboard.jobs = [('127.0.0.1', self.view.jobs[0][0])]  # the most recent job
+            ActionKillJobs(controller).exec()
+
+        # each kill needs a running job submitted beforehand
+        for name, action, before in [
+            ('submit', submit, None),
+            ('update_dashboard', update, None),
+            ('kill_jobs', kill, lambda: (submit(), update())),
+        ]:
+            self.record(f'{name}@{rtt_ms:g}ms', self.median_seconds(action, repeats=repeats, before=before))
+
+        assert len(self.view.errors) == 0, f'Actions failed: {self.view.errors}'
+
+    def time_upload(self, rtt_ms: float, repeats: int, upload_mb: int):
+        local = os.path.join(self.server.home.path, 'upload.bin')
+        with open(local, 'wb') as fh:
+            fh.write(os.urandom(upload_mb * 2 ** 20))
+
+        con = Connection(
+            host='127.0.0.1',
+            user=USER,
+            port=self.server.port,
+            connect_kwargs={'password': PASSWORD})
+        con.open()
+
+        def put():
+            con.put(local=local, remote=f'/home/{USER}/{REMOTE_ROOT_DIR}/upload.bin')
+
+        seconds = self.median_seconds(put, repeats=repeats)
+        con.close()
+        self.record(f'upload_mbps@{rtt_ms:g}ms', upload_mb * 8 * 2 ** 20 / 1e6 / seconds)
+
+    def median_seconds(self, action: Callable, repeats: int, before: Optional[Callable] = None) -> float:
+        seconds = []
+        for _ in range(repeats):
+            if before is not None:
+                before()
+            start = time.perf_counter()
+            action()
+            seconds.append(time.perf_counter() - start)
+        return statistics.median(seconds)
+
+    def record(self, key: str, value: float):
+        self.results[key] = value
+        print(f'{key:<28}{value:10.3f}', flush=True)
+
+    def compare(self, threshold: float) -> bool:
+        if not os.path.exists(BASELINE_JSON):
+            print('No baseline found, run with --update-baseline first', flush=True)
+            return True
+
+        with open(BASELINE_JSON) as fh:
+            baseline = json.load(fh)
+
+        ok = True
+        for key, value in self.results.items():
+            base = baseline.get(key)
+            if base is None:
+                continue
+            higher_is_better = key.startswith('upload_mbps')
+            ratio = base / value if higher_is_better else value / base
+            if ratio > threshold:
+                print(f'Regression: {key} is {ratio:.2f}x worse than the baseline ({value:.3f} vs {base:.3f})', flush=True)
+                ok = False
+        return ok
+
+
+if __name__ == '__main__':
+    EntryPoint().main()
@@ -0,0 +1,458 @@
+import os
+import sys
+import stat
+import time
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import paramiko
+from typing import List, Optional
+
+
+USER = 'bench'
+PASSWORD = 'bench'
+REMOTE_ROOT_DIR = 'Qiime2App'
+PIPELINE = 'qiime2_pipeline-bench'
+FQ_DIR = 'data'  # relative to the remote root dir, where the pipeline runs
+
+FAKE_SCREEN = f'''\
+#!{sys.executable}
+"""
+Stand-in for GNU screen, only the three forms used by the app:
+    screen -dm -S <name> <cmd...>
+    screen -ls
+    screen -S <job_id> -X quit
+"""
+import os
+import sys
+import signal
+import subprocess
+from datetime import datetime
+
+STATE_DIR = os.path.join(os.environ['HOME'], '.bench-screen')
+os.makedirs(STATE_DIR, exist_ok=True)
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    try:  # reap if it is our zombie
+        return os.waitpid(pid, os.WNOHANG) == (0, 0)
+    except ChildProcessError:
+        return True
+
+
+def sessions():
+    ret = []
+    for fname in sorted(os.listdir(STATE_DIR), reverse=True):
+        pid = int(fname.split('.')[0])
+        with open(os.path.join(STATE_DIR, fname)) as fh:
+            start = fh.read().strip()
+        if alive(pid):
+            ret.append((fname, start))
+        else:
+            os.remove(os.path.join(STATE_DIR, fname))
+    return ret
+
+
+args = sys.argv[1:]
+if args[:1] == ['-dm']:
+    name, cmd = args[2], args[3:]
+    p = subprocess.Popen(cmd, start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(os.path.join(STATE_DIR, f'{{p.pid}}.{{name}}'), 'w') as fh:
+        fh.write(datetime.now().strftime('%m/%d/%Y %I:%M:%S %p'))
+elif args[:1] == ['-ls']:
+    s = sessions()
+    if len(s) == 0:
+        print(f'No Sockets found in {{STATE_DIR}}.')
+        sys.exit(1)
+    print('There is a screen on:' if len(s) == 1 else 'There are screens on:')
+    for job_id, start in s:
+        print(f'\\t{{job_id}}\\t({{start}})\\t(Detached)')
+    print(f'{{len(s)}} Socket{{"s" if len(s) > 1 else ""}} in {{STATE_DIR}}.')
+elif args[:1] == ['-S'] and args[2:] == ['-X', 'quit']:
+    path = os.path.join(STATE_DIR, args[1])
+    if not os.path.exists(path):
+        print(f'No screen session found.')
+        sys.exit(1)
+    try:
+        os.killpg(int(args[1].split('.')[0]), signal.SIGHUP)
+    except ProcessLookupError:
+        pass
+    os.remove(path)
+else:
+    sys.exit(f'fake screen: unsupported arguments {{args}}')
+'''
+
+FAKE_PIPELINE = '''\
+import sys
+import time
+
+if '--help' in sys.argv:  # the options the app reads once per pipeline release
+    print('  -f FQ_DIR, --fq-dir FQ_DIR')
+    print('  -1 FQ1_SUFFIX, --fq1-suffix FQ1_SUFFIX')
+    print('  -2 FQ2_SUFFIX, --fq2-suffix FQ2_SUFFIX')
+    print('  -o OUTDIR, --outdir OUTDIR')
+    print('  -t THREADS, --threads THREADS')
+    print('  --skip-otu')
+    sys.exit(0)
+
+print('Fake qiime2_pipeline started with:', ' '.join(sys.argv[1:]), flush=True)
+time.sleep(600)
+'''
+
+
+class Home:
+    """
+    Temporary directory standing in for /home/{USER} on the remote server
+    """
+
+    path: str
+    bin_dir: str
+
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix='qiime2app-bench-')
+        self.bin_dir = os.path.join(self.path, '.bench-bin')
+        root = os.path.join(self.path, REMOTE_ROOT_DIR)
+
+        os.makedirs(self.bin_dir)
+        os.makedirs(os.path.join(root, PIPELINE))
+        os.makedirs(os.path.join(root, FQ_DIR))
+
+        for sample in ['S1', 'S2']:  # hashed by the fingerprint of each submission
+            for suffix in ['_R1.fastq.gz', '_R2.fastq.gz']:
+                with open(os.path.join(root, FQ_DIR, sample + suffix), 'wb') as fh:
+                    fh.write(os.urandom(2 ** 20))
+
+        with open(os.path.join(root, '.profile'), 'w') as fh:
+            fh.write('# nothing to activate, the fake screen is already on PATH\n')
+        with open(os.path.join(root, PIPELINE, '__main__.py'), 'w') as fh:
+            fh.write(FAKE_PIPELINE)
+
+        screen = os.path.join(self.bin_dir, 'screen')
+        with open(screen, 'w') as fh:
+            fh.write(FAKE_SCREEN)
+        os.chmod(screen, os.stat(screen).st_mode | stat.S_IEXEC)
+
+    def translate(self, text: str) -> str:
+        """
+        The app refers to the remote root by absolute path, i.e. /home/{USER}/...
+        """
+        return text.replace(f'/home/{USER}', self.path)
+
+    def kill_all_jobs(self):
+        subprocess.run(
+            f'source {REMOTE_ROOT_DIR}/.profile && screen -ls | grep -P "^\\t" | cut -f2 | xargs -r -I@ screen -S @ -X quit',
+            shell=True, executable='/bin/bash', cwd=self.path, env=self.env(), capture_output=True)
+
+    def env(self) -> dict:
+        return {**os.environ, 'HOME': self.path, 'PATH': f'{self.bin_dir}:{os.environ["PATH"]}'}
+
+    def remove(self):
+        self.kill_all_jobs()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class ServerInterface(paramiko.ServerInterface):
+
+    home: Home
+
+    def __init__(self, home: Home):
+        self.home = home
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (USER, PASSWORD):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_env_request(self, channel, name, value):
+        return True
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        command = self.home.translate(command.decode())
+        threading.Thread(target=self.__exec, args=(channel, command), daemon=True).start()
+        return True
+
+    def __exec(self, channel: paramiko.Channel, command: str):
+        p = subprocess.Popen(
+            command, shell=True, executable='/bin/bash', cwd=self.home.path, env=self.home.env(),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        threads = [
+            threading.Thread(target=feed_stdin, args=(channel, p), daemon=True),
+            threading.Thread(target=pump, args=(p.stdout, channel.sendall), daemon=True),
+            threading.Thread(target=pump, args=(p.stderr, channel.sendall_stderr), daemon=True),
+        ]
+        for t in threads:
+            t.start()
+        for t in threads[1:]:
+            t.join()
+        channel.send_exit_status(p.wait())
+        channel.close()
+
+
+def feed_stdin(channel: paramiko.Channel, p: subprocess.Popen):
+    try:
+        while True:
+            data = channel.recv(65536)
+            if data == b'':  # EOF from the client
+                break
+            p.stdin.write(data)
+            p.stdin.flush()
+    except (OSError, ValueError):
+        pass
+    finally:
+        try:
+            p.stdin.close()
+        except OSError:
+            pass
+
+
+def pump(stream, send):
+    for data in iter(lambda: stream.read1(65536), b''):
+        send(data)
+
+
+class SFTPHandle(paramiko.SFTPHandle):
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class SFTPServerInterface(paramiko.SFTPServerInterface):
+
+    home: Home
+
+    def __init__(self, server: ServerInterface, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.home = server.home
+
+    def __local(self, path: str) -> str:
+        path = self.home.translate(path)
+        if not path.startswith('/'):
+            path = os.path.join(self.home.path, path)
+        return path
+
+    def canonicalize(self, path):
+        return os.path.normpath(self.__local(path)).replace(self.home.path, f'/home/{USER}', 1)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self.__local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def list_folder(self, path):
+        try:
+            local = self.__local(path)
+            ret = []
+            for fname in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, fname)))
+                attr.filename = fname
+                ret.append(attr)
+            return ret
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        local = self.__local(path)
+        try:
+            fd = os.open(local, flags, 0o644)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        f = os.fdopen(fd, mode)
+        handle = SFTPHandle(flags)
+        handle.filename = local
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self.__local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if os.path.exists(self.__local(newpath)):
+            return paramiko.SFTP_FAILURE  # like OpenSSH, plain rename does not replace
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        try:
+            os.replace(self.__local(oldpath), self.__local(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self.__local(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class Pipe:
+    """
+    One direction of the link: every chunk is held for `delay` seconds and
+    the sender is throttled to `bytes_per_sec`, like `tc netem` does
+    """
+
+    def __init__(self, src: socket.socket, dst: socket.socket, delay: float, bytes_per_sec: Optional[float]):
+        self.src = src
+        self.dst = dst
+        self.delay = delay
+        self.bytes_per_sec = bytes_per_sec
+        self.queue = queue.Queue()
+        threading.Thread(target=self.__read, daemon=True).start()
+        threading.Thread(target=self.__write, daemon=True).start()
+
+    def __read(self):
+        while True:
+            try:
+                data = self.src.recv(65536)
+            except OSError:
+                data = b''
+            self.queue.put((time.monotonic() + self.delay, data))
+            if data == b'':
+                return
+
+    def __write(self):
+        while True:
+            due, data = self.queue.get()
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            if data == b'':
+                shutdown(self.dst)
+                return
+            try:
+                self.dst.sendall(data)
+            except OSError:
+                return
+            if self.bytes_per_sec:
+                time.sleep(len(data) / self.bytes_per_sec)
+
+
+def shutdown(sock: socket.socket):
+    try:
+        sock.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+class StandInServer:
+    """
+    In-process SSH/SFTP server listening on localhost, reached through a
+    proxy port which injects round-trip latency and caps bandwidth
+    """
+
+    rtt_ms: float
+    bandwidth_mbps: Optional[float]
+
+    home: Home
+    host_key: paramiko.RSAKey
+    port: int
+
+    __sockets: List[socket.socket]
+    __transports: List[paramiko.Transport]
+
+    def __init__(self, rtt_ms: float = 0, bandwidth_mbps: Optional[float] = None):
+        self.rtt_ms = rtt_ms
+        self.bandwidth_mbps = bandwidth_mbps
+
+    def __enter__(self) -> 'StandInServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self.home = Home()
+        self.host_key = paramiko.RSAKey.generate(bits=2048)
+        self.__sockets = []
+        self.__transports = []
+
+        ssh_sock = self.__listen()
+        proxy_sock = self.__listen()
+        self.port = proxy_sock.getsockname()[1]
+
+        threading.Thread(target=self.__accept_ssh, args=(ssh_sock,), daemon=True).start()
+        threading.Thread(target=self.__accept_proxy, args=(proxy_sock, ssh_sock.getsockname()[1]), daemon=True).start()
+
+    def stop(self):
+        for t in self.__transports:
+            t.close()
+        for s in self.__sockets:
+            s.close()
+        self.home.remove()
+
+    def __listen(self) -> socket.socket:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        s.bind(('127.0.0.1', 0))
+        s.listen(16)
+        self.__sockets.append(s)
+        return s
+
+    def __accept_ssh(self, sock: socket.socket):
+        while True:
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                return
+            t = paramiko.Transport(client)
+            t.add_server_key(self.host_key)
+            t.set_subsystem_handler('sftp', paramiko.SFTPServer, SFTPServerInterface)
+            t.start_server(server=ServerInterface(home=self.home))
+            self.__transports.append(t)  # exec and sftp channels are handled by callbacks, never accept() them
+
+    def __accept_proxy(self, sock: socket.socket, ssh_port: int):
+        one_way = self.rtt_ms / 2 / 1000
+        bytes_per_sec = None if self.bandwidth_mbps is None else self.bandwidth_mbps * 1e6 / 8
+        while True:
+            try:
+                client, _ = sock.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', ssh_port))
+            for s in [client, upstream]:
+                s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.__sockets.append(s)
+            Pipe(src=client, dst=upstream, delay=one_way, bytes_per_sec=bytes_per_sec)
+            Pipe(src=upstream, dst=client, delay=one_way, bytes_per_sec=bytes_per_sec)
@@ -97,7 +97,7 @@ setup(
     options={{
         'py2app': {{
             'iconfile': './icon/logo.ico',
-            'packages': ['cffi', 'PyQt5']
+            'packages': ['cffi', 'PyQt5', 'src']  # 'src' as a package keeps the scripts in src/remote/
         }}
     }},
     setup_requires=['py2app'],
@@ -121,7 +121,7 @@ setup(
             os.remove(file)
 
     def build_windows_exe(self):
-        cmd = f'pyinstaller --clean --onefile --icon="icon/logo.ico" --add-data="icon;icon" {self.entrypoint_py}'
+        cmd = f'pyinstaller --clean --onefile --icon="icon/logo.ico" --add-data="icon;icon" --add-data="src/remote;src/remote" {self.entrypoint_py}'
         subprocess.check_call(cmd, shell=True)
 
         f = self.entrypoint_py[:-3]
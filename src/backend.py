@@ -0,0 +1,365 @@
+import sys
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import List, Tuple, Dict, Type, Optional
+
+
+class Backend(ABC):
+    """
+    How jobs are started, listed and killed on the server, all commands are run from the remote root dir
+
+    The job IDs are '<id>.<job_name>', like the ones of screen, so that the job name can always be recovered
+    """
+
+    NAME: str
+    IS_LOCAL = False  # runs the jobs on this machine, without SSH
+    DEPENDENCIES = False  # starts a job only after the jobs it depends on succeeded, see build_submit_cmd()
+    PLATFORMS: Optional[List[str]] = None  # the sys.platform of the app's machine it works on, None for any
+
+    @abstractmethod
+    def build_submit_cmd(
+            self,
+            job_name: str,
+            cmd_txt: str,
+            outdir: str,
+            threads: str,
+            after: Optional[List[str]] = None) -> str:
+        """
+        :param after: with DEPENDENCIES, the scheduler IDs of the jobs which have to succeed before this one starts,
+            see parse_submit_id()
+        """
+
+    def parse_submit_id(self, stdout: str) -> Optional[str]:
+        """
+        :return: the scheduler ID printed by the submit command, for the jobs submitted after it to depend on
+        """
+        return None
+
+    @abstractmethod
+    def build_is_running_cmd(self, job_name: str) -> str:
+        """
+        :return: a command which succeeds while a job of that name is queued or running
+        """
+
+    @abstractmethod
+    def build_status_cmd(self) -> str:
+        pass
+
+    @abstractmethod
+    def parse_status(self, stdout: str) -> List[Tuple[str, ...]]:
+        """
+        :return: list of (job_id, start_time, elapsed_time), followed by the progress where the backend reports it
+        """
+
+    @abstractmethod
+    def build_kill_cmd(self, job_id: str) -> str:
+        pass
+
+    def job_name_of(self, job_id: str) -> str:
+        return job_id.split('.', 1)[1]
+
+
+class ScreenBackend(Backend):
+    """
+    One detached screen session per job, on the host connected to
+    """
+
+    NAME = 'screen'
+
+    def build_submit_cmd(
+            self,
+            job_name: str,
+            cmd_txt: str,
+            outdir: str,
+            threads: str,
+            after: Optional[List[str]] = None) -> str:
+        return f'screen -dm -S {job_name} bash "{cmd_txt}"'
+
+    def build_is_running_cmd(self, job_name: str) -> str:
+        return f"screen -ls | cut -f2 | sed 's/^[0-9]*\\.//' | grep -qxF '{job_name}'"
+
+    def build_status_cmd(self) -> str:
+        return 'screen -ls'
+
+    def parse_status(self, stdout: str) -> List[Tuple[str, str, str]]:
+        return parse_screen_ls(stdout=stdout)
+
+    def build_kill_cmd(self, job_id: str) -> str:
+        return f'screen -S {job_id} -X quit'
+
+
+class SlurmBackend(Backend):
+    """
+    `threads` is requested as --cpus-per-task, the job's stdout goes to slurm-<id>.out in the outdir
+    """
+
+    NAME = 'slurm'
+    DEPENDENCIES = True
+    SQUEUE_FORMAT = '%i|%j|%S|%M|%T'  # job id, job name, start time, elapsed time, state
+
+    def build_submit_cmd(
+            self,
+            job_name: str,
+            cmd_txt: str,
+            outdir: str,
+            threads: str,
+            after: Optional[List[str]] = None) -> str:
+        """
+        A job whose dependency failed is cancelled instead of pending forever
+        """
+        dependency = '' if not after else f'--dependency=afterok:{":".join(after)} --kill-on-invalid-dep=yes '
+        return f'sbatch --parsable --job-name={job_name} --cpus-per-task={threads} {dependency}' \
+               f'--output="{outdir}/slurm-%j.out" --wrap=\'bash "{cmd_txt}"\''
+
+    def parse_submit_id(self, stdout: str) -> Optional[str]:
+        """
+        `--parsable` prints '<id>' or '<id>;<cluster>'
+        """
+        return stdout.strip().splitlines()[-1].split(';')[0]
+
+    def build_is_running_cmd(self, job_name: str) -> str:
+        return f'squeue --noheader --user="$USER" --name=\'{job_name}\' --format=%i | grep -q .'
+
+    def build_status_cmd(self) -> str:
+        return f'squeue --noheader --user="$USER" --format=\'{self.SQUEUE_FORMAT}\''
+
+    def parse_status(self, stdout: str) -> List[Tuple[str, str, str]]:
+        """
+        1234|outdir_1|2025-02-16T15:25:51|1-02:03:04|RUNNING
+        1235|outdir_2|N/A|0:00|PENDING
+        """
+        jobs = []
+        for line in stdout.splitlines():
+            if line.count('|') != 4:
+                continue
+            id_, job_name, start_time, elapsed, state = line.split('|')
+            if state == 'RUNNING':
+                start_time = start_time.replace('T', ' ')
+                elapsed = format_duration(seconds=parse_clock_duration(elapsed))
+            else:
+                start_time, elapsed = '', state
+            jobs.append((f'{id_}.{job_name}', start_time, elapsed))
+        return jobs
+
+    def build_kill_cmd(self, job_id: str) -> str:
+        return f'scancel {job_id.split(".", 1)[0]}'
+
+
+class PbsBackend(Backend):
+    """
+    Torque style `nodes=1:ppn=<threads>`, the job starts in the submit dir ($PBS_O_WORKDIR)
+    and its stdout and stderr go to pbs.out in the outdir
+
+    `qstat -f` is parsed instead of the column layout of `qstat -u`, which truncates the job names
+    """
+
+    NAME = 'pbs'
+    DEPENDENCIES = True
+
+    def build_submit_cmd(
+            self,
+            job_name: str,
+            cmd_txt: str,
+            outdir: str,
+            threads: str,
+            after: Optional[List[str]] = None) -> str:
+        """
+        PBS deletes a job whose dependency failed
+        """
+        dependency = '' if not after else f' -W depend=afterok:{":".join(after)}'
+        return f'echo \'cd "$PBS_O_WORKDIR" && bash "{cmd_txt}"\' | ' \
+               f'qsub -N {job_name} -l nodes=1:ppn={threads} -j oe -o "{outdir}/pbs.out"{dependency}'
+
+    def parse_submit_id(self, stdout: str) -> Optional[str]:
+        """
+        qsub prints '<id>.<server>'
+        """
+        return stdout.strip().splitlines()[-1]
+
+    def build_is_running_cmd(self, job_name: str) -> str:
+        return f'qselect -u "$USER" -N \'{job_name}\' -s QRHWST | grep -q .'
+
+    def build_status_cmd(self) -> str:
+        return 'echo "$USER" && qstat -f'
+
+    def parse_status(self, stdout: str) -> List[Tuple[str, str, str]]:
+        """
+        linyc74
+        Job Id: 1234.headnode
+            Job_Name = outdir_1
+            Job_Owner = linyc74@login1
+            job_state = R
+            resources_used.walltime = 01:02:03
+            start_time = Sun Feb 16 15:25:51 2025
+        """
+        lines = stdout.splitlines()
+        user, blocks = lines[0].strip(), []
+        for line in lines[1:]:
+            if line.startswith('Job Id:'):
+                blocks.append({'id': line[len('Job Id:'):].strip()})
+            elif ' = ' in line and len(blocks) > 0:
+                key, val = line.strip().split(' = ', 1)
+                blocks[-1][key] = val
+
+        jobs = []
+        for b in blocks:
+            if b.get('Job_Owner', '').split('@')[0] != user or b.get('job_state') in ['C', 'E', 'F']:  # not ended
+                continue
+            job_id = f'{b["id"].split(".")[0]}.{b.get("Job_Name", "")}'
+            if b.get('job_state') == 'R':
+                elapsed = format_duration(seconds=parse_clock_duration(b.get('resources_used.walltime', '0:00')))
+                jobs.append((job_id, b.get('start_time', b.get('stime', '')), elapsed))
+            else:
+                jobs.append((job_id, '', PBS_STATES.get(b.get('job_state'), b.get('job_state', ''))))
+        return jobs
+
+    def build_kill_cmd(self, job_id: str) -> str:
+        return f'qdel {job_id.split(".", 1)[0]}'
+
+
+class LocalBackend(Backend):
+    """
+    Runs the jobs on this machine, each in its own session (process group) detached from the app,
+    the process name 'qiime2app:<job_name>' finds them in the process table
+
+    Linux only, for `setsid -f`, the `exec -a` of bash and the `lstart` of procps `ps`,
+    it is not offered on other platforms, see backend_names()
+
+    The running jobs are listed with the last line of their progress.txt
+    """
+
+    NAME = 'local'
+    IS_LOCAL = True
+    PLATFORMS = ['linux']
+    PROCESS_PREFIX = 'qiime2app:'
+
+    def build_submit_cmd(
+            self,
+            job_name: str,
+            cmd_txt: str,
+            outdir: str,
+            threads: str,
+            after: Optional[List[str]] = None) -> str:
+        return f'setsid -f bash -c \'exec -a "{self.PROCESS_PREFIX}{job_name}" bash "{cmd_txt}"\' ' \
+               f'< /dev/null > /dev/null 2>&1'
+
+    def build_is_running_cmd(self, job_name: str) -> str:
+        return f'ps -u "$(id -u)" -o args= | cut -d " " -f 1 | grep -qxF \'{self.PROCESS_PREFIX}{job_name}\''
+
+    def build_status_cmd(self) -> str:
+        return f'''\
+LC_ALL=C ps -u "$(id -u)" -o pid=,lstart=,etime=,args= | while read -r PID W M D T Y E NAME CMD_TXT; do
+    case "$NAME" in {self.PROCESS_PREFIX}*)
+        echo "$PID|$W $M $D $T $Y|$E|${{NAME#{self.PROCESS_PREFIX}}}|$(tail -n 1 "$(dirname "$CMD_TXT")/progress.txt" 2> /dev/null)";;
+    esac
+done'''
+
+    def parse_status(self, stdout: str) -> List[Tuple[str, str, str, str]]:
+        """
+        4321|Mon Oct 19 16:39:29 2026|01:02:03|outdir_1|Denoising with DADA2
+
+        :return: list of (job_id, start_time, elapsed_time, progress)
+        """
+        jobs = []
+        for line in stdout.split('\n'):  # not splitlines(), which also splits at the '\r' of progress bars
+            if line.count('|') < 4:
+                continue
+            pid, start_time, elapsed, job_name, progress = line.split('|', 4)
+            start_time = datetime.strptime(start_time, '%a %b %d %H:%M:%S %Y').strftime('%m/%d/%Y %I:%M:%S %p')
+            elapsed = format_duration(seconds=parse_clock_duration(elapsed))
+            progress = progress.rsplit('\r', 1)[-1].strip()  # the last state of a progress bar
+            jobs.append((f'{pid}.{job_name}', start_time, elapsed, progress))
+        return jobs
+
+    def build_kill_cmd(self, job_id: str) -> str:
+        return f'kill -TERM -- -{job_id.split(".", 1)[0]}'  # the whole process group
+
+
+PBS_STATES = {'Q': 'QUEUED', 'H': 'HELD', 'W': 'WAITING', 'S': 'SUSPENDED', 'T': 'MOVING'}
+BACKENDS: Dict[str, Type[Backend]] = {b.NAME: b for b in [ScreenBackend, SlurmBackend, PbsBackend, LocalBackend]}
+
+
+def backend_names(platform: str = sys.platform) -> List[str]:
+    """
+    The backends which work from the app on the `platform`
+    """
+    return [name for name, b in BACKENDS.items() if b.PLATFORMS is None or platform in b.PLATFORMS]
+
+
+def get_backend(name: str) -> Backend:
+    assert name in BACKENDS, f'Unknown job backend "{name}", choose from {backend_names()}'
+    assert name in backend_names(), f'The job backend "{name}" does not work on {sys.platform}, choose from {backend_names()}'
+    return BACKENDS[name]()
+
+
+def parse_screen_ls(stdout: str) -> List[Tuple[str, str, str]]:
+    """
+    :return: list of (job_id, start_time)
+
+    Three typical responses:
+
+    ---1---
+    No Sockets found in /run/screen/S-linyc74.
+    -------
+
+    ---2---
+    There is a screen on:
+        833015.outdir	(02/16/2025 03:25:51 PM)	(Detached)
+    1 Socket in /run/screen/S-linyc74.
+    -------
+
+    ---3---
+    There are screens on:
+        835269.outdir_1	(02/16/2025 09:12:36 PM)	(Detached)
+        833015.outdir_2	(02/16/2025 03:25:51 PM)	(Detached)
+    2 Sockets in /run/screen/S-linyc74.
+    -------
+
+    Parsed examples:
+
+    ---1---
+    []
+    -------
+
+    ---2---
+    [('833015.outdir', '02/16/2025 03:25:51 PM')]
+    -------
+
+    ---3---
+    [('835269.outdir_1', '02/16/2025 09:12:36 PM'), ('833015.outdir_2', '02/16/2025 03:25:51 PM')]
+    -------
+    """
+    lines = stdout.splitlines()
+    jobs = []
+    if lines[0].startswith('There'):
+        for line in lines[1:-1]:
+            job_id, start_time = line.split('\t')[1:3]
+            start_time = start_time[1:-1]  # remove the parentheses
+            duration = duration_until_now(time_point=start_time)
+            jobs.append((job_id, start_time, duration))
+    return jobs
+
+
+def duration_until_now(time_point: str):
+    time_format = '%m/%d/%Y %I:%M:%S %p'
+    time_point_dt = datetime.strptime(time_point, time_format)
+    now = datetime.now()
+    time_difference = now - time_point_dt
+    return format_duration(seconds=time_difference.total_seconds())
+
+
+def parse_clock_duration(duration: str) -> int:
+    """
+    '1-02:03:04' (days-hours:minutes:seconds), '02:03:04', '3:04' -> seconds
+    """
+    days, _, clock = duration.rpartition('-')
+    seconds = 0
+    for part in clock.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds + int(days or 0) * 86400
+
+
+def format_duration(seconds: float) -> str:
+    hours, remainder = divmod(seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+    return f'{int(hours)}h {int(minutes)}m'
@@ -1,23 +1,119 @@
+import os
+import re
+import json
+import base64
+import queue
+import shlex
+import tempfile
+import hashlib
+from io import StringIO
 from fabric import Connection
 from datetime import datetime
-from typing import Dict, List, Tuple
-from os.path import basename, abspath
-from .io import IO
-from .view import View
+from typing import Dict, List, Tuple, Optional, Union, Any
+from concurrent.futures import ThreadPoolExecutor, wait
+from os.path import basename, abspath, dirname, expanduser
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtWidgets import QApplication
+from .io import IO, is_sample_sheet_readable, is_sample_sheet_splittable
+from .view import View, Gallery
+from .local import LocalConnection
+from .timeline import Timeline, aggregate_by_parameters
+from .backend import Backend, get_backend
+from .pipeline import DOWNSTREAM_KEYS, APPEND_DIR_PREFIX, START_STAGE_OPTION, STOP_STAGE_OPTION, SWEEP_START_STAGE, \
+    PER_SAMPLE_STAGE, MERGED_START_STAGE, STAGE_OPTIONS, \
+    RESUME_STAGES, expand_grid, shard_outdirs, resume_stage, stage_choice, parse_quick_look_reads, quick_look_parameters, \
+    format_quick_look_reads
+from .schema import parse_help, load_schema, save_schema
+from .upload import remote_fastq_name, needs_compression, needs_decompression, upload_fastq
+from .gallery import ImageCache, cache_key
 
 
 REMOTE_ROOT_DIR = 'Qiime2App'  # placed in the remote user's home directory
 PROFILE_FILE = '.profile'
+EVENTS_DIR = '.qiime2app/events'  # relative to the remote root dir, one file is written by each job when it ends
+EVENTS_WAIT_SECONDS = 300  # server-side blocking wait before the watcher re-issues the request
+EVENTS_KEEP_DAYS = 90  # older event files are deleted by the jobs, so that the events dir stays small to list
+HOST_TIMEOUT_SECONDS = 15  # for each host of the dashboard, so that an unreachable one does not delay the others
+LOCAL_HOST = 'localhost'  # the host of the local backend in the dashboard
+STATUS_SEPARATOR = '### job status ###'
+PLACEMENTS_SEPARATOR = '### job placements ###'
+REMOTE_SCRIPTS_DIR = f'{dirname(__file__)}/remote'  # python scripts uploaded to and run on the server
+JOB_WRAPPER = 'job_wrapper.py'
+FINGERPRINT_PY = 'fingerprint.py'
+MERGE_SHARDS_PY = 'merge_shards.py'
+COMPARE_RUNS_PY = 'compare_runs.py'
+COMPACT_RUNS_PY = 'compact_runs.py'
+PREVIEW_FASTQ_PY = 'preview_fastq.py'
+INDEX_FASTQ_PY = 'index_fastq.py'
+CHECK_ARTIFACTS_PY = 'check_artifacts.py'
+FIGURES_PY = 'figures.py'
+SUBSAMPLE_FASTQ_PY = 'subsample_fastq.py'
+QUICK_LOOK_SEED = 1  # the same reads are drawn by every quick look of the same FASTQ files
+FASTQ_INDEX_JSON = '.qiime2app/fastq-index.json'  # relative to the remote root dir, the listing of each fq-dir by its mtime
+PREVIEW_FILES = 4  # FASTQ files sampled from the fq-dir
+PREVIEW_READS = 10000  # from the start of the sampled files in total
+COMPACT_PARALLEL_DIRS = 4  # outdirs compressed at the same time, sharing the 'threads'
+COMPACT_SCHEDULE = '0 3 * * *'  # crontab time of the scheduled compaction, every night at 3 am
+COMPACT_CRON_TAG = '# qiime2app-compact-runs'  # marks the crontab line of the scheduled compaction
+COMPACT_LOG = '.qiime2app/compact-runs.log'  # relative to the remote root dir, the reports of the scheduled compaction
+PIPELINE_TEMPORARY_PATHS = ['temp']  # relative to the outdir, the workdir which the pipeline leaves there, e.g. with --debug
+COMPACTION_PLAN_LINES = 30  # of the paths listed before compacting
+JOB_STATS_JSON = 'job-stats.json'
+SCRATCH_DIRS = '.qiime2app/scratch'  # relative to the remote root dir, one file per running job holding its scratch dir path
+SCRATCH_PREFIX = 'qiime2app-'
+FINGERPRINTS_DIR = '.qiime2app/fingerprints'  # relative to the remote root dir, fingerprint -> outdir of each successful run
+FASTQ_HASHES_JSON = '.qiime2app/fastq-hashes.json'
+FINGERPRINT_TXT = 'fingerprint.txt'
+PARAMETERS_JSON = 'parameters.json'  # the pipeline and the parameters of a run, written with its command.txt, for Append Samples and Resume
+SAMPLE_IDS_FD = 3  # the fingerprint script reads the sample IDs from the stdin of the command as this file descriptor
+SAMPLES_DIR = '.qiime2app/samples'  # relative to the remote root dir, the resource samples of each job by its name
+PLACEMENTS_DIR = '.qiime2app/placements'  # relative to the remote root dir, the CPUs and priorities of each running job by its name
+PROGRESS_TIMES_TSV = 'progress-times.tsv'  # the lines of progress.txt, each with its time in epoch seconds
+TIMELINES_DIR = f'{expanduser("~")}/.qiime2app/timelines'  # local cache of the stage timelines of the runs
+SCHEMAS_DIR = f'{expanduser("~")}/.qiime2app/schemas'  # local cache of the options of each pipeline release
+FIGURES_DIR = f'{expanduser("~")}/.qiime2app/figures'  # local cache of the figures and thumbnails of the gallery
+FIGURES_CACHE_BYTES = 512 * 2 ** 20
+THUMBNAILS_PER_REQUEST = 24  # fetched in one round trip, about a screenful
+EXIT_CODE_TXT = 'exit-code.txt'  # written when the job exits, also when killed, for runs waiting on it
+UPSTREAM_WAIT_SECONDS = 10
+UPSTREAM_GRACE_SECONDS = 120  # an upstream job gone from the backend without an exit code for longer is dead, e.g. killed by the OOM killer
+UPSTREAM_WAIT_DAYS = 7  # a waiting run gives up after that long
+FINGERPRINT_EXCLUDED_KEYS = [  # parameters that do not change the results
+    'outdir',
+    'threads',
+    'classifier-reads-per-batch',
+]
+HEREDOC_DELIMITER = 'QIIME2APP_SCRIPT'
+COMMAND_TXT_DELIMITER = 'QIIME2APP_COMMAND_TXT'  # command.txt is written by the command which submits it
+PARAMETERS_JSON_DELIMITER = 'QIIME2APP_PARAMETERS_JSON'  # and so is PARAMETERS_JSON
+JOB_WRAPPER_DELIMITER = 'QIIME2APP_JOB_WRAPPER'  # the job wrapper is written by command.txt
+FINGERPRINTS_SEPARATOR = '### fingerprints ###'
+LOCAL_PASSWORD = 'local'  # in place of the password, which is not needed without SSH
 
 
 class Controller:
 
     view: View
+    watcher: 'EventWatcher'
+    figure_fetcher: 'FigureFetcher'
 
     def __init__(self, io: IO, view: View):
         self.io = io
         self.view = view
+        self.watcher = EventWatcher()
+        self.watcher.received.connect(self.on_events_received)
+        QApplication.instance().aboutToQuit.connect(self.watcher.stop)
+        self.figure_fetcher = FigureFetcher()
+        self.figure_fetcher.thumbnails_fetched.connect(self.on_thumbnails_fetched)
+        self.figure_fetcher.thumbnails_failed.connect(self.view.gallery.forget_requested)
+        self.figure_fetcher.figure_fetched.connect(self.on_figure_fetched)
+        self.figure_fetcher.figure_failed.connect(self.on_figure_failed)
+        self.view.gallery.thumbnails_needed.connect(self.on_thumbnails_needed)
+        self.view.gallery.figure_clicked.connect(self.on_figure_clicked)
+        self.view.gallery.closed.connect(self.figure_fetcher.close)
+        QApplication.instance().aboutToQuit.connect(self.figure_fetcher.close)
         self.__connect_buttons_to_actions()
+        apply_cached_schema(view=self.view)
         self.view.show()
 
     def __connect_buttons_to_actions(self):
@@ -42,9 +138,30 @@ class Controller:
     def action_save_parameters(self):
         ActionSaveParameters(self).exec()
 
+    def action_preview_fastq(self):
+        ActionPreviewFastq(self).exec()
+
+    def action_check_sample_sheet(self):
+        ActionCheckSampleSheet(self).exec()
+
+    def action_upload_reads(self):
+        ActionUploadReads(self).exec()
+
     def action_submit(self):
         ActionSubmit(self).exec()
 
+    def action_submit_sweep(self):
+        ActionSubmitSweep(self).exec()
+
+    def action_submit_sharded(self):
+        ActionSubmitSharded(self).exec()
+
+    def action_submit_quick_look(self):
+        ActionSubmitQuickLook(self).exec()
+
+    def action_append_samples(self):
+        ActionAppendSamples(self).exec()
+
     def action_show_dashboard(self):
         self.view.show_dashboard()
 
@@ -54,15 +171,60 @@ class Controller:
     def action_kill_jobs(self):
         ActionKillJobs(self).exec()
 
+    def action_resume_runs(self):
+        ActionResumeRuns(self).exec()
+
+    def action_resource_chart(self):
+        ActionResourceChart(self).exec()
+
+    def action_compare_stages(self):
+        ActionCompareStages(self).exec()
+
+    def action_compare_runs(self):
+        ActionCompareRuns(self).exec()
+
+    def action_figure_gallery(self):
+        ActionFigureGallery(self).exec()
+
+    def action_compact_runs(self):
+        ActionCompactRuns(self).exec()
+
+    def on_events_received(self, events: list, jobs: list, notify: bool):
+        self.view.dashboard.display_jobs(host_to_jobs={host_of(ssh_key_values=self.watcher.ssh_key_values): jobs})
+        self.view.dashboard.display_finished_jobs(events=events)
+        if not notify:  # events that already existed when the watcher started
+            return
+        for _, job_name, exit_code, end_time, outdir, _ in events:
+            status = 'finished' if exit_code == '0' else f'crashed (exit code {exit_code})'
+            self.view.notify(title=f'Job {status}', msg=f'{job_name} {status} at {end_time}\n{outdir}')
+
+    def on_thumbnails_needed(self, figures: list):
+        self.figure_fetcher.request(kind=FigureFetcher.THUMBNAILS, arg=figures)
+
+    def on_thumbnails_fetched(self, path_to_data: dict):
+        for path, data in path_to_data.items():
+            self.view.gallery.set_thumbnail(path=path, data=data)
+
+    def on_figure_clicked(self, figure: dict):
+        self.figure_fetcher.request(kind=FigureFetcher.FIGURE, arg=figure)
+
+    def on_figure_fetched(self, file: str):
+        self.view.open_file(file=file)
+
+    def on_figure_failed(self, msg: str):
+        self.view.message_box_error(msg=msg)
+
 
 class Action:
 
     io: IO
     view: View
+    watcher: 'EventWatcher'
 
     def __init__(self, controller: Controller):
         self.io = controller.io
         self.view = controller.view
+        self.watcher = controller.watcher
 
     def exec(self):
         try:
@@ -70,6 +232,11 @@ class Action:
         except Exception as e:
             self.view.message_box_error(msg=repr(e))
 
+    def password_dialog(self) -> str:
+        if get_backend(name=self.view.get_ssh_key_values()['Job Backend']).IS_LOCAL:
+            return LOCAL_PASSWORD
+        return self.view.password_dialog()
+
 
 class ActionLoadParameters(Action):
 
@@ -79,6 +246,8 @@ class ActionLoadParameters(Action):
             return
         parameters = self.io.read(file=file)
         self.view.set_parameters(parameters=parameters)
+        apply_cached_schema(view=self.view)  # of the pipeline release of the parameters
+        self.view.set_parameters(parameters=parameters)  # also of the options added by the schema
 
 
 class ActionSaveParameters(Action):
@@ -91,6 +260,219 @@ class ActionSaveParameters(Action):
         self.io.write(file=file, parameters=parameters)
 
 
+class ActionPreviewFastq(Action):
+    """
+    Summarizes the first reads of a few FASTQ files of the 'fq-dir' on the server, see src/remote/preview_fastq.py,
+    and offers to fill in the suggested clipping and max expected errors
+    """
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+    qiime2_key_values: Dict[str, str]
+
+    def workflow(self):
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        self.qiime2_key_values = self.view.get_qiime2_key_values()
+
+        q = self.qiime2_key_values
+        args = {
+            'fq-dir': q['fq-dir'],
+            'fq1-suffix': q['fq1-suffix'],
+            'fq2-suffix': q.get('fq2-suffix', ''),  # single-end in PacBio mode
+            'files': str(PREVIEW_FILES),
+            'reads': str(PREVIEW_READS),
+            'max-ee': q['max-expected-error-bases'],
+        }
+        print(f'Previewing {PREVIEW_READS} reads of "{q["fq-dir"]}" on the server', flush=True)
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            response = con.run(build_remote_script_cmd(script=PREVIEW_FASTQ_PY, args=args), hide=True)
+        con.close()
+
+        summary = json.loads(response.stdout)
+        self.view.show_fastq_preview(summary=summary)
+
+        changes = {k: v for k, v in summary['suggestions'].items() if k in q and q[k] != v}
+        if len(changes) == 0:
+            return
+        msg = 'Apply the suggested values?\n\n' + '\n'.join(f'{k}: {q[k]} -> {v}' for k, v in changes.items())
+        if self.view.message_box_yes_no(msg=msg):
+            parameters = {k: v for k, v in self.view.get_key_values().items() if v is not False}  # a present flag is checked
+            parameters.update(changes)
+            self.view.set_parameters(parameters=parameters)
+
+
+class ActionCheckSampleSheet(Action):
+    """
+    Indexes the FASTQ files of the 'fq-dir' by sample on the server, see src/remote/index_fastq.py,
+    reports the files which do not pair up with the suffixes, and generates or patches a sample sheet from the index
+    """
+
+    PATCH = 'Patch Sample Sheet'
+    GENERATE = 'Generate Sample Sheet'
+    CLOSE = 'Close'
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+    qiime2_key_values: Dict[str, str]
+    report: Dict[str, Any]
+
+    def workflow(self):
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        self.qiime2_key_values = self.view.get_qiime2_key_values()
+
+        self.index_fastqs()
+        suggested = self.report['suggested_suffixes']
+        if suggested is not None:
+            keys = ['fq1-suffix', 'fq2-suffix'][:len(suggested)]
+            msg = f'{self.report["unmatched"]} FASTQ files match neither suffix, e.g. "{self.report["unmatched_examples"][0]}"\n\n' \
+                  'Use the suffixes ' + ' and '.join(f'{k} "{v}"' for k, v in zip(keys, suggested)) + ' instead?'
+            if self.view.message_box_yes_no(msg=msg):
+                parameters = {k: v for k, v in self.view.get_key_values().items() if v is not False}  # a present flag is checked
+                parameters.update(zip(keys, suggested))
+                self.view.set_parameters(parameters=parameters)
+                self.qiime2_key_values = self.view.get_qiime2_key_values()
+                self.index_fastqs()  # the listing is cached
+
+        choice = self.view.message_box_choice(
+            msg=format_fastq_index_report(report=self.report, fq_dir=self.qiime2_key_values['fq-dir']),
+            choices=[self.PATCH, self.GENERATE, self.CLOSE])
+        if choice == self.PATCH:
+            self.patch()
+        elif choice == self.GENERATE:
+            self.generate()
+
+    def index_fastqs(self):
+        q = self.qiime2_key_values
+        args = {
+            'fq-dir': q['fq-dir'],
+            'fq1-suffix': q['fq1-suffix'],
+            'fq2-suffix': q.get('fq2-suffix', ''),  # single-end in PacBio mode
+            'cache': FASTQ_INDEX_JSON,
+        }
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            response = con.run(build_remote_script_cmd(script=INDEX_FASTQ_PY, args=args), hide=True)
+        con.close()
+        self.report = json.loads(response.stdout)
+
+    def patch(self):
+        file = self.view.file_dialog_open(title='Sample Sheet to Patch')
+        if file == '':
+            return
+        if not is_sample_sheet_splittable(file):
+            self.view.message_box_error(msg=f'Cannot patch "{basename(file)}", choose a .csv or .tsv sample sheet')
+            return
+        samples = self.report['samples']
+        n_missing = len(set(samples) - set(self.io.read_sample_ids(file=file)))
+        add_missing = n_missing > 0 and self.view.message_box_yes_no(
+            msg=f'{n_missing} samples with FASTQ files are not in the sample sheet, add them?')
+        patched_file = self.view.file_dialog_save(filename=file)
+        if patched_file == '':
+            return
+        removed, added = self.io.patch_sample_sheet(
+            file=file, sample_ids=samples, add_missing=add_missing, patched_file=patched_file)
+        self.view.message_box_info(
+            msg=f'Saved "{patched_file}"\n\n'
+                f'Removed {len(removed)} rows without FASTQ files or repeated: {", ".join(removed[:10])}\n'
+                f'Added {len(added)} samples')
+
+    def generate(self):
+        file = self.view.file_dialog_save(filename='sample-sheet.csv')
+        if file == '':
+            return
+        self.io.generate_sample_sheet(file=file, sample_ids=self.report['samples'])
+        self.view.message_box_info(msg=f'Saved "{file}" with {len(self.report["samples"])} samples')
+
+
+def format_fastq_index_report(report: Dict[str, Any], fq_dir: str, max_items: int = 5) -> str:
+    cached = ', listing cached' if report['cached'] else ''
+    lines = [f'{report["files"]} FASTQ files in "{fq_dir}"{cached}', f'{len(report["samples"])} samples with all read files']
+    for title, items in [
+            ('samples with a missing read file', [f'{s}: {", ".join(f)}' for s, f in report['unpaired'].items()]),
+            ('samples with the same read in several files', [f'{s}: {", ".join(f)}' for s, f in report['duplicates'].items()]),
+            ('files matching no suffix', report['unmatched_examples'])]:
+        n = report['unmatched'] if title.startswith('files') else len(items)
+        if n > 0:
+            lines += ['', f'{n} {title}'] + [f'    {i}' for i in items[:max_items]] + (['    ...'] if n > max_items else [])
+    return '\n'.join(lines)
+
+
+class ActionUploadReads(Action):
+    """
+    Uploads local FASTQ files into the 'fq-dir' on the server, renamed to the 'fq1-suffix' and 'fq2-suffix',
+    the uncompressed files are compressed on the fly while they stream into the remote files,
+    and the gzipped ones decompressed if the suffix is not .gz, see src/upload.py
+    """
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+    qiime2_key_values: Dict[str, str]
+    uploads: List[Tuple[str, str]]  # local file, remote file name
+
+    def workflow(self):
+        files = self.view.file_dialog_open_files(title='Upload Reads')
+        if len(files) == 0:
+            return
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        self.qiime2_key_values = self.view.get_qiime2_key_values()
+        self.set_uploads(files=files)
+
+        fq_dir = self.qiime2_key_values['fq-dir']
+        n_compressed = sum(needs_compression(local=f, remote=name) for f, name in self.uploads)
+        n_decompressed = sum(needs_decompression(local=f, remote=name) for f, name in self.uploads)
+        examples = [f'{basename(f)} -> {name}' for f, name in self.uploads[:5]] + (['...'] if len(self.uploads) > 5 else [])
+        if not self.view.message_box_yes_no(
+                msg=f'Upload {len(self.uploads)} files to "{fq_dir}"? Files of the same names are replaced\n\n'
+                    + '\n'.join(examples) + '\n\n'
+                    f'{n_compressed} uncompressed files are compressed while uploading, '
+                    f'{n_decompressed} gzipped files are decompressed for the uncompressed suffix'):
+            return
+
+        sent = self.upload()
+        total = sum(os.path.getsize(f) for f, _ in self.uploads)
+        self.view.message_box_info(
+            msg=f'{len(self.uploads)} files uploaded to "{fq_dir}", {sent / 2 ** 20:.1f} MB sent for {total / 2 ** 20:.1f} MB of reads')
+
+    def set_uploads(self, files: List[str]):
+        q = self.qiime2_key_values
+        self.uploads = []
+        for f in files:
+            name = remote_fastq_name(name=basename(f), fq1_suffix=q['fq1-suffix'], fq2_suffix=q.get('fq2-suffix', ''))
+            assert name is not None, f'"{basename(f)}" is not a FASTQ file of read 1 or 2'
+            self.uploads.append((f, name))
+        names = [name for _, name in self.uploads]
+        duplicates = sorted(set(n for n in names if names.count(n) > 1))
+        assert len(duplicates) == 0, f'Several files would be uploaded as {duplicates}'
+
+    def upload(self) -> int:
+        """
+        :return: the number of bytes sent
+        """
+        fq_dir = self.qiime2_key_values['fq-dir']
+        remote_dir = fq_dir if fq_dir.startswith('/') else f'{REMOTE_ROOT_DIR}/{fq_dir}'  # SFTP paths are from the home dir
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            con.run(f'mkdir -p "{fq_dir}"', echo=True)
+        sftp = con.sftp()
+        threads = os.cpu_count() or 1  # of this machine, which compresses
+        sent = 0
+        for f, name in self.uploads:
+            sent += upload_fastq(sftp=sftp, local=f, remote=f'{remote_dir}/{name}', threads=threads)
+        con.close()
+        return sent
+
+
 class ActionSubmit(Action):
 
     sample_sheet_local_path: str
@@ -101,11 +483,13 @@ class ActionSubmit(Action):
 
     def workflow(self):
         self.sample_sheet_local_path = self.view.file_dialog_open(title='Upload Sample Sheet')
-        if self.sample_sheet_local_path == '':
+        if self.sample_sheet_local_path == '' or not self.validate_sample_sheet():
             return
-        self.ssh_password = self.view.password_dialog()
+        self.ssh_password = self.password_dialog()
         if self.ssh_password == '':
             return
+        if not self.update_form_to_pipeline():
+            return
         if not self.view.message_box_yes_no(msg='Are you sure you want to submit the job?'):
             return
 
@@ -113,9 +497,82 @@ class ActionSubmit(Action):
         self.qiime2_key_values = self.view.get_qiime2_key_values()
 
         self.build_qiime2_cmd()
-        self.connect_and_submit_job()
+        submitted = self.connect_and_submit_job()
+        if not submitted:
+            return
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
         self.view.message_box_info(msg='Job submitted!')
 
+    def validate_sample_sheet(self) -> bool:
+        """
+        Checks the sample sheet locally before anything is uploaded, see IO.scan_sample_sheet()
+
+        :return: False when the sample sheet cannot be read, or the user cancels because of the problems found
+        """
+        file = self.sample_sheet_local_path
+        if not is_sample_sheet_readable(file):
+            self.view.message_box_error(msg=f'Cannot read the sample sheet "{basename(file)}", choose a .csv, .tsv or .xlsx file')
+            return False
+        summary = self.io.scan_sample_sheet(file=file)
+        types = ', '.join(f'{c} ({t})' for c, t in summary.column_types.items())
+        print(f'"{basename(file)}": {len(summary.sample_ids)} samples, metadata columns: {types or "none"}', flush=True)
+        problems = summary.problems()
+        if len(problems) == 0:
+            return True
+        return self.view.message_box_yes_no(
+            msg=f'Problems in the sample sheet "{basename(file)}":\n\n' + '\n'.join(problems) + '\n\nSubmit anyway?')
+
+    def update_form_to_pipeline(self) -> bool:
+        """
+        The first submission with a pipeline release reads its options from its `--help` on the server,
+        cached in SCHEMAS_DIR, so that the form has the options of that release, see View.set_schema()
+
+        :return: False when options were added to or removed from the form, for the user to check it before submitting
+        """
+        ssh_key_values = self.view.get_ssh_key_values()
+        pipeline = ssh_key_values['Qiime2 Pipeline']
+        schema = self.read_schema(ssh_key_values=ssh_key_values)
+        if len(schema) == 0:
+            print(f'Warning: no options found in the help of "{pipeline}", the form is kept as it is', flush=True)
+            return True
+
+        if schema == self.view.schema:
+            return True
+        before = self.view.get_qiime2_key_values()
+        self.view.set_schema(schema=schema)
+        after = self.view.get_qiime2_key_values()
+        added = [k for k in after if k not in before]
+        removed = [k for k in before if k not in after]
+        if len(added) == 0 and len(removed) == 0:
+            return True
+        self.view.message_box_info(
+            msg=f'The form now has the options of "{pipeline}", check them and submit again\n\n'
+                f'Added: {", ".join(added) or "none"}\n'
+                f'Removed: {", ".join(removed) or "none"}')
+        return False
+
+    def read_schema(self, ssh_key_values: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        The options of the 'Qiime2 Pipeline' release, from SCHEMAS_DIR or from its `--help` on the server,
+        empty if none were found in the help, which is then read again next time
+        """
+        pipeline = ssh_key_values['Qiime2 Pipeline']
+        file = schema_file(pipeline=pipeline)
+        schema = load_schema(file=file)
+        if schema is not None:
+            return schema
+
+        print(f'Reading the options of "{pipeline}" on the server', flush=True)
+        con = open_connection(ssh_key_values=ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            response = con.run(f'source {PROFILE_FILE} && python {pipeline} --help', hide=True, warn=True)
+        con.close()
+        schema = parse_help(stdout=response.stdout)
+        if len(schema) > 0:
+            os.makedirs(SCHEMAS_DIR, exist_ok=True)
+            save_schema(file=file, schema=schema)
+        return schema
+
     def build_qiime2_cmd(self):
         qiime2_pipeline = self.ssh_key_values['Qiime2 Pipeline']
         outdir = self.qiime2_key_values['outdir']
@@ -131,40 +588,66 @@ class ActionSubmit(Action):
         fname = basename(self.sample_sheet_local_path)
         args.append(f"--sample-sheet='{outdir}/{fname}'")  # uploaded by the user
 
-        args.append(f"2>&1 | tee '{outdir}/progress.txt'")  # `2>&1` stderr to stdout --> tee to progress.txt
-
         self.qiime2_cmd = '     '.join(args)
 
-        if '"' in self.qiime2_cmd:
-            print('Warning: double quotes in the Qiime2 pipeline command will be replaced by single quotes', flush=True)
-            # self.qiime2_cmd will be wrapped in double quotes in self.submit_cmd
-            # so double quotes needs to be avoided
-            self.qiime2_cmd = self.qiime2_cmd.replace('"', '\'')
-
-    def connect_and_submit_job(self):
+    def connect_and_submit_job(self) -> bool:
         """
         Shell characters like './' and '~/' will work in con.run(), but not in con.put()
         
         To be safe, use absolute path for the remote root dir
         The outdir is defined as relative path, but check if it traverses outside the remote root dir (security issues)
+
+        :return: False when the results of an identical finished run were reused instead of submitting
         """
-        s = self.ssh_key_values
-        con = Connection(
-            host=s['Host'],
-            user=s['User'],
-            port=int(s['Port']),
-            connect_kwargs={'password': self.ssh_password}
-        )
+        con = self.connect()
+        outdir = self.qiime2_key_values['outdir']  # relative path
+        self.assert_outdir_is_safe(outdir=outdir)
+
+        fingerprint, identical_outdir = self.prepare_runs(con=con, runs=[self.qiime2_key_values])[0]
+        if identical_outdir is not None and self.reuse_identical_run(con=con, identical_outdir=identical_outdir):
+            con.close()
+            return False
+
+        submit_cmd = self.upload_job(con=con, fingerprint=fingerprint)
+        with con.cd(self.remote_root()):
+            con.run(submit_cmd, hide=True)  # not echoed, command.txt is in the heredoc
 
+        con.close()
+        return True
+
+    def connect(self) -> Connection:
+        return open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+
+    def remote_root(self) -> str:
+        if get_backend(name=self.ssh_key_values['Job Backend']).IS_LOCAL:
+            return f'{expanduser("~")}/{REMOTE_ROOT_DIR}'
         user = self.ssh_key_values['User']
-        remote_root = f'/home/{user}/{REMOTE_ROOT_DIR}'  # absolute path
-        outdir = self.qiime2_key_values['outdir']  # relative path
+        return f'/home/{user}/{REMOTE_ROOT_DIR}'  # absolute path
 
+    def assert_outdir_is_safe(self, outdir: str):
+        remote_root = self.remote_root()
         assert is_subdir(parent=remote_root, child=f'{remote_root}/{outdir}'), \
             f'The outdir "{outdir}" traverses outside the remote root directory, not safe!'
 
-        with con.cd(remote_root):
-            con.run(f'mkdir -p "{outdir}"', echo=True)
+    def upload_job(
+            self,
+            con: Connection,
+            fingerprint: str,
+            upstream_outdirs: Optional[List[str]] = None,
+            upstream_cmd: str = '',
+            parent_outdir: Optional[str] = None,
+            upstream_job_names: Optional[List[str]] = None,
+            after: Optional[List[str]] = None) -> str:
+        """
+        Uploads the sample sheet into the existing outdir, see build_job_script() for the `upstream_outdirs` and `upstream_cmd`,
+        the job checks that the jobs of the `upstream_job_names` are still running while it waits for them,
+        and the backend starts it `after` those scheduler IDs succeeded, see Backend.build_submit_cmd()
+
+        :return: the command which writes the job script of self.qiime2_cmd into the outdir as command.txt,
+            and its parameters as PARAMETERS_JSON, and starts it, to be run from the remote root dir
+        """
+        remote_root = self.remote_root()
+        outdir = self.qiime2_key_values['outdir']
 
         print(f'Uploading "{basename(self.sample_sheet_local_path)}" to remote directory "{remote_root}/{outdir}/"', flush=True)
         con.put(
@@ -172,18 +655,748 @@ class ActionSubmit(Action):
             remote=f'{remote_root}/{outdir}/'  # absolute path
         )
 
-        # the environment (.profile) needs to be activated right before the qiime2_cmd
-        script = f'source {PROFILE_FILE} && {self.qiime2_cmd}'
         cmd_txt = f'{outdir}/command.txt'
-        job_name = basename(outdir).replace(' ', '_')
+        parameters_json = build_parameters_json(
+            pipeline=self.ssh_key_values['Qiime2 Pipeline'],
+            parameters={
+                **self.qiime2_key_values,
+                'sample-sheet': f'{outdir}/{basename(self.sample_sheet_local_path)}',
+            })
+        job_name = build_job_name(outdir=outdir, parent_outdir=parent_outdir)
+        backend = get_backend(name=self.ssh_key_values['Job Backend'])
+        script = build_job_script(
+            qiime2_cmd=self.qiime2_cmd,
+            job_name=job_name,
+            outdir=outdir,
+            scratch_dir=self.ssh_key_values['Scratch Dir'],
+            fingerprint=fingerprint,
+            wrapper_options={
+                'threads': self.qiime2_key_values.get('threads', '1'),
+                'reference-cache-dir': self.ssh_key_values['Reference Cache Dir'],
+                'reference-cache-gb': self.ssh_key_values['Reference Cache GB'],
+                'pin-cpus': self.ssh_key_values['Pin CPUs'],
+                'nice': self.ssh_key_values['Nice'],
+                'io-priority': self.ssh_key_values['IO Priority'],
+                'cgroup-memory-gb': self.ssh_key_values['Cgroup Memory GB'],
+            },
+            upstream_outdirs=upstream_outdirs,
+            upstream_cmd=upstream_cmd,
+            upstream_running_cmds=None if upstream_job_names is None else [
+                backend.build_is_running_cmd(job_name=n) for n in upstream_job_names])
+
+        print(f'Writing "{cmd_txt}" and submitting the job "{job_name}"', flush=True)
+        submit_cmd = backend.build_submit_cmd(
+            job_name=job_name,
+            cmd_txt=cmd_txt,
+            outdir=outdir,
+            threads=self.qiime2_key_values.get('threads', '1'),
+            after=after)
+        return f"""cat > '{outdir}/{PARAMETERS_JSON}' <<'{PARAMETERS_JSON_DELIMITER}' \
+&& cat > '{cmd_txt}' <<'{COMMAND_TXT_DELIMITER}' && {submit_cmd}
+{parameters_json}{PARAMETERS_JSON_DELIMITER}
+{script}{COMMAND_TXT_DELIMITER}"""  # quoted heredocs, no shell quoting of the script needed
+
+    def prepare_runs(
+            self,
+            con: Connection,
+            runs: List[Dict[str, Any]],
+            sample_sheets: Optional[List[str]] = None) -> List[Tuple[str, Optional[str]]]:
+        """
+        In one round trip, creates the outdirs of the runs without the exit codes of previous runs
+        (for the runs waiting on them), checks the free space of the scratch dir and fingerprints the runs
 
-        with con.cd(remote_root):
-            con.run(f'echo "{script}" > "{cmd_txt}"', echo=True)
-            con.run(f'screen -dm -S {job_name} bash "{cmd_txt}"', echo=True)
+        The FASTQ files are hashed on the server, where the checksums are cached,
+        all runs share the same FASTQ files, and the sample sheet unless one is given for each run
 
+        :return: for each run, its fingerprint and the outdir of an identical finished run (None if there is none)
+        """
+        q = self.qiime2_key_values
+        if sample_sheets is None:
+            sample_sheets = [self.sample_sheet_local_path] * len(runs)
+        payloads = []
+        for run, sample_sheet in zip(runs, sample_sheets):
+            with open(sample_sheet, 'rb') as fh:
+                sample_sheet_sha256 = hashlib.sha256(fh.read()).hexdigest()
+            payloads.append({
+                'parameters': {k: v for k, v in run.items() if k not in FINGERPRINT_EXCLUDED_KEYS},
+                'sample_sheet_sha256': sample_sheet_sha256,
+                'pipeline': self.ssh_key_values['Qiime2 Pipeline'],  # the version is part of the name, e.g. qiime2_pipeline-2.10.2
+            })
+        suffixes = [q[k] for k in ['fq1-suffix', 'fq2-suffix'] if k in q]
+        args = {
+            'payloads': json.dumps(payloads),
+            'fq-dir': q['fq-dir'],
+            'suffixes': json.dumps(suffixes),
+            'sample-ids-fd': str(SAMPLE_IDS_FD),
+            'registry-dir': FINGERPRINTS_DIR,
+            'cache': FASTQ_HASHES_JSON,
+        }
+        sample_ids = json.dumps(self.io.read_sample_ids(file=self.sample_sheet_local_path))
+
+        scratch_dir = self.ssh_key_values['Scratch Dir']
+        outdirs = ' '.join(f'"{run["outdir"]}"' for run in runs)
+        exit_code_txts = ' '.join(f'"{run["outdir"]}/{EXIT_CODE_TXT}"' for run in runs)
+        cmd = f'mkdir -p {outdirs} && rm -f {exit_code_txts} ' \
+              f'&& mkdir -p "{scratch_dir}" && df -Pk "{scratch_dir}" && echo "{FINGERPRINTS_SEPARATOR}" ' \
+              f'&& {build_remote_script_cmd(script=FINGERPRINT_PY, args=args, stdin_fd=SAMPLE_IDS_FD)}'
+        print(f'Creating {outdirs}, checking the scratch dir "{scratch_dir}" '
+              f'and fingerprinting {len(runs)} run(s) with the FASTQ files in "{q["fq-dir"]}"', flush=True)
+        with con.cd(self.remote_root()):
+            response = con.run(cmd, hide=True, in_stream=StringIO(sample_ids))  # too long for an argument with thousands of samples
+
+        df, fingerprints = response.stdout.split(FINGERPRINTS_SEPARATOR)
+        self.check_scratch_space(df_stdout=df)
+        return [(r['fingerprint'], r['outdir']) for r in json.loads(fingerprints)]
+
+    def reuse_identical_run(self, con: Connection, identical_outdir: str) -> bool:
+        """
+        :return: True if the results were linked or copied, False to run the job anyway
+        """
+        outdir = self.qiime2_key_values['outdir']
+        choice = self.view.message_box_choice(
+            msg=f'A finished run with identical inputs and parameters exists:\n\n{identical_outdir}\n\n'
+                f'Link or copy its results to "{outdir}" instead of running the job again?',
+            choices=['Link', 'Copy', 'Run Anyway'])
+
+        if choice == 'Link':
+            cmd = f'rmdir "{outdir}" 2> /dev/null; mkdir -p "$(dirname "{outdir}")" && ln -sT "$PWD/{identical_outdir}" "{outdir}"'
+        elif choice == 'Copy':
+            cmd = f'mkdir -p "{outdir}" && cp -a "{identical_outdir}/." "{outdir}/"'
+        else:
+            return False
+
+        with con.cd(REMOTE_ROOT_DIR):
+            con.run(cmd, echo=True)
+        self.view.message_box_info(msg=f'Results of "{identical_outdir}" reused in "{outdir}"')
+        return True
+
+    def check_scratch_space(self, df_stdout: str):
+        scratch_dir = self.ssh_key_values['Scratch Dir']
+        min_free_gb = float(self.ssh_key_values['Scratch Min Free GB'])
+        free_gb = parse_df_available_kb(stdout=df_stdout) / 2 ** 20
+        assert free_gb >= min_free_gb, \
+            f'Only {free_gb:.1f} GB free in the scratch dir "{scratch_dir}", at least {min_free_gb:g} GB is required'
+
+
+
+class Run:
+    """
+    One of the jobs of a sweep, a sharded job or an append, see ActionSubmit.submit_runs()
+    """
+
+    parameters: Dict[str, Any]
+    sample_sheet: str
+    parent_outdir: Optional[str]
+    upstream_outdirs: Optional[List[str]]
+    upstream_cmd: str
+
+    def __init__(
+            self,
+            parameters: Dict[str, Any],
+            sample_sheet: str,
+            parent_outdir: Optional[str],
+            upstream_outdirs: Optional[List[str]] = None,
+            upstream_cmd: str = ''):
+        self.parameters = parameters
+        self.sample_sheet = sample_sheet
+        self.parent_outdir = parent_outdir
+        self.upstream_outdirs = upstream_outdirs
+        self.upstream_cmd = upstream_cmd
+
+
+class ActionSubmitRuns(ActionSubmit):
+
+    stop_stage: str
+    start_stage: str
+
+    def set_stages(self) -> bool:
+        """
+        Sets the choices of the stage options which run the samples separately up to the PER_SAMPLE_STAGE,
+        and then over all samples from the MERGED_START_STAGE
+
+        :return: False if the pipeline release does not have them, then the separate runs would run the whole pipeline
+        """
+        schema = self.read_schema(ssh_key_values=self.ssh_key_values)
+        stop_stage = stage_choice(schema=schema, option=STOP_STAGE_OPTION, stage=PER_SAMPLE_STAGE)
+        start_stage = stage_choice(schema=schema, option=START_STAGE_OPTION, stage=MERGED_START_STAGE)
+        if stop_stage is None or start_stage is None:
+            self.view.message_box_error(
+                msg=f'"{self.ssh_key_values["Qiime2 Pipeline"]}" cannot stop after {PER_SAMPLE_STAGE.lower()} '
+                    f'(--{STOP_STAGE_OPTION}) and start at {MERGED_START_STAGE.lower()} (--{START_STAGE_OPTION}), '
+                    f'so the samples cannot be run separately and then merged.')
+            return False
+        self.stop_stage, self.start_stage = stop_stage, start_stage
+        return True
+
+    def submit_runs(self, con: Connection, runs: List[Run]):
+        """
+        Submits all jobs with one round trip each after preparing them together, the upstream runs first
+
+        The jobs with upstream runs wait for them on the server, with a scheduler (Backend.DEPENDENCIES)
+        they are only started after the upstream jobs succeeded, instead of waiting in an allocation
+        """
+        for run in runs:
+            self.assert_outdir_is_safe(outdir=run.parameters['outdir'])
+
+        fingerprints = self.prepare_runs(
+            con=con,
+            runs=[run.parameters for run in runs],
+            sample_sheets=[run.sample_sheet for run in runs])
+
+        backend = get_backend(name=self.ssh_key_values['Job Backend'])
+        job_names, submit_ids = {}, {}  # by outdir
+        for run, (fingerprint, _) in zip(runs, fingerprints):
+            upstreams = run.upstream_outdirs or []
+            for u in upstreams:
+                assert u in job_names, f'The upstream run "{u}" has to be submitted before "{run.parameters["outdir"]}"'
+            after = [submit_ids[u] for u in upstreams] if backend.DEPENDENCIES else None
+
+            self.qiime2_key_values = run.parameters
+            self.sample_sheet_local_path = run.sample_sheet
+            self.build_qiime2_cmd()
+            submit_cmd = self.upload_job(
+                con=con,
+                fingerprint=fingerprint,
+                upstream_outdirs=run.upstream_outdirs,
+                upstream_cmd=run.upstream_cmd,
+                parent_outdir=run.parent_outdir,
+                upstream_job_names=[job_names[u] for u in upstreams],
+                after=after)
+            with con.cd(self.remote_root()):
+                response = con.run(submit_cmd, hide=True)  # not echoed, command.txt is in the heredoc
+
+            outdir = run.parameters['outdir']
+            job_names[outdir] = build_job_name(outdir=outdir, parent_outdir=run.parent_outdir)
+            submit_ids[outdir] = backend.parse_submit_id(stdout=response.stdout)
+
+
+class ActionSubmitSweep(ActionSubmitRuns):
+    """
+    Expands a grid of downstream parameter values into one run per combination
+
+    If the pipeline release can start at a stage (START_STAGE_OPTION), the first combination is the upstream run,
+    the others wait for it, start from a copy of its outdir and only run the SWEEP_START_STAGE and the later stages,
+    otherwise every combination runs the whole pipeline, all of them in parallel
+    """
+
+    sweep: Dict[str, List[str]]
+    runs: List[Dict[str, Any]]
+    start_stage: Optional[str]  # the value of the START_STAGE_OPTION, None if the release does not have it
+
+    def workflow(self):
+        self.sample_sheet_local_path = self.view.file_dialog_open(title='Upload Sample Sheet')
+        if self.sample_sheet_local_path == '' or not self.validate_sample_sheet():
+            return
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        if not self.update_form_to_pipeline():
+            return
+
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        self.qiime2_key_values = self.view.get_qiime2_key_values()
+
+        q = self.qiime2_key_values
+        self.sweep = self.view.sweep_dialog(parameters={k: q[k] for k in DOWNSTREAM_KEYS if type(q.get(k)) is str})
+        if len(self.sweep) == 0:
+            return
+        self.runs = expand_grid(parameters=q, sweep=self.sweep)
+        self.start_stage = stage_choice(
+            schema=self.read_schema(ssh_key_values=self.ssh_key_values),
+            option=START_STAGE_OPTION,
+            stage=SWEEP_START_STAGE)
+
+        if self.start_stage is None:
+            how = f'"{self.ssh_key_values["Qiime2 Pipeline"]}" has no --{START_STAGE_OPTION}, ' \
+                  f'so each run runs the whole pipeline, all in parallel'
+        else:
+            how = f'The first run runs the whole pipeline, the others then start at the {SWEEP_START_STAGE.lower()} stage ' \
+                  f'from a copy of its outdir'
+        if not self.view.message_box_yes_no(msg=f'{how}.\n\nAre you sure you want to submit a sweep of {len(self.runs)} runs?'):
+            return
+
+        self.connect_and_submit_sweep()
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        self.view.message_box_info(msg=f'Sweep of {len(self.runs)} runs submitted!')
+
+    def connect_and_submit_sweep(self):
+        parent_outdir = self.qiime2_key_values['outdir']
+        if self.start_stage is None:  # nothing to start from
+            runs = [Run(parameters=p, sample_sheet=self.sample_sheet_local_path, parent_outdir=parent_outdir) for p in self.runs]
+            con = self.connect()
+            self.submit_runs(con=con, runs=runs)
+            con.close()
+            return
+
+        upstream_outdir = self.runs[0]['outdir']
+        runs = [Run(parameters=self.runs[0], sample_sheet=self.sample_sheet_local_path, parent_outdir=parent_outdir)]
+        for parameters in self.runs[1:]:
+            runs.append(Run(
+                parameters={**parameters, START_STAGE_OPTION: self.start_stage},
+                sample_sheet=self.sample_sheet_local_path,
+                parent_outdir=parent_outdir,
+                upstream_outdirs=[upstream_outdir],
+                upstream_cmd=build_copy_upstream_cmd(upstream_outdir=upstream_outdir, outdir=parameters['outdir'])))
+
+        con = self.connect()
+        self.submit_runs(con=con, runs=runs)
+        con.close()
+
+
+class ActionSubmitSharded(ActionSubmitRuns):
+    """
+    Splits the sample sheet into shards of 'Samples Per Shard' samples, each run as a separate job in <outdir>/shard-<i>
+    which stops after the PER_SAMPLE_STAGE
+
+    The run over all samples waits for the shards, merges their feature tables and representative sequences
+    into its outdir (see src/remote/merge_shards.py), and then starts at the MERGED_START_STAGE,
+    which needs a pipeline release with the STOP_STAGE_OPTION and the START_STAGE_OPTION
+    """
+
+    shard_sample_sheets: List[str]
+
+    def workflow(self):
+        self.sample_sheet_local_path = self.view.file_dialog_open(title='Upload Sample Sheet')
+        if self.sample_sheet_local_path == '' or not self.validate_sample_sheet():
+            return
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        if not self.update_form_to_pipeline():
+            return
+
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        self.qiime2_key_values = self.view.get_qiime2_key_values()
+        if not self.set_stages():
+            return
+
+        samples_per_shard = int(self.ssh_key_values['Samples Per Shard'])
+        self.shard_sample_sheets = self.io.split_sample_sheet(
+            file=self.sample_sheet_local_path,
+            samples_per_shard=samples_per_shard,
+            outdir=tempfile.mkdtemp(prefix='qiime2app-shards-'))
+        assert len(self.shard_sample_sheets) > 1, \
+            f'The sample sheet has no more than {samples_per_shard} samples, submit it without sharding'
+
+        n = len(self.shard_sample_sheets)
+        if not self.view.message_box_yes_no(msg=f'Are you sure you want to submit the job in {n} shards?'):
+            return
+
+        self.connect_and_submit_shards()
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        self.view.message_box_info(msg=f'Job submitted in {n} shards!')
+
+    def connect_and_submit_shards(self):
+        outdir = self.qiime2_key_values['outdir']
+        shards = shard_outdirs(outdir=outdir, n_shards=len(self.shard_sample_sheets))
+
+        runs = [
+            Run(
+                parameters={**self.qiime2_key_values, 'outdir': shard, STOP_STAGE_OPTION: self.stop_stage},
+                sample_sheet=sample_sheet,
+                parent_outdir=outdir)
+            for shard, sample_sheet in zip(shards, self.shard_sample_sheets)
+        ]
+        runs.append(Run(
+            parameters={**self.qiime2_key_values, START_STAGE_OPTION: self.start_stage},
+            sample_sheet=self.sample_sheet_local_path,
+            parent_outdir=None,
+            upstream_outdirs=shards,
+            upstream_cmd=build_merge_shards_cmd(shard_outdirs=shards, outdir=outdir)))
+
+        con = self.connect()
+        self.submit_runs(con=con, runs=runs)
         con.close()
 
 
+class ActionSubmitQuickLook(ActionSubmitRuns):
+    """
+    Runs the pipeline with the same parameters on a random subsample of 'Quick Look Reads' reads per sample
+    in <outdir>/quick-look-<reads>, for a first look at the results in minutes before committing to the full run
+
+    The job subsamples the FASTQ files itself on the server into <outdir>/quick-look-<reads>/fastq,
+    streaming each file once (see src/remote/subsample_fastq.py), and then runs the pipeline on them
+    """
+
+    reads: float
+
+    def workflow(self):
+        self.sample_sheet_local_path = self.view.file_dialog_open(title='Upload Sample Sheet')
+        if self.sample_sheet_local_path == '':
+            return
+        if not self.sample_sheet_local_path.endswith(('.csv', '.tsv', '.tab')):  # the server reads its sample IDs
+            self.view.message_box_error(msg='Save the sample sheet as .csv or .tsv for a quick look')
+            return
+        if not self.validate_sample_sheet():
+            return
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        if not self.update_form_to_pipeline():
+            return
+
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        self.qiime2_key_values = self.view.get_qiime2_key_values()
+        self.reads = parse_quick_look_reads(self.ssh_key_values['Quick Look Reads'])
+
+        outdir = quick_look_parameters(self.qiime2_key_values, reads=self.reads)['outdir']
+        reads = f'{self.reads:.0%} of the reads' if self.reads < 1 else f'{self.reads:.0f} reads per sample'
+        if not self.view.message_box_yes_no(msg=f'Are you sure you want to submit a quick look on {reads} in "{outdir}"?'):
+            return
+
+        self.connect_and_submit_quick_look()
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        self.view.message_box_info(msg='Quick look submitted!')
+
+    def connect_and_submit_quick_look(self):
+        q = self.qiime2_key_values
+        parameters = quick_look_parameters(q, reads=self.reads)
+        upstream_cmd = build_subsample_cmd(
+            fq_dir=q['fq-dir'],
+            suffixes=[q[k] for k in ['fq1-suffix', 'fq2-suffix'] if k in q],
+            sample_sheet=f'{parameters["outdir"]}/{basename(self.sample_sheet_local_path)}',  # uploaded with the job
+            outdir=parameters['fq-dir'],
+            reads=self.reads,
+            threads=q.get('threads', '1'))
+
+        con = self.connect()
+        self.submit_runs(con=con, runs=[Run(
+            parameters=parameters,
+            sample_sheet=self.sample_sheet_local_path,
+            parent_outdir=q['outdir'],
+            upstream_outdirs=[],  # nothing to wait for, the subsampling prepares the outdir
+            upstream_cmd=upstream_cmd)])
+        con.close()
+
+
+class ActionAppendSamples(ActionSubmitRuns):
+    """
+    Diffs the new sample sheet against the one of the finished run in the outdir,
+    runs the new samples as a separate job in <outdir>/append-<timestamp> with the parameters of the finished run
+    (from its PARAMETERS_JSON), which stops after the PER_SAMPLE_STAGE, and then reruns the outdir
+    from the MERGED_START_STAGE after merging the new samples' feature tables and representative sequences
+    into the existing ones (see src/remote/merge_shards.py), so that only the new samples are denoised
+    """
+
+    added_sample_ids: List[str]
+
+    def workflow(self):
+        self.sample_sheet_local_path = self.view.file_dialog_open(title='Upload New Sample Sheet')
+        if self.sample_sheet_local_path == '':
+            return
+        if not is_sample_sheet_splittable(self.sample_sheet_local_path):
+            self.view.message_box_error(
+                msg=f'Cannot take the new samples out of "{basename(self.sample_sheet_local_path)}", '
+                    f'choose a .csv or .tsv sample sheet')
+            return
+        if not self.validate_sample_sheet():
+            return
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        outdir = self.view.get_qiime2_key_values()['outdir']
+        self.assert_outdir_is_safe(outdir=outdir)
+
+        con = self.connect()
+        self.read_finished_run(con=con, outdir=outdir)
+        if len(self.added_sample_ids) == 0:
+            con.close()
+            self.view.message_box_info(msg=f'No new samples to append to "{outdir}"')
+            return
+        if not self.set_stages():
+            con.close()
+            return
+
+        n = len(self.added_sample_ids)
+        if not self.view.message_box_yes_no(msg=f'Are you sure you want to append {n} new samples to "{outdir}"?'):
+            con.close()
+            return
+
+        self.submit_append(con=con)
+        con.close()
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        self.view.message_box_info(msg=f'{n} new samples appended to "{outdir}"!')
+
+    def read_finished_run(self, con: Connection, outdir: str):
+        """
+        Sets the parameters and the pipeline of the finished run, and the IDs of the samples added since
+        """
+        with con.cd(self.remote_root()):
+            response = con.run(f'cat "{outdir}/{EXIT_CODE_TXT}" && cat "{outdir}/{PARAMETERS_JSON}"', hide=True, warn=True)
+        exit_code, _, text = response.stdout.partition('\n')
+        assert response.ok and exit_code == '0', \
+            f'The run in "{outdir}" has not finished successfully, or has no {PARAMETERS_JSON} (submitted by an older version)'
+
+        pipeline, parameters = parse_parameters_json(text=text)
+        self.ssh_key_values['Qiime2 Pipeline'] = pipeline  # the same version as the finished run
+        self.qiime2_key_values = {k: v for k, v in parameters.items() if k not in STAGE_OPTIONS}
+
+        sample_sheet = self.qiime2_key_values.pop('sample-sheet')
+        finished_sample_sheet = f'{tempfile.mkdtemp(prefix="qiime2app-append-")}/{basename(sample_sheet)}'
+        con.get(remote=f'{self.remote_root()}/{sample_sheet}', local=finished_sample_sheet)
+
+        finished = self.io.read_sample_ids(file=finished_sample_sheet)
+        new = self.io.read_sample_ids(file=self.sample_sheet_local_path)
+        removed = [s for s in finished if s not in new]
+        assert len(removed) == 0, f'Samples {removed} of "{outdir}" are not in the new sample sheet, nothing can be removed'
+        self.added_sample_ids = [s for s in new if s not in finished]
+
+    def submit_append(self, con: Connection):
+        outdir = self.qiime2_key_values['outdir']
+        append_outdir = f'{outdir}/{APPEND_DIR_PREFIX}{datetime.now().strftime("%Y%m%d-%H%M%S")}'
+        added_sample_sheet = self.io.subset_sample_sheet(
+            file=self.sample_sheet_local_path,
+            sample_ids=self.added_sample_ids,
+            outdir=tempfile.mkdtemp(prefix='qiime2app-append-'))
+
+        self.submit_runs(con=con, runs=[
+            Run(
+                parameters={**self.qiime2_key_values, 'outdir': append_outdir, STOP_STAGE_OPTION: self.stop_stage},
+                sample_sheet=added_sample_sheet,
+                parent_outdir=outdir),
+            Run(
+                parameters={**self.qiime2_key_values, START_STAGE_OPTION: self.start_stage},
+                sample_sheet=self.sample_sheet_local_path,
+                parent_outdir=None,
+                upstream_outdirs=[append_outdir],
+                upstream_cmd=build_merge_shards_cmd(shard_outdirs=[outdir, append_outdir], outdir=outdir)),
+        ])
+
+
+def parse_df_available_kb(stdout: str) -> int:
+    """
+    `df -Pk` prints one header line and one line per file system, the 4th column is the available space
+
+    Filesystem     1024-blocks      Used Available Capacity Mounted on
+    /dev/nvme0n1p1   960302804 388166128 523263716      43% /scratch
+    """
+    last_line = stdout.strip().splitlines()[-1]
+    return int(last_line.split()[3])
+
+
+def build_remote_script_cmd(script: str, args: Dict[str, str], stdin_fd: Optional[int] = None) -> str:
+    """
+    The python script in REMOTE_SCRIPTS_DIR is sent within the command as a quoted heredoc,
+    so it runs in one round trip without uploading it first, and without shell escaping of its source
+
+    The heredoc takes the place of the script's stdin, with `stdin_fd` the stdin of the command
+    is passed on to the script as that file descriptor, e.g. for data too long for an argument
+    """
+    with open(f'{REMOTE_SCRIPTS_DIR}/{script}') as fh:
+        source = fh.read()
+    options = ' '.join(f'--{key}={shlex.quote(val)}' for key, val in args.items())
+    redirect = '' if stdin_fd is None else f' {stdin_fd}<&0'  # before the heredoc replaces stdin
+    return f"""source {PROFILE_FILE} && python - {options}{redirect} <<'{HEREDOC_DELIMITER}'
+{source}
+{HEREDOC_DELIMITER}"""
+
+
+def build_job_script(
+        qiime2_cmd: str,
+        job_name: str,
+        outdir: str,
+        scratch_dir: str,
+        fingerprint: str,
+        wrapper_options: Dict[str, str],
+        upstream_outdirs: Optional[List[str]] = None,
+        upstream_cmd: str = '',
+        upstream_running_cmds: Optional[List[str]] = None) -> str:
+    """
+    The job is run from the remote root dir
+
+    Qiime2 writes its temporary artifacts to TMPDIR, so each job gets its own scratch dir under `scratch_dir`,
+    which is removed when the job exits, including when it is killed (SIGHUP from `screen -X quit`, SIGTERM from `scancel` or `qdel`)
+
+    The pipeline's output goes to progress.txt, and with the time of each line to PROGRESS_TIMES_TSV for the stage timeline
+
+    The job wrapper is written into the outdir by the job script itself, from a quoted heredoc,
+    so that it is not uploaded separately and a rerun of command.txt has it
+
+    The job wrapper passes the pipeline's exit code through and writes its resource usage to JOB_STATS_JSON,
+    and samples it over time into SAMPLES_DIR, `pipefail` keeps that exit code instead of the one of `tee`,
+    see src/remote/job_wrapper.py for the `wrapper_options`
+
+    The job wrapper records where the job runs in PLACEMENTS_DIR while it runs, for the dashboard
+
+    When the pipeline ends, an event file with the exit code and the resource usage is moved into EVENTS_DIR
+    in one atomic step, named by the nanosecond timestamp so that the file names sort by completion time,
+    also by the EXIT trap when the job is killed, for the killed runs to show in the dashboard to be resumed,
+    and the events older than EVENTS_KEEP_DAYS are deleted
+
+    A successful run is registered by its fingerprint in FINGERPRINTS_DIR, for identical submissions to reuse
+
+    With `upstream_outdirs`, the job waits for those runs to exit and prepares its outdir from theirs
+    with the `upstream_cmd`, see build_copy_upstream_cmd() and build_merge_shards_cmd(),
+    and exits with 1 without running the pipeline if an upstream run or the `upstream_cmd` failed
+
+    The `upstream_running_cmds`, one per upstream outdir, succeed while its job is queued or running
+    (see Backend.build_is_running_cmd()), an upstream run which is gone from the backend for UPSTREAM_GRACE_SECONDS
+    without an exit code died without its EXIT trap (SIGKILL, reboot, cancelled while pending), and counts as failed,
+    as does one still running after UPSTREAM_WAIT_DAYS
+    """
+    options = '     '.join(f"--{key}='{val}'" for key, val in wrapper_options.items())
+    with open(f'{REMOTE_SCRIPTS_DIR}/{JOB_WRAPPER}') as fh:
+        wrapper_source = fh.read()
+
+    wait_for_upstream, run_if_upstream_succeeded = '', ''
+    if upstream_outdirs is not None:
+        upstreams = ' '.join(f"'{u}'" for u in upstream_outdirs)
+        upstream_cmd = upstream_cmd if upstream_cmd != '' else 'true'  # nothing to prepare
+        if upstream_running_cmds is None:
+            upstream_running_cmds = ['true'] * len(upstream_outdirs)  # only the deadline
+        waits = '\n'.join(
+            f'[ -n "$UPSTREAM_FAILED" ] || UPSTREAM_FAILED="$(wait_for_upstream \'{u}\' {shlex.quote(c)})"'
+            for u, c in zip(upstream_outdirs, upstream_running_cmds))
+        wait_for_upstream = f'''
+echo "Waiting for the upstream runs {upstreams}"
+UPSTREAM_DEADLINE=$(( $(date +%s) + {UPSTREAM_WAIT_DAYS} * 86400 ))
+wait_for_upstream() {{  # <outdir> <command which succeeds while its job is queued or running>, prints why it failed
+    LAST_SEEN=$(date +%s)
+    while [ ! -f "$1/{EXIT_CODE_TXT}" ]; do
+        NOW=$(date +%s)
+        eval "$2" > /dev/null 2>&1 && LAST_SEEN=$NOW
+        if [ $(( NOW - LAST_SEEN )) -gt {UPSTREAM_GRACE_SECONDS} ]; then
+            [ -f "$1/{EXIT_CODE_TXT}" ] && break
+            echo "The upstream run \\"$1\\" is no longer running and did not exit"
+            return
+        fi
+        if [ "$NOW" -gt "$UPSTREAM_DEADLINE" ]; then
+            echo "The upstream run \\"$1\\" did not exit within {UPSTREAM_WAIT_DAYS} days"
+            return
+        fi
+        sleep {UPSTREAM_WAIT_SECONDS}
+    done
+    [ "$(cat "$1/{EXIT_CODE_TXT}")" = 0 ] || echo "The upstream run \\"$1\\" failed"
+}}
+UPSTREAM_FAILED=''
+{waits}
+if [ -z "$UPSTREAM_FAILED" ]; then
+    {{
+{upstream_cmd}
+    }} > '{outdir}/progress.txt' 2>&1
+    UPSTREAM_EXIT_CODE=$?
+else
+    echo "$UPSTREAM_FAILED" > '{outdir}/progress.txt'
+    UPSTREAM_EXIT_CODE=1
+fi
+'''
+        run_if_upstream_succeeded = '[ "$UPSTREAM_EXIT_CODE" = 0 ] && '  # otherwise the exit code is 1
+
+    return f'''\
+set -o pipefail
+
+SCRATCH="$(mktemp -d '{scratch_dir}/{SCRATCH_PREFIX}{job_name}-XXXXXX')" || exit 1
+export TMPDIR="$SCRATCH"
+mkdir -p "{SCRATCH_DIRS}" && echo "$SCRATCH" > "{SCRATCH_DIRS}/{job_name}"
+write_event() {{
+    EVENT="$(date +%s%N).{job_name}"
+    STATS="$(tr -d '\\n\\t' < '{outdir}/{JOB_STATS_JSON}' 2> /dev/null)"
+    mkdir -p "{EVENTS_DIR}"
+    find "{EVENTS_DIR}" -maxdepth 1 -type f -name '[0-9]*' -mtime +{EVENTS_KEEP_DAYS} -delete 2> /dev/null
+    printf '%s\\t%s\\t%s\\t%s\\t%s\\n' "{job_name}" "$1" "$(date '+%m/%d/%Y %I:%M:%S %p')" "{outdir}" "$STATS" > "{EVENTS_DIR}/.$EVENT"
+    mv "{EVENTS_DIR}/.$EVENT" "{EVENTS_DIR}/$EVENT"
+    EVENT_WRITTEN=1
+}}
+trap 'EXIT_CODE=$?; echo $EXIT_CODE > "{outdir}/{EXIT_CODE_TXT}"; [ -n "$EVENT_WRITTEN" ] || write_event $EXIT_CODE; rm -rf "$SCRATCH" "{SCRATCH_DIRS}/{job_name}" "{PLACEMENTS_DIR}/{job_name}"' EXIT
+trap 'exit 129' HUP
+trap 'exit 143' TERM
+
+rm -f '{outdir}/{EXIT_CODE_TXT}' '{outdir}/{JOB_STATS_JSON}'  # of a previous run, e.g. the one resumed
+echo '{fingerprint}' > '{outdir}/{FINGERPRINT_TXT}'
+rm -f "{SAMPLES_DIR}/{job_name}.bin"
+cat > "{outdir}/{JOB_WRAPPER}" <<'{JOB_WRAPPER_DELIMITER}'
+{wrapper_source}{JOB_WRAPPER_DELIMITER}
+{wait_for_upstream}
+
+# the environment (.profile) needs to be activated right before the qiime2_cmd
+# `2>&1` stderr to stdout --> tee to progress.txt --> timestamp each line into PROGRESS_TIMES_TSV
+{run_if_upstream_succeeded}source {PROFILE_FILE} && python '{outdir}/{JOB_WRAPPER}' --stats='{outdir}/{JOB_STATS_JSON}'     --samples='{SAMPLES_DIR}/{job_name}.bin'     --placement='{PLACEMENTS_DIR}/{job_name}'     {options}     -- {qiime2_cmd} 2>&1 | tee '{outdir}/progress.txt' | while IFS= read -r LINE || [ -n "$LINE" ]; do printf '%(%s)T\t%s\n' -1 "$LINE"; done > '{outdir}/{PROGRESS_TIMES_TSV}'
+EXIT_CODE=$?
+write_event $EXIT_CODE
+
+if [ $EXIT_CODE -eq 0 ]; then
+    mkdir -p "{FINGERPRINTS_DIR}" && echo '{outdir}' > "{FINGERPRINTS_DIR}/{fingerprint}"
+fi
+exit $EXIT_CODE
+'''
+
+
+def build_copy_upstream_cmd(upstream_outdir: str, outdir: str) -> str:
+    """
+    Copy-on-write where the file system supports it, `-n` keeps the files of this run
+    """
+    return f"cp -a --reflink=auto -n '{upstream_outdir}/.' '{outdir}/' " \
+           f"&& rm -f '{outdir}/{JOB_STATS_JSON}' '{outdir}/{EXIT_CODE_TXT}'"
+
+
+def build_merge_shards_cmd(shard_outdirs: List[str], outdir: str) -> str:
+    return build_remote_script_cmd(
+        script=MERGE_SHARDS_PY,
+        args={'shards': json.dumps(shard_outdirs), 'outdir': outdir})
+
+
+def build_subsample_cmd(
+        fq_dir: str,
+        suffixes: List[str],
+        sample_sheet: str,
+        outdir: str,
+        reads: float,
+        threads: str) -> str:
+    return build_remote_script_cmd(
+        script=SUBSAMPLE_FASTQ_PY,
+        args={
+            'fq-dir': fq_dir,
+            'suffixes': json.dumps(suffixes),
+            'sample-sheet': sample_sheet,
+            'outdir': outdir,
+            'reads': format_quick_look_reads(reads),
+            'seed': str(QUICK_LOOK_SEED),
+            'threads': threads,
+        })
+
+
+def build_parameters_json(pipeline: str, parameters: Dict[str, Any]) -> str:
+    """
+    :param pipeline: e.g. 'qiime2_pipeline-2.10.2'
+    :param parameters: of the run, including 'sample-sheet'
+    """
+    return json.dumps({'pipeline': pipeline, 'parameters': parameters}, indent=2) + '\n'
+
+
+def parse_parameters_json(text: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Reverses build_parameters_json()
+
+    :return: the pipeline and the parameters including 'sample-sheet'
+    """
+    data = json.loads(text)
+    return data['pipeline'], data['parameters']
+
+
+def build_job_name(outdir: str, parent_outdir: Optional[str] = None) -> str:
+    """
+    The runs of a sweep or of a sharded job are named after the parent outdir too,
+    so that they stay unique across submissions, e.g. 'output/shard-1' -> 'output_shard-1'
+    """
+    name = basename(outdir) if parent_outdir is None else f'{basename(parent_outdir)}_{basename(outdir)}'
+    return name.replace(' ', '_')
+
+
+def schema_file(pipeline: str) -> str:
+    return f'{SCHEMAS_DIR}/{re.sub(r"[^A-Za-z0-9._-]", "_", pipeline)}.json'  # the version is part of the name
+
+
+def apply_cached_schema(view: View):
+    """
+    Shows the options of the selected pipeline release if they were read before, otherwise the hardcoded ones
+    """
+    schema = load_schema(file=schema_file(pipeline=view.get_ssh_key_values()['Qiime2 Pipeline']))
+    if schema != view.schema:
+        view.set_schema(schema=schema)
+
+
 def is_subdir(parent: str, child: str) -> bool:
     p = abspath(parent)
     c = abspath(child)
@@ -191,48 +1404,58 @@ def is_subdir(parent: str, child: str) -> bool:
 
 
 class ActionUpdateDashboard(Action):
+    """
+    Lists the running jobs of all the 'Dashboard Hosts' at once, see fan_out(),
+    the jobs of a host which does not answer in time are kept as they were
+    """
 
     ssh_password: str
     ssh_key_values: Dict[str, str]
 
     def workflow(self):
-        self.ssh_password = self.view.password_dialog()
+        self.ssh_password = self.password_dialog()
         if self.ssh_password == '':
             return
 
         self.ssh_key_values = self.view.get_ssh_key_values()
 
-        stdout = self.request()
-        jobs = parse_screen_ls(stdout=stdout)
-        self.view.display_jobs(jobs=jobs)
-        
-        self.view.show_dashboard()  # bring the dashboard to the front in the end
+        backend = get_backend(name=self.ssh_key_values['Job Backend'])
+        # the environment (.profile) needs to be activated right before sending the request
+        host_to_stdout = fan_out(
+            ssh_key_values=self.ssh_key_values,
+            ssh_password=self.ssh_password,
+            hosts=dashboard_hosts(ssh_key_values=self.ssh_key_values),
+            command=f'source {PROFILE_FILE} && {build_status_with_placements_cmd(backend)}')
+
+        host_to_jobs, failed = {}, []
+        for host, stdout in host_to_stdout.items():
+            if isinstance(stdout, Exception):
+                print(f'Warning: no job status from "{host}": {stdout!r}', flush=True)
+                host_to_jobs[host] = self.view.dashboard.host_to_jobs.get(host, [])
+                failed.append(host)
+            else:
+                host_to_jobs[host] = parse_status_with_placements(backend=backend, stdout=stdout)
+        self.view.display_jobs(host_to_jobs=host_to_jobs, replace=True)
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
 
-    def request(self) -> str:
-        s = self.ssh_key_values
-        con = Connection(
-            host=s['Host'],
-            user=s['User'],
-            port=int(s['Port']),
-            connect_kwargs={'password': self.ssh_password}
-        )
-        with con.cd(REMOTE_ROOT_DIR):
-            # the environment (.profile) needs to be activated right before sending the request
-            # echo=True for printing out the command
-            # warn=True for ignoring bad exit code (1) when there is no screen
-            response = con.run(f'source {PROFILE_FILE} && screen -ls', echo=True, warn=True)
-        con.close()
-        return response.stdout
+        self.view.show_dashboard()  # bring the dashboard to the front in the end
+        if len(failed) > 0:
+            self.view.message_box_info(msg='No job status from:\n\n' + '\n'.join(failed))
 
 
 class ActionKillJobs(Action):
+    """
+    Kills the selected jobs on the host of each, one host after the other
+    """
 
     job_ids: List[str]
     ssh_password: str
     connection: Connection
+    backend: Backend
 
     def workflow(self):
-        self.job_ids = self.view.dashboard.get_selected_job_ids()
+        jobs = self.view.dashboard.get_selected_jobs()
+        self.job_ids = [job_id for _, job_id in jobs]
 
         if len(self.job_ids) == 0:
             self.view.message_box_info(msg='No job selected')
@@ -242,16 +1465,21 @@ class ActionKillJobs(Action):
         if not yes:
             return
 
-        self.ssh_password = self.view.password_dialog()
+        self.ssh_password = self.password_dialog()
         if self.ssh_password == '':
             return
 
-        self.set_up_connection()
-        stdout = self.submit_commands()
-        jobs = parse_screen_ls(stdout=stdout)
-        self.view.display_jobs(jobs=jobs)
-        self.connection.close()
-        
+        host_to_job_ids = {}
+        for host, job_id in jobs:
+            host_to_job_ids.setdefault(host, []).append(job_id)
+        for host, job_ids in host_to_job_ids.items():
+            self.job_ids = job_ids
+            self.set_up_connection(host=host)
+            stdout = self.submit_commands()
+            jobs = parse_status_with_placements(backend=self.backend, stdout=stdout)
+            self.view.display_jobs(host_to_jobs={host: jobs})
+            self.connection.close()
+
         self.view.show_dashboard()  # bring the dashboard to the front in the end
 
     def ask_message(self) -> bool:
@@ -261,26 +1489,24 @@ class ActionKillJobs(Action):
         yes_or_no = self.view.message_box_yes_no(msg=msg)
         return yes_or_no
 
-    def set_up_connection(self):
+    def set_up_connection(self, host: str):
         s = self.view.get_ssh_key_values()
-        self.connection = Connection(
-            host=s['Host'],
-            user=s['User'],
-            port=int(s['Port']),
-            connect_kwargs={'password': self.ssh_password}
-        )
+        self.backend = get_backend(name=s['Job Backend'])
+        self.connection = open_connection(ssh_key_values={**s, 'Host': host}, ssh_password=self.ssh_password)
 
     def submit_commands(self):
         kill_cmds = []
         for job_id in self.job_ids:
-            kill_cmds.append(f'screen -S {job_id} -X quit')
+            kill_cmds.append(self.backend.build_kill_cmd(job_id=job_id))
+        for job_id in self.job_ids:
+            kill_cmds.append(build_remove_scratch_cmd(job_name=self.backend.job_name_of(job_id=job_id)))
 
         joined = ' && '.join(kill_cmds)
         command = f'source {PROFILE_FILE} && {joined}'
         with self.connection.cd(REMOTE_ROOT_DIR):
             self.connection.run(command=command, echo=True)
 
-        command = f'source {PROFILE_FILE} && screen -ls'
+        command = f'source {PROFILE_FILE} && {build_status_with_placements_cmd(self.backend)}'
         with self.connection.cd(REMOTE_ROOT_DIR):
             # warn=True for ignoring bad exit code (1) when there is no screen
             response = self.connection.run(command=command, echo=True, warn=True)
@@ -288,59 +1514,782 @@ class ActionKillJobs(Action):
         return response.stdout
 
 
-def parse_screen_ls(stdout: str) -> List[Tuple[str, str, str]]:
+class ActionResumeRuns(ActionSubmitRuns):
+    """
+    Resubmits the failed or killed runs selected in the dashboard in their own outdir, with the parameters
+    of their PARAMETERS_JSON and their sample sheet, with the START_STAGE_OPTION at the first stage
+    without all of its artifacts intact, or over the whole pipeline again if the release cannot start there
+
+    The artifacts left truncated or corrupt by the crash are deleted first, see src/remote/check_artifacts.py,
+    and the runs still queued or running, e.g. resumed before, are not resubmitted
+    """
+
+    def workflow(self):
+        latest = {}  # the latest event of each outdir
+        for event in sorted(self.view.dashboard.get_selected_finished_events()):
+            latest[event[4]] = event
+        events = [e for e in latest.values() if e[2] != '0']
+        if len(events) == 0:
+            self.view.message_box_info(msg='No failed or killed run selected')
+            return
+
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        con = self.connect()
+
+        backend = get_backend(name=self.ssh_key_values['Job Backend'])
+        runs, lines = [], []
+        for _, job_name, exit_code, _, outdir, _ in events:
+            with con.cd(self.remote_root()):
+                running = con.run(backend.build_is_running_cmd(job_name=job_name), hide=True, warn=True).ok
+            if running:
+                lines.append(f'{job_name}: still queued or running, not resubmitted')
+                continue
+            artifacts = self.check_artifacts(con=con, outdir=outdir, remove_broken=False)
+            resumed, start_stage = self.build_resumed_run(
+                con=con, job_name=job_name, outdir=outdir, stage=resume_stage(types=list(artifacts['intact'].values())))
+            runs.append(resumed)
+            lines.append(
+                f'{job_name} (exit code {exit_code}): {start_stage}, '
+                f'{len(artifacts["intact"])} intact and {len(artifacts["broken"])} broken artifacts')
+
+        x = 'run' if len(runs) == 1 else 'runs'
+        if len(runs) == 0:
+            con.close()
+            self.view.message_box_info(msg='\n'.join(lines))
+            return
+        msg = f'Resume {len(runs)} {x}? The broken artifacts are deleted.\n\n' + '\n'.join(lines)
+        if not self.view.message_box_yes_no(msg=msg):
+            con.close()
+            return
+
+        for pipeline, run in runs:
+            self.check_artifacts(con=con, outdir=run.parameters['outdir'], remove_broken=True)
+            self.ssh_key_values['Qiime2 Pipeline'] = pipeline  # the same version as the failed run
+            self.submit_runs(con=con, runs=[run])
+        con.close()
+
+        self.watcher.watch(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        self.view.message_box_info(msg=f'{len(runs)} {x} resumed')
+
+    def build_resumed_run(
+            self, con: Connection, job_name: str, outdir: str, stage: str) -> Tuple[Tuple[str, Run], str]:
+        """
+        :return: the pipeline and the run resumed at the `stage`, and where it starts, for the user
+        """
+        with con.cd(self.remote_root()):
+            text = con.run(f'cat "{outdir}/{PARAMETERS_JSON}"', hide=True, warn=True).stdout
+        assert text != '', f'"{outdir}" has no {PARAMETERS_JSON} (submitted by an older version), submit it again'
+        pipeline, parameters = parse_parameters_json(text=text)
+
+        sample_sheet = parameters.pop('sample-sheet')
+        local_sample_sheet = f'{tempfile.mkdtemp(prefix="qiime2app-resume-")}/{basename(sample_sheet)}'
+        con.get(remote=f'{self.remote_root()}/{sample_sheet}', local=local_sample_sheet)
+
+        if stage == RESUME_STAGES[0][0]:
+            start_stage = 'the whole pipeline'  # or from where it started before, e.g. after the merge of the shards
+        else:
+            choice = stage_choice(
+                schema=self.read_schema(ssh_key_values={**self.ssh_key_values, 'Qiime2 Pipeline': pipeline}),
+                option=START_STAGE_OPTION,
+                stage=stage)
+            if choice is None:
+                start_stage = f'the whole pipeline, "{pipeline}" cannot start at {stage.lower()}'
+            else:
+                parameters[START_STAGE_OPTION] = choice
+                start_stage = f'from {stage}'
+
+        parent_outdir = None if job_name == build_job_name(outdir=outdir) else dirname(outdir)  # of a sweep or shard
+        run = Run(parameters=parameters, sample_sheet=local_sample_sheet, parent_outdir=parent_outdir)
+        return (pipeline, run), start_stage
+
+    def check_artifacts(self, con: Connection, outdir: str, remove_broken: bool) -> Dict[str, Any]:
+        args = {
+            'outdir': outdir,
+            'remove-broken': 'yes' if remove_broken else 'no',
+        }
+        with con.cd(self.remote_root()):
+            response = con.run(build_remote_script_cmd(script=CHECK_ARTIFACTS_PY, args=args), hide=True)
+        return json.loads(response.stdout)
+
+
+class ActionResourceChart(Action):
+    """
+    Charts the resource samples of the job selected in either table of the dashboard,
+    clicking again for the same job fetches only the samples written since,
+    or all of them again if the job was rerun since
+    """
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+
+    def workflow(self):
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        backend = get_backend(name=self.ssh_key_values['Job Backend'])
+        jobs = self.view.dashboard.get_selected_jobs()
+        job_names = [backend.job_name_of(job_id=i) for _, i in jobs]
+        job_names += [event[1] for event in self.view.dashboard.get_selected_finished_events()]
+        if len(job_names) == 0:
+            self.view.message_box_info(msg='No job selected')
+            return
+        if len(jobs) > 0 and not backend.IS_LOCAL:
+            self.ssh_key_values['Host'] = jobs[0][0]  # the samples are on the host of the running job
+
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+
+        chart = self.view.resource_chart
+        if chart.job_name != job_names[0]:
+            chart.reset(job_name=job_names[0])
+
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            cmd = build_fetch_samples_cmd(job_name=chart.job_name, offset=chart.n_bytes)
+            response = con.run(cmd, echo=True, hide=True, warn=True)
+        con.close()
+
+        offset, data = parse_fetched_samples(stdout=response.stdout)
+        if offset < chart.n_bytes:  # rerun, a new file
+            chart.reset(job_name=chart.job_name)
+        chart.append(data=data)
+        self.view.show_resource_chart()
+
+
+class ActionCompareStages(Action):
+    """
+    Compares the stage durations of the finished runs selected in the dashboard, or of all of them,
+    grouped by the parameters that differ between the runs
+
+    The timeline of each run is cached locally and updated from the bytes of its output not fetched yet,
+    all runs in one round trip
+    """
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+
+    def workflow(self):
+        events = self.view.dashboard.get_selected_finished_events()
+        if len(events) == 0:
+            events = list(self.view.dashboard.finished_events.values())
+        if len(events) == 0:
+            self.view.message_box_info(msg='No finished job')
+            return
+
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        self.ssh_key_values = self.view.get_ssh_key_values()
+
+        latest = {}  # the latest run of each outdir
+        for event in sorted(events):
+            latest[event[4]] = event
+        outdirs = list(latest.keys())
+        files = [self.cache_file(outdir=o) for o in outdirs]
+        timelines = [Timeline.load(file=f) for f in files]
+
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            cmd = build_fetch_timelines_cmd(outdir_to_timeline=dict(zip(outdirs, timelines)))
+            response = con.run(cmd, hide=True)
+        con.close()
+
+        os.makedirs(TIMELINES_DIR, exist_ok=True)
+        for i, line in enumerate(response.stdout.splitlines()):
+            first_timestamp, _, data = line.partition('\t')
+            if first_timestamp != timelines[i].first_timestamp:  # rerun, fetched from the start
+                timelines[i] = Timeline()
+            timelines[i].feed(data=base64.b64decode(data))
+            timelines[i].save(file=files[i])
+
+        rows = aggregate_by_parameters(
+            timelines=dict(zip(outdirs, timelines)),
+            commands={o: latest[o][5].get('command', []) for o in outdirs})
+        self.view.show_stage_comparison(rows=rows)
+
+    def cache_file(self, outdir: str) -> str:
+        s = self.ssh_key_values
+        key = re.sub(r'[^A-Za-z0-9._-]', '_', f"{s['User']}@{s['Host']}_{s['Job Backend']}_{outdir}")
+        return f'{TIMELINES_DIR}/{key}.json'
+
+
+class ActionCompareRuns(Action):
+    """
+    Compares the results of the finished runs selected in the dashboard, or of all of them,
+    aggregated on the server so that only a summary is downloaded, see src/remote/compare_runs.py
+
+    The taxonomic level and the number of taxa are the current 'beta-diversity-feature-level' and 'n-taxa-barplot'
+    """
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+
+    def workflow(self):
+        events = self.view.dashboard.get_selected_finished_events()
+        if len(events) == 0:
+            events = list(self.view.dashboard.finished_events.values())
+        outdirs = list(dict.fromkeys(e[4] for e in sorted(events) if e[2] == '0'))  # successful, in the order of completion
+        if len(outdirs) < 2:
+            self.view.message_box_info(msg='At least two successful runs are needed for comparison')
+            return
+
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        qiime2_key_values = self.view.get_qiime2_key_values()
+
+        args = {
+            'outdirs': json.dumps(outdirs),
+            'level': qiime2_key_values.get('beta-diversity-feature-level', 'genus'),
+            'top': qiime2_key_values.get('n-taxa-barplot', '20'),
+        }
+        print(f'Comparing {len(outdirs)} runs on the server', flush=True)
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            response = con.run(build_remote_script_cmd(script=COMPARE_RUNS_PY, args=args), hide=True)
+        con.close()
+
+        self.view.show_run_comparison(summary=json.loads(response.stdout))
+
+
+class ActionFigureGallery(Action):
+    """
+    Shows the figures of the finished run selected in the dashboard, e.g. the taxonomy barplots, heatmaps and PCoA plots,
+    only the thumbnails scrolled into view are fetched, and a figure itself when it is clicked, see FigureFetcher
+    """
+
+    figure_fetcher: 'FigureFetcher'
+
+    def __init__(self, controller: Controller):
+        super().__init__(controller)
+        self.figure_fetcher = controller.figure_fetcher
+
+    def workflow(self):
+        events = self.view.dashboard.get_selected_finished_events()
+        if len(events) == 0:
+            self.view.message_box_info(msg='No finished job selected')
+            return
+        _, job_name, _, _, outdir, _ = events[0]
+
+        ssh_password = self.password_dialog()
+        if ssh_password == '':
+            return
+
+        self.figure_fetcher.open(ssh_key_values=self.view.get_ssh_key_values(), ssh_password=ssh_password, outdir=outdir)
+        figures = self.figure_fetcher.list_figures()
+        if len(figures) == 0:
+            self.figure_fetcher.close()
+            self.view.message_box_info(msg=f'No figures in "{outdir}"')
+            return
+        self.figure_fetcher.start()  # before the gallery requests the visible thumbnails
+        self.view.show_gallery(title=job_name, figures=figures)
+
+
+class FigureFetcher(QThread):
+    """
+    Fetches the figures of the run in the gallery over one connection, kept open while the gallery is shown,
+    see src/remote/figures.py
+
+    After the figures are listed, the thumbnails and the figures are fetched on this thread, one request at a time,
+    so that the gallery does not freeze while it is scrolled, the paths of the thumbnails which could not be fetched
+    are sent back with `thumbnails_failed`, for the gallery to request them again
+
+    The thumbnails and the figures are cached locally by server, path and mtime, in at most FIGURES_CACHE_BYTES
+    """
+
+    THUMBNAILS = 'thumbnails'
+    FIGURE = 'figure'
+
+    thumbnails_fetched = pyqtSignal(dict)  # path -> thumbnail, None for a figure without one
+    thumbnails_failed = pyqtSignal(list)  # paths
+    figure_fetched = pyqtSignal(str)  # local file
+    figure_failed = pyqtSignal(str)  # error message
+
+    ssh_key_values: Optional[Dict[str, str]]
+    ssh_password: str
+    outdir: str
+    connection: Optional[Connection]
+    cache: ImageCache
+    requests: 'queue.Queue[Optional[Tuple[str, Any]]]'  # (kind, figures or figure), None to stop
+    stopped: bool
+
+    def __init__(self):
+        super().__init__()
+        self.ssh_key_values = None
+        self.connection = None
+        self.cache = ImageCache(directory=FIGURES_DIR, max_bytes=FIGURES_CACHE_BYTES)
+        self.requests = queue.Queue()
+        self.stopped = False
+
+    def open(self, ssh_key_values: Dict[str, str], ssh_password: str, outdir: str):
+        self.close()
+        self.ssh_key_values = ssh_key_values
+        self.ssh_password = ssh_password
+        self.outdir = outdir
+        self.requests = queue.Queue()  # not the ones of the previous gallery
+        self.stopped = False
+        self.connection = open_connection(ssh_key_values=ssh_key_values, ssh_password=ssh_password)
+
+    def close(self):
+        if self.isRunning():
+            self.stopped = True  # the requests still queued are dropped
+            self.requests.put(None)
+            if self.connection is not None:
+                self.connection.close()  # interrupts the request in flight
+            self.wait()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def request(self, kind: str, arg: Any):
+        """
+        :param kind: THUMBNAILS of a list of figures, or the FIGURE itself
+        """
+        if self.isRunning():
+            self.requests.put((kind, arg))
+        elif kind == self.THUMBNAILS:  # the gallery was closed
+            self.thumbnails_failed.emit([f['path'] for f in arg])
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None or self.stopped:
+                return
+            kind, arg = request
+            if kind == self.THUMBNAILS:
+                try:
+                    self.thumbnails_fetched.emit(self.thumbnails(figures=arg))
+                except Exception as e:
+                    if not self.stopped:
+                        print(f'Warning: thumbnails not fetched: {e!r}', flush=True)
+                    self.thumbnails_failed.emit([f['path'] for f in arg])
+            else:
+                try:
+                    self.figure_fetched.emit(self.figure(figure=arg))
+                except Exception as e:
+                    if not self.stopped:
+                        self.figure_failed.emit(repr(e))
+
+    def list_figures(self) -> List[Dict[str, Any]]:
+        with self.connection.cd(REMOTE_ROOT_DIR):
+            response = self.connection.run(build_remote_script_cmd(script=FIGURES_PY, args={'outdir': self.outdir}), hide=True)
+        return json.loads(response.stdout)
+
+    def thumbnails(self, figures: List[Dict[str, Any]]) -> Dict[str, Optional[bytes]]:
+        """
+        :return: the thumbnail of each figure by its path, from the cache or else from the server
+        """
+        ret, missing = {}, []
+        for figure in figures:
+            file = self.cache.get(key=self.key(figure=figure, kind='thumbnail'))
+            if file is None:
+                missing.append(figure)
+                continue
+            with open(file, 'rb') as fh:
+                ret[figure['path']] = fh.read()
+
+        for start in range(0, len(missing), THUMBNAILS_PER_REQUEST):
+            batch = missing[start:start + THUMBNAILS_PER_REQUEST]
+            args = {
+                'outdir': self.outdir,
+                'thumbnails': json.dumps([f['path'] for f in batch]),
+                'size': str(Gallery.THUMBNAIL_SIZE),
+            }
+            with self.connection.cd(REMOTE_ROOT_DIR):
+                response = self.connection.run(build_remote_script_cmd(script=FIGURES_PY, args=args), hide=True)
+            path_to_b64 = json.loads(response.stdout)
+            for figure in batch:
+                b64 = path_to_b64.get(figure['path'])
+                data = base64.b64decode(b64) if b64 is not None else None
+                if data is not None:
+                    self.cache.put(key=self.key(figure=figure, kind='thumbnail'), data=data)
+                ret[figure['path']] = data
+        return ret
+
+    def figure(self, figure: Dict[str, Any]) -> str:
+        """
+        :return: the local file of the figure at full resolution, downloaded unless it is cached
+        """
+        key = self.key(figure=figure, kind='figure')
+        file = self.cache.get(key=key)
+        if file is None:
+            os.makedirs(FIGURES_DIR, exist_ok=True)
+            partial = f'{self.cache.path(key=key)}.partial'
+            print(f'Downloading "{figure["path"]}", {figure["bytes"] / 2 ** 20:.1f} MB', flush=True)
+            self.connection.get(remote=f'{REMOTE_ROOT_DIR}/{self.outdir}/{figure["path"]}', local=partial)
+            file = self.cache.add(key=key, file=partial)
+        return file
+
+    def key(self, figure: Dict[str, Any], kind: str) -> str:
+        s = self.ssh_key_values
+        return cache_key(
+            server=f"{s['User']}@{host_of(ssh_key_values=s)}:{s['Port']}",
+            remote_path=f'{self.outdir}/{figure["path"]}',
+            mtime=figure['mtime'],
+            kind=kind)
+
+
+class ActionCompactRuns(Action):
+    """
+    Deletes the PIPELINE_TEMPORARY_PATHS and compresses the bulky text outputs of the runs
+    which finished successfully at least 'Compact After Days' ago, on the server, see src/remote/compact_runs.py
+
+    Either now, after listing the paths of a dry run for confirmation, showing the disk space reclaimed per run,
+    or every night from the crontab of the server
+    """
+
+    COMPACT_NOW = 'Compact Now'
+    SCHEDULE = 'Schedule Nightly'
+    UNSCHEDULE = 'Unschedule'
+    CANCEL = 'Cancel'
+
+    ssh_password: str
+    ssh_key_values: Dict[str, str]
+
+    def workflow(self):
+        self.ssh_key_values = self.view.get_ssh_key_values()
+        days = self.ssh_key_values['Compact After Days']
+        assert re.fullmatch(r'\d+(\.\d+)?', days), f'"Compact After Days" should be a number of days, not "{days}"'
+
+        choice = self.view.message_box_choice(
+            msg=f'Delete the temporary files and compress the text outputs of the runs which finished at least {days} days ago?',
+            choices=[self.COMPACT_NOW, self.SCHEDULE, self.UNSCHEDULE, self.CANCEL])
+        if choice == self.CANCEL:
+            return
+
+        self.ssh_password = self.password_dialog()
+        if self.ssh_password == '':
+            return
+
+        args = {
+            'days': days,
+            'threads': self.view.get_qiime2_key_values().get('threads', '1'),
+            'jobs': str(COMPACT_PARALLEL_DIRS),
+            'temporary': json.dumps(PIPELINE_TEMPORARY_PATHS),
+            'dry-run': 'no',
+        }
+        con = open_connection(ssh_key_values=self.ssh_key_values, ssh_password=self.ssh_password)
+        with con.cd(REMOTE_ROOT_DIR):
+            if choice == self.COMPACT_NOW:
+                print(f'Listing the paths of the runs which finished at least {days} days ago', flush=True)
+                response = con.run(
+                    build_remote_script_cmd(script=COMPACT_RUNS_PY, args={**args, 'dry-run': 'yes'}), hide=True)
+                if not self.view.message_box_yes_no(msg=format_compaction_plan(runs=json.loads(response.stdout))):
+                    con.close()
+                    return
+                print(f'Compacting the runs which finished at least {days} days ago', flush=True)
+                response = con.run(build_remote_script_cmd(script=COMPACT_RUNS_PY, args=args), hide=True)
+            elif choice == self.SCHEDULE:
+                con.run(build_schedule_compaction_cmd(args=args), echo=True, hide=True)
+            else:
+                con.run(build_unschedule_compaction_cmd(), echo=True, hide=True)
+        con.close()
+
+        if choice == self.COMPACT_NOW:
+            self.view.show_compaction_report(runs=json.loads(response.stdout))
+        elif choice == self.SCHEDULE:
+            self.view.message_box_info(msg=f'Scheduled every night, the reports are appended to "{REMOTE_ROOT_DIR}/{COMPACT_LOG}"')
+        else:
+            self.view.message_box_info(msg='Unscheduled')
+
+
+def format_compaction_plan(runs: List[Dict[str, Any]]) -> str:
     """
-    :return: list of (job_id, start_time)
+    :param runs: the report of a dry run of src/remote/compact_runs.py
+    :return: the question whether to compact, with the paths to be deleted and compressed,
+        up to COMPACTION_PLAN_LINES of them
+    """
+    lines = []
+    for r in runs:
+        lines += [f'delete {r["outdir"]}/{p}' for p in r['deleted']]
+        lines += [f'compress {r["outdir"]}/{p}' for p in r['compressed']]
+    if len(lines) > COMPACTION_PLAN_LINES:
+        lines = lines[:COMPACTION_PLAN_LINES] + [f'... and {len(lines) - COMPACTION_PLAN_LINES} more']
+    n_deleted = sum(len(r['deleted']) for r in runs)
+    n_compressed = sum(len(r['compressed']) for r in runs)
+    return f'Delete {n_deleted} temporary paths and compress {n_compressed} files of {len(runs)} runs?\n\n' + '\n'.join(lines)
+
+
+def build_schedule_compaction_cmd(args: Dict[str, str]) -> str:
+    """
+    Installs the script in the remote root dir, and replaces the crontab line tagged with COMPACT_CRON_TAG,
+    cron runs /bin/sh, so the .profile is sourced in bash
+    """
+    script = f'{dirname(COMPACT_LOG)}/{COMPACT_RUNS_PY}'
+    with open(f'{REMOTE_SCRIPTS_DIR}/{COMPACT_RUNS_PY}') as fh:
+        source = fh.read()
+    options = ' '.join(f'--{key}={shlex.quote(val)}' for key, val in args.items())
+    job = f"bash -c {shlex.quote(f'source {PROFILE_FILE} && python {script} {options}')} >> {COMPACT_LOG} 2>&1"
+    line = f'{COMPACT_SCHEDULE} cd "$HOME/{REMOTE_ROOT_DIR}" && {job} {COMPACT_CRON_TAG}'
+    return f"""mkdir -p {dirname(COMPACT_LOG)} && cat > {script} <<'{HEREDOC_DELIMITER}'
+{source}
+{HEREDOC_DELIMITER}
+{{ crontab -l 2> /dev/null | grep -vF '{COMPACT_CRON_TAG}'; echo {shlex.quote(line)}; }} | crontab -"""
+
 
-    Three typical responses:
+def build_unschedule_compaction_cmd() -> str:
+    return f"crontab -l 2> /dev/null | grep -vF '{COMPACT_CRON_TAG}' | crontab -"
 
-    ---1---
-    No Sockets found in /run/screen/S-linyc74.
-    -------
 
-    ---2---
-    There is a screen on:
-        833015.outdir	(02/16/2025 03:25:51 PM)	(Detached)
-    1 Socket in /run/screen/S-linyc74.
-    -------
+def build_fetch_timelines_cmd(outdir_to_timeline: Dict[str, Timeline]) -> str:
+    """
+    One line per outdir: the first timestamp of its output, a tab,
+    and the base64 of the output from the timeline's offset on, or from the start if the first timestamp changed
+    """
+    cmds = []
+    for outdir, timeline in outdir_to_timeline.items():
+        cmds.append(f'''\
+F='{outdir}/{PROGRESS_TIMES_TSV}'
+H="$(head -n 1 "$F" 2> /dev/null | cut -f 1)"
+if [ "$H" = '{timeline.first_timestamp}' ]; then O={timeline.offset + 1}; else O=1; fi
+printf '%s\\t%s\\n' "$H" "$(tail -c +$O "$F" 2> /dev/null | base64 -w 0)"''')
+    return '\n'.join(cmds)
 
-    ---3---
-    There are screens on:
-        835269.outdir_1	(02/16/2025 09:12:36 PM)	(Detached)
-        833015.outdir_2	(02/16/2025 03:25:51 PM)	(Detached)
-    2 Sockets in /run/screen/S-linyc74.
-    -------
 
-    Parsed examples:
+def build_fetch_samples_cmd(job_name: str, offset: int) -> str:
+    """
+    The byte offset the samples are fetched from, a tab, and the binary samples from there on,
+    base64-encoded to pass through the text stdout
 
-    ---1---
-    []
-    -------
+    A file smaller than the offset was written anew by a rerun of the job, it is fetched from the start
+    """
+    file = f'{SAMPLES_DIR}/{job_name}.bin'
+    return f'''SIZE=$(wc -c 2> /dev/null < "{file}" || echo 0) && OFFSET={offset} \\
+&& if [ "$SIZE" -lt "$OFFSET" ]; then OFFSET=0; fi \\
+&& printf '%s\\t' "$OFFSET" && tail -c +$((OFFSET + 1)) "{file}" 2> /dev/null | base64 -w 0'''
 
-    ---2---
-    [('833015.outdir', '02/16/2025 03:25:51 PM')]
-    -------
 
-    ---3---
-    [('835269.outdir_1', '02/16/2025 09:12:36 PM'), ('833015.outdir_2', '02/16/2025 03:25:51 PM')]
-    -------
+def parse_fetched_samples(stdout: str) -> Tuple[int, bytes]:
     """
-    lines = stdout.splitlines()
+    :return: the byte offset and the samples from there on, see build_fetch_samples_cmd()
+    """
+    offset, _, data = stdout.strip().partition('\t')
+    return int(offset), base64.b64decode(data)
+
+
+def open_connection(
+        ssh_key_values: Dict[str, str],
+        ssh_password: str,
+        connect_timeout: Optional[float] = None) -> Connection:
+    """
+    The local backend runs the jobs on this machine, with no SSH connection at all
+    """
+    if get_backend(name=ssh_key_values['Job Backend']).IS_LOCAL:
+        return LocalConnection()
+    return Connection(
+        host=ssh_key_values['Host'],
+        user=ssh_key_values['User'],
+        port=int(ssh_key_values['Port']),
+        connect_timeout=connect_timeout,
+        connect_kwargs={'password': ssh_password}
+    )
+
+
+def dashboard_hosts(ssh_key_values: Dict[str, str]) -> List[str]:
+    """
+    The comma-separated 'Dashboard Hosts', e.g. 'server1, server2', or the Host if there are none
+    """
+    if get_backend(name=ssh_key_values['Job Backend']).IS_LOCAL:
+        return [LOCAL_HOST]
+    hosts = [h.strip() for h in ssh_key_values.get('Dashboard Hosts', '').split(',') if h.strip() != '']
+    return list(dict.fromkeys(hosts)) if len(hosts) > 0 else [ssh_key_values['Host']]
+
+
+def host_of(ssh_key_values: Dict[str, str]) -> str:
+    """
+    The host of the jobs in the dashboard
+    """
+    return LOCAL_HOST if get_backend(name=ssh_key_values['Job Backend']).IS_LOCAL else ssh_key_values['Host']
+
+
+def fan_out(
+        ssh_key_values: Dict[str, str],
+        ssh_password: str,
+        hosts: List[str],
+        command: str,
+        timeout: float = HOST_TIMEOUT_SECONDS,
+        cwd: str = REMOTE_ROOT_DIR) -> Dict[str, Union[str, Exception]]:
+    """
+    Runs the command on all hosts at the same time, each on its own thread and connection,
+    with the same user, port and password
+
+    A host which has not answered after `timeout` seconds, e.g. unreachable or overloaded, does not delay the others:
+    its connection is closed, which interrupts the request
+
+    :return: the stdout of each host, in the order of the hosts, or the exception raised for it
+    """
+    connections = {
+        h: open_connection(ssh_key_values={**ssh_key_values, 'Host': h}, ssh_password=ssh_password, connect_timeout=timeout)
+        for h in hosts
+    }
+
+    def request(con: Connection) -> str:
+        with con.cd(cwd):
+            return con.run(command, hide=True, warn=True).stdout  # warn=True for the exit code 1 when there is no screen
+
+    print(f'Querying {len(hosts)} host(s): {", ".join(hosts)}', flush=True)
+    executor = ThreadPoolExecutor(max_workers=len(hosts))
+    futures = {h: executor.submit(request, connections[h]) for h in hosts}
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    ret = {}
+    for host, future in futures.items():
+        if future in done:
+            ret[host] = future.exception() or future.result()
+        else:
+            ret[host] = TimeoutError(f'No answer within {timeout:g} seconds')
+        connections[host].close()
+    executor.shutdown(wait=False)
+    return ret
+
+
+def build_remove_scratch_cmd(job_name: str) -> str:
+    """
+    The killed job removes its own scratch dir on SIGHUP, this is for when it could not,
+    only paths created by the job script (with SCRATCH_PREFIX) are removed
+    """
+    f = f'{SCRATCH_DIRS}/{job_name}'
+    return f'{{ S="$(cat "{f}" 2> /dev/null)"; case "$S" in */{SCRATCH_PREFIX}*) rm -rf "$S";; esac; rm -f "{f}"; }}'
+
+
+class EventWatcher(QThread):
+    """
+    Holds one connection open and blocks on the server until a job writes its event file,
+    so the dashboard learns about finished or crashed jobs without polling the job status
+
+    Only the 'Host' is watched, not the other 'Dashboard Hosts', whose events show only on a file system shared with it
+    """
+
+    received = pyqtSignal(list, list, bool)  # events, running jobs, whether to notify
+
+    ssh_key_values: Optional[Dict[str, str]]
+    ssh_password: str
+    connection: Optional[Connection]
+    last_event: str
+    stopped: bool
+
+    def __init__(self):
+        super().__init__()
+        self.ssh_key_values = None
+        self.connection = None
+
+    def watch(self, ssh_key_values: Dict[str, str], ssh_password: str):
+        keys = ['Host', 'User', 'Port', 'Job Backend']
+        if self.isRunning() and all(ssh_key_values[k] == self.ssh_key_values[k] for k in keys):
+            return
+        self.stop()
+        self.ssh_key_values = ssh_key_values
+        self.ssh_password = ssh_password
+        self.connection = None  # of the previous watch, until run() opens the new one
+        self.last_event = ''
+        self.stopped = False
+        self.start()
+
+    def stop(self):
+        if not self.isRunning():
+            return
+        self.stopped = True
+        if self.connection is not None:  # otherwise run() has not opened it yet, and returns before the first request
+            self.connection.close()  # interrupts the blocking wait on the server
+        self.wait()
+
+    def run(self):
+        s = self.ssh_key_values
+        self.connection = open_connection(ssh_key_values=s, ssh_password=self.ssh_password)
+        backend = get_backend(name=s['Job Backend'])
+        notify = False  # the first request returns right away with the events that happened before watching
+        timeout = 0
+        while not self.stopped:
+            cmd = build_wait_events_cmd(
+                last_event=self.last_event, timeout=timeout, status_cmd=build_status_with_placements_cmd(backend))
+            try:
+                with self.connection.cd(REMOTE_ROOT_DIR):
+                    response = self.connection.run(cmd, hide=True, warn=True)
+                events, status_stdout = parse_wait_events(stdout=response.stdout)
+                jobs = parse_status_with_placements(backend=backend, stdout=status_stdout)
+            except Exception as e:
+                if not self.stopped:
+                    print(f'Event watcher stopped: {e!r}', flush=True)
+                return
+            if len(events) > 0:
+                self.last_event = events[-1][0]
+                self.received.emit(events, jobs, notify)
+            notify = True
+            timeout = EVENTS_WAIT_SECONDS
+
+
+def build_status_with_placements_cmd(backend: Backend) -> str:
+    """
+    The job status, followed by the placement of each running job, one line per job
+    """
+    return f'''{backend.build_status_cmd()}; echo "{PLACEMENTS_SEPARATOR}"; \
+for f in "{PLACEMENTS_DIR}"/*; do [ -f "$f" ] && printf '%s\\t%s\\n' "${{f##*/}}" "$(cat "$f")"; done; true'''
+
+
+def parse_status_with_placements(backend: Backend, stdout: str) -> List[Tuple[str, str, str, str, str]]:
+    """
+    :return: list of (job_id, start_time, elapsed_time, progress, placement),
+             the progress and the placement are empty where unknown
+    """
+    status_stdout, _, placements_stdout = stdout.partition(PLACEMENTS_SEPARATOR + '\n')
+    placements = {}
+    for line in placements_stdout.splitlines():
+        job_name, _, placement = line.partition('\t')
+        try:
+            placements[job_name] = json.loads(placement)['text']
+        except (ValueError, KeyError, TypeError):
+            continue  # being written
     jobs = []
-    if lines[0].startswith('There'):
-        for line in lines[1:-1]:
-            job_id, start_time = line.split('\t')[1:3]
-            start_time = start_time[1:-1]  # remove the parentheses
-            duration = duration_until_now(time_point=start_time)
-            jobs.append((job_id, start_time, duration))
+    for job in backend.parse_status(stdout=status_stdout):
+        progress = job[3] if len(job) > 3 else ''
+        placement = placements.get(backend.job_name_of(job_id=job[0]), '')
+        jobs.append((job[0], job[1], job[2], progress, placement))
     return jobs
 
 
-def duration_until_now(time_point: str):
-    time_format = '%m/%d/%Y %I:%M:%S %p'
-    time_point_dt = datetime.strptime(time_point, time_format)
-    now = datetime.now()
-    time_difference = now - time_point_dt
-    hours, remainder = divmod(time_difference.total_seconds(), 3600)
-    minutes, _ = divmod(remainder, 60)
-    return f'{int(hours)}h {int(minutes)}m'
+def build_wait_events_cmd(last_event: str, timeout: int, status_cmd: str) -> str:
+    """
+    Blocks on the server until an event newer than `last_event` exists, or until timeout
+
+    inotifywait wakes up as soon as an event file is moved in,
+    without it the loop falls back to checking once per second on the server side
+    """
+    return f'''\
+mkdir -p "{EVENTS_DIR}" && cd "{EVENTS_DIR}"
+END=$((SECONDS+{timeout}))
+while [ $SECONDS -lt $END ]; do
+    NEWEST=$(ls | sort | tail -n 1)
+    if [[ "$NEWEST" > "{last_event}" ]]; then break; fi
+    inotifywait -qq -t 5 -e moved_to . 2>/dev/null || sleep 1
+done
+for f in $(ls | sort); do
+    if [[ "$f" > "{last_event}" ]]; then printf '%s\\t%s\\n' "$f" "$(cat "$f")"; fi
+done
+echo "{STATUS_SEPARATOR}"
+cd - > /dev/null && source {PROFILE_FILE} > /dev/null 2>&1; {status_cmd}
+'''
+
+
+def parse_wait_events(stdout: str) -> Tuple[List[Tuple[str, str, str, str, str, Dict[str, Any]]], str]:
+    """
+    :return: list of (event, job_name, exit_code, end_time, outdir, job_stats), and the stdout of the job status
+
+    The events are sorted from the oldest to the newest,
+    job_stats is the content of JOB_STATS_JSON, empty when the job did not write it
+    """
+    events_stdout, status_stdout = stdout.split(STATUS_SEPARATOR + '\n', 1)
+    events = []
+    for line in events_stdout.splitlines():
+        if line.strip() == '':
+            continue
+        fields = line.split('\t') + ['']  # events written before the job stats existed have no stats field
+        event, job_name, exit_code, end_time, outdir, stats = fields[0:6]
+        try:
+            job_stats = json.loads(stats)
+        except ValueError:
+            job_stats = {}
+        events.append((event, job_name, exit_code, end_time, outdir, job_stats))
+    return events, status_stdout
@@ -0,0 +1,72 @@
+import os
+import hashlib
+from os.path import join, exists, splitext
+from typing import Optional
+
+
+def cache_key(server: str, remote_path: str, mtime: int, kind: str) -> str:
+    """
+    The name of the cached file, e.g. 'a1b2...-thumbnail.png', by the server, the remote path and its mtime,
+    so that a figure rewritten by a rerun is fetched again, with the extension of the figure for it to open in its viewer
+    """
+    digest = hashlib.sha256(f'{server}:{remote_path}:{mtime}'.encode()).hexdigest()[:32]
+    return f'{digest}-{kind}{splitext(remote_path)[1].lower()}'
+
+
+class ImageCache:
+    """
+    Local copies of the figures and of their thumbnails, in one directory of at most `max_bytes`
+
+    A hit touches the file, so that the modification times order the files by their last use,
+    and the least recently used files are deleted when a new file makes the directory too large
+    """
+
+    directory: str
+    max_bytes: int
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key: str) -> str:
+        return join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        if not exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        with open(f'{path}.partial', 'wb') as fh:
+            fh.write(data)
+        return self.add(key=key, file=f'{path}.partial')
+
+    def add(self, key: str, file: str) -> str:
+        """
+        Moves a downloaded file into the cache
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        os.replace(file, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: str):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.partial'):
+                continue
+            stat = os.stat(join(self.directory, name))
+            files.append((stat.st_mtime, stat.st_size, join(self.directory, name)))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):  # the least recently used first
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            os.remove(path)
+            total -= size
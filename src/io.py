@@ -1,9 +1,101 @@
+import os
+import re
 import csv
-from typing import Dict, Union
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union, Iterator, Optional
+from .pipeline import SHARD_DIR_PREFIX
+
+
+SAMPLE_ID_HEADER = 'Sample'  # of the first column of a generated sample sheet
+SAMPLE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')  # the characters QIIME 2 recommends for IDs
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+Q2_TYPES_DIRECTIVE = '#q2:types'  # the optional row of the declared column types of a QIIME 2 metadata file
+FALLBACK_ENCODING = 'cp1252'  # of the lines which are not UTF-8, e.g. saved by Excel on Windows
+MAX_EXAMPLES = 5  # of each kind of problem, so that the summary stays small however large the sheet
+SAMPLE_SHEET_CACHE_SIZE = 8  # sample sheets kept parsed in memory
+XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'pkg': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+
+
+class EncodingErrors:
+    """
+    The lines of a sample sheet which are not UTF-8: their count and the first MAX_EXAMPLES line numbers
+    """
+
+    n: int
+    lines: List[int]
+
+    def __init__(self):
+        self.n = 0
+        self.lines = []
+
+    def add(self, line: int):
+        self.n += 1
+        if len(self.lines) < MAX_EXAMPLES:
+            self.lines.append(line)
+
+
+class SampleSheetSummary:
+    """
+    What IO.scan_sample_sheet() keeps of a sample sheet: the sample IDs and the columns, not the rows,
+    and up to MAX_EXAMPLES examples of each problem with its total count
+    """
+
+    file: str
+    columns: List[str]
+    column_types: Dict[str, str]  # 'numeric', 'categorical' or 'empty', or as declared by the '#q2:types' row
+    sample_ids: List[str]  # unique, in the order of the sheet
+    n_rows: int
+    duplicate_ids: List[str]
+    n_duplicate_rows: int
+    bad_ids: List[str]  # with characters other than SAMPLE_ID_PATTERN, or empty
+    n_bad_ids: int
+    bad_cells: List[str]  # e.g. 'row 12, column "Group"', with control characters
+    n_bad_cells: int
+    encoding_error_lines: List[int]  # not UTF-8, read as FALLBACK_ENCODING
+    n_encoding_error_lines: int
+
+    def __init__(self, file: str, columns: List[str]):
+        self.file = file
+        self.columns = columns
+        self.column_types = {}
+        self.sample_ids = []
+        self.n_rows = 0
+        self.duplicate_ids, self.n_duplicate_rows = [], 0
+        self.bad_ids, self.n_bad_ids = [], 0
+        self.bad_cells, self.n_bad_cells = [], 0
+        self.encoding_error_lines, self.n_encoding_error_lines = [], 0
+
+    def problems(self) -> List[str]:
+        ret = []
+        if len(self.sample_ids) == 0:
+            ret.append('No samples')
+        if self.n_duplicate_rows > 0:
+            ret.append(f'{self.n_duplicate_rows} rows repeat a sample ID, e.g. {", ".join(self.duplicate_ids)}')
+        if self.n_bad_ids > 0:
+            ret.append(f'{self.n_bad_ids} sample IDs are empty or have characters other than letters, digits, ".", "-" and "_", '
+                       f'e.g. {", ".join(repr(i) for i in self.bad_ids)}')
+        if self.n_bad_cells > 0:
+            ret.append(f'{self.n_bad_cells} cells have control characters, e.g. {", ".join(self.bad_cells)}')
+        if self.n_encoding_error_lines > 0:
+            ret.append(f'{self.n_encoding_error_lines} lines are not UTF-8 and were read as {FALLBACK_ENCODING}, '
+                       f'e.g. line {", ".join(str(i) for i in self.encoding_error_lines)}')
+        return ret
 
 
 class IO:
 
+    sample_sheet_cache: 'OrderedDict[str, Tuple[Tuple[int, int], SampleSheetSummary]]'  # by absolute path, with its mtime and size
+
+    def __init__(self):
+        self.sample_sheet_cache = OrderedDict()
+
     def read(self, file: str) -> Dict[str, Union[str, bool]]:
 
         if file.endswith('.txt'):
@@ -46,6 +138,122 @@ class IO:
                 ret[key] = val
         return ret
 
+    def read_sample_ids(self, file: str) -> List[str]:
+        """
+        The first column of the sample sheet, without the header row, as it is,
+        also the comment rows and the repeated IDs, since it is part of the fingerprint of a run
+
+        See scan_sample_sheet() for the checked, unique sample IDs
+        """
+        assert is_sample_sheet_readable(file), \
+            f'Cannot read the sample sheet "{file}", only .csv, .tsv and .xlsx files can be read'
+        if file.endswith('.xlsx'):
+            rows = iter_xlsx_rows(file=file)
+            next(rows, None)  # the header row
+            return [(row[0] if len(row) > 0 else '').strip() for _, row in rows]
+        _, samples = self.__read_sample_sheet(file)
+        return [row[0].strip() for row in samples]
+
+    def scan_sample_sheet(self, file: str) -> SampleSheetSummary:
+        """
+        Streams the rows of a .csv, .tsv or .xlsx sample sheet, holding one row at a time, see iter_sample_sheet_rows(),
+        and checks the sample IDs of the first column and the cells of the metadata columns
+
+        A column is numeric if all of its values are numbers, unless the types are declared by a '#q2:types' row,
+        the other rows starting with '#' are comments
+
+        The summary is cached by path, and re-read only when the modification time or the size of the file changes,
+        so that the sample sheet of a submission is read once for all the checks
+        """
+        key = os.path.abspath(file)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size)
+        cached = self.sample_sheet_cache.get(key)
+        if cached is not None and cached[0] == version:
+            self.sample_sheet_cache.move_to_end(key)
+            return cached[1]
+
+        summary = summarize_sample_sheet(file=file)
+        self.sample_sheet_cache[key] = (version, summary)
+        while len(self.sample_sheet_cache) > SAMPLE_SHEET_CACHE_SIZE:
+            self.sample_sheet_cache.popitem(last=False)
+        return summary
+
+    def split_sample_sheet(self, file: str, samples_per_shard: int, outdir: str) -> List[str]:
+        """
+        Each shard keeps the header row and has the same file name, in its own dir <outdir>/shard-<i>
+        named like the shard runs on the server
+
+        :return: the shard files
+        """
+        header, samples = self.__read_sample_sheet(file)
+        ret = []
+        for start in range(0, len(samples), samples_per_shard):
+            shard = f'{outdir}/{SHARD_DIR_PREFIX}{len(ret) + 1}/{os.path.basename(file)}'
+            self.__write_sample_sheet(file=shard, header=header, samples=samples[start:start + samples_per_shard])
+            ret.append(shard)
+        return ret
+
+    def subset_sample_sheet(self, file: str, sample_ids: List[str], outdir: str) -> str:
+        """
+        :return: the sample sheet with only the given samples, with the same file name in `outdir`
+        """
+        header, samples = self.__read_sample_sheet(file)
+        ret = f'{outdir}/{os.path.basename(file)}'
+        self.__write_sample_sheet(
+            file=ret, header=header, samples=[row for row in samples if row[0].strip() in sample_ids])
+        return ret
+
+    def generate_sample_sheet(self, file: str, sample_ids: List[str]):
+        """
+        One row per sample, with only the sample ID column for the metadata to be filled in
+        """
+        self.__write_sample_sheet(file=file, header=[SAMPLE_ID_HEADER], samples=[[s] for s in sample_ids])
+
+    def patch_sample_sheet(
+            self,
+            file: str,
+            sample_ids: List[str],
+            add_missing: bool,
+            patched_file: str) -> Tuple[List[str], List[str]]:
+        """
+        Drops the rows of the samples not in `sample_ids` (e.g. without FASTQ files) and the repeated rows of a sample,
+        and with `add_missing` appends a row with empty metadata for each sample of `sample_ids` not in the sheet
+
+        :return: the removed and the added sample IDs
+        """
+        header, samples = self.__read_sample_sheet(file)
+        available = set(sample_ids)
+        kept, removed, seen = [], [], set()
+        for row in samples:
+            sample_id = row[0].strip()
+            if sample_id in available and sample_id not in seen:
+                kept.append(row)
+            else:
+                removed.append(sample_id)
+            seen.add(sample_id)
+
+        added = []
+        if add_missing:
+            added = [s for s in sample_ids if s not in seen]
+            kept += [[s] + [''] * (len(header) - 1) for s in added]
+
+        self.__write_sample_sheet(file=patched_file, header=header, samples=kept)
+        return removed, added
+
+    def __read_sample_sheet(self, file: str) -> Tuple[List[str], List[List[str]]]:
+        assert is_sample_sheet_splittable(file), \
+            f'Cannot split the sample sheet "{file}", only .csv and .tsv files can be split'
+        with open(file) as fh:
+            rows = [row for row in csv.reader(fh, delimiter=sample_sheet_delimiter(file)) if len(row) > 0]
+        return rows[0], rows[1:]
+
+    def __write_sample_sheet(self, file: str, header: List[str], samples: List[List[str]]):
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(file, 'w', newline='') as fh:
+            writer = csv.writer(fh, delimiter=sample_sheet_delimiter(file), lineterminator='\n')
+            writer.writerows([header] + samples)
+
     def write(self,
               parameters: Dict[str, Union[str, bool]],
               file: str):
@@ -74,3 +282,173 @@ class IO:
                     if sep == ',' and ',' in val:  # use double quotes to protect commas
                         val = f'"{val}"'
                     fh.write(f'{key}{sep}{val}\n')
+
+
+def is_sample_sheet_splittable(file: str) -> bool:
+    return file.endswith('.csv') or file.endswith('.tsv') or file.endswith('.tab')
+
+
+def is_sample_sheet_readable(file: str) -> bool:
+    return is_sample_sheet_splittable(file) or file.endswith('.xlsx')
+
+
+def sample_sheet_delimiter(file: str) -> str:
+    return ',' if file.endswith('.csv') else '\t'
+
+
+def iter_sample_sheet_rows(file: str, encoding_errors: EncodingErrors) -> Iterator[Tuple[int, List[str]]]:
+    """
+    :param encoding_errors: counts the lines which are not UTF-8, read as FALLBACK_ENCODING
+    :return: the line (or Excel row) number and the cells of each row which is not blank, the header row first
+    """
+    if file.endswith('.xlsx'):
+        yield from iter_xlsx_rows(file=file)
+        return
+    with open(file, 'rb') as fh:
+        reader = csv.reader(decode_lines(fh=fh, encoding_errors=encoding_errors), delimiter=sample_sheet_delimiter(file))
+        for row in reader:
+            if any(c.strip() != '' for c in row):
+                yield reader.line_num, row
+
+
+def decode_lines(fh, encoding_errors: EncodingErrors) -> Iterator[str]:
+    for i, line in enumerate(fh):
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError:
+            encoding_errors.add(line=i + 1)
+            text = line.decode(FALLBACK_ENCODING, errors='replace')
+        yield text.lstrip('\ufeff') if i == 0 else text  # the byte order mark of Excel's "CSV UTF-8"
+
+
+def iter_xlsx_rows(file: str) -> Iterator[Tuple[int, List[str]]]:
+    """
+    The rows of the first worksheet, parsed incrementally from the XML in the .xlsx archive,
+    each row element is cleared once read, only the shared strings table is held in memory
+    """
+    with zipfile.ZipFile(file) as z:
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in z.namelist():
+            with z.open('xl/sharedStrings.xml') as fh:
+                for _, elem in ET.iterparse(fh):
+                    if elem.tag == f'{{{XLSX_NS["main"]}}}si':
+                        shared_strings.append(''.join(t.text or '' for t in elem.iter(f'{{{XLSX_NS["main"]}}}t')))
+                        elem.clear()
+
+        with z.open(xlsx_first_sheet(z)) as fh:
+            for _, elem in ET.iterparse(fh):
+                if elem.tag != f'{{{XLSX_NS["main"]}}}row':
+                    continue
+                row = []
+                for c in elem.iter(f'{{{XLSX_NS["main"]}}}c'):
+                    col = xlsx_column_index(c.get('r', '')) if c.get('r') else len(row)
+                    row += [''] * (col - len(row))  # empty cells are not written
+                    row.append(xlsx_cell_text(c, shared_strings=shared_strings))
+                number = int(elem.get('r', '0'))
+                elem.clear()
+                if any(c.strip() != '' for c in row):
+                    yield number, row
+
+
+def xlsx_first_sheet(z: zipfile.ZipFile) -> str:
+    workbook = ET.fromstring(z.read('xl/workbook.xml'))
+    sheet = workbook.find('main:sheets/main:sheet', XLSX_NS)
+    rid = sheet.get(f'{{{XLSX_NS["rel"]}}}id')
+    rels = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.findall('pkg:Relationship', XLSX_NS):
+        if rel.get('Id') == rid:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(f'xl/{target}')
+    return 'xl/worksheets/sheet1.xml'
+
+
+def xlsx_column_index(ref: str) -> int:
+    """
+    'A1' -> 0, 'AB12' -> 27
+    """
+    ret = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        ret = ret * 26 + ord(ch.upper()) - ord('A') + 1
+    return ret - 1
+
+
+def xlsx_cell_text(c: ET.Element, shared_strings: List[str]) -> str:
+    t = c.get('t', 'n')
+    if t == 'inlineStr':
+        return ''.join(x.text or '' for x in c.iter(f'{{{XLSX_NS["main"]}}}t'))
+    v = c.find('main:v', XLSX_NS)
+    if v is None or v.text is None:
+        return ''
+    if t == 's':
+        return shared_strings[int(v.text)]
+    if t == 'n' and re.fullmatch(r'-?\d+\.0', v.text):
+        return v.text[:-2]  # an integer stored as a float, e.g. '12.0'
+    return v.text
+
+
+def summarize_sample_sheet(file: str) -> SampleSheetSummary:
+    """
+    See IO.scan_sample_sheet(), memory is bounded by the number of samples and columns, not of rows or cells
+    """
+    encoding_errors = EncodingErrors()
+    rows = iter_sample_sheet_rows(file=file, encoding_errors=encoding_errors)
+
+    header = next(rows, (0, []))[1]
+    ret = SampleSheetSummary(file=file, columns=[h.strip() for h in header])
+    metadata = ret.columns[1:]
+    declared = {}
+    numeric = {c: True for c in metadata}
+    has_values = {c: False for c in metadata}
+    seen = set()
+
+    for number, row in rows:
+        first = row[0].strip() if len(row) > 0 else ''
+        if first.lower() == Q2_TYPES_DIRECTIVE:
+            declared = {c: t.strip() for c, t in zip(metadata, row[1:]) if t.strip() != ''}
+            continue
+        if first.startswith('#'):
+            continue
+        ret.n_rows += 1
+
+        if SAMPLE_ID_PATTERN.match(first) is None:
+            ret.n_bad_ids += 1
+            if len(ret.bad_ids) < MAX_EXAMPLES:
+                ret.bad_ids.append(row[0] if len(row) > 0 else '')
+        if first in seen:
+            ret.n_duplicate_rows += 1
+            if len(ret.duplicate_ids) < MAX_EXAMPLES and first not in ret.duplicate_ids:
+                ret.duplicate_ids.append(first)
+        else:
+            seen.add(first)
+            ret.sample_ids.append(first)
+
+        for i, cell in enumerate(row):
+            if CONTROL_CHARACTERS.search(cell) is not None:
+                ret.n_bad_cells += 1
+                if len(ret.bad_cells) < MAX_EXAMPLES:
+                    column = ret.columns[i] if i < len(ret.columns) else str(i + 1)
+                    ret.bad_cells.append(f'row {number}, column "{column}"')
+            if 0 < i < len(ret.columns) and cell.strip() != '':
+                has_values[ret.columns[i]] = True
+                numeric[ret.columns[i]] = numeric[ret.columns[i]] and is_number(cell)
+
+    for c in metadata:
+        if c in declared:
+            ret.column_types[c] = declared[c]
+        elif not has_values[c]:
+            ret.column_types[c] = 'empty'
+        else:
+            ret.column_types[c] = 'numeric' if numeric[c] else 'categorical'
+    ret.n_encoding_error_lines = encoding_errors.n
+    ret.encoding_error_lines = encoding_errors.lines
+    return ret
+
+
+def is_number(text: str) -> bool:
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return text.strip().lower() not in ['nan', 'inf', '-inf', 'infinity', '-infinity']
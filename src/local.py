@@ -0,0 +1,119 @@
+import os
+import io
+import shlex
+import signal
+import shutil
+import subprocess
+from os.path import expanduser, join, isdir, basename
+from contextlib import contextmanager
+from typing import List, Union, Optional, IO
+from invoke.runners import Result
+from invoke.exceptions import UnexpectedExit
+
+
+class LocalConnection:
+    """
+    Stands in for fabric's Connection when the jobs run on this machine, i.e. without SSH
+
+    Implements the part of the Connection interface used by the controller:
+    run() in bash from the home dir (or the dirs entered with cd()), put() and get() as plain file copies,
+    and sftp() for the streamed uploads of src/upload.py
+    """
+
+    cwds: List[str]
+    processes: List[subprocess.Popen]
+
+    def __init__(self):
+        self.cwds = [expanduser('~')]  # like an SSH login
+        self.processes = []
+
+    @contextmanager
+    def cd(self, path: str):
+        self.cwds.append(join(self.cwds[-1], path))  # an absolute path replaces the current dir
+        try:
+            yield
+        finally:
+            self.cwds.pop()
+
+    def run(
+            self,
+            command: str,
+            echo: bool = False,
+            warn: bool = False,
+            hide: bool = False,
+            in_stream: Optional[IO] = None) -> Result:
+        cwd = self.cwds[-1]
+        if echo:
+            print(f'\033[1;37mcd {cwd} && {command}\033[0m', flush=True)
+
+        p = subprocess.Popen(
+            ['bash', '-c', f'cd {shlex.quote(cwd)} && {command}'],  # fails like `cd` over SSH if the dir is missing
+            stdin=subprocess.DEVNULL if in_stream is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,  # so that close() can stop it together with its children
+            text=True)
+        self.processes.append(p)
+        stdout, stderr = p.communicate(input=None if in_stream is None else in_stream.read())
+        self.processes.remove(p)
+
+        if not hide:
+            print(stdout, end='', flush=True)
+            print(stderr, end='', flush=True)
+
+        result = Result(stdout=stdout, stderr=stderr, command=command, exited=p.returncode)
+        if p.returncode != 0 and not warn:
+            raise UnexpectedExit(result)
+        return result
+
+    def put(self, local: Union[str, IO], remote: str):
+        remote = self.__resolve(remote)
+        if isinstance(local, str):
+            if isdir(remote):
+                remote = join(remote, basename(local))
+            shutil.copy(local, remote)  # keeps the mode, like put() of fabric
+        else:
+            with open(remote, 'w') as fh:
+                shutil.copyfileobj(local, fh)
+
+    def get(self, remote: str, local: str):
+        shutil.copy(self.__resolve(remote), local)
+
+    def sftp(self) -> 'LocalSFTP':
+        return LocalSFTP(home=self.cwds[0])
+
+    def close(self):
+        """
+        Stops the commands still running, e.g. the blocking wait of the event watcher
+        """
+        for p in list(self.processes):
+            try:
+                os.killpg(p.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def __resolve(self, path: str) -> str:
+        return join(self.cwds[0], path)  # relative paths are from the home dir, like SFTP
+
+
+class LocalSFTP:
+    """
+    Stands in for paramiko's SFTPClient of the Connection, the files are opened on this machine
+    """
+
+    home: str
+
+    def __init__(self, home: str):
+        self.home = home
+
+    def open(self, path: str, mode: str) -> 'LocalSFTPFile':
+        return LocalSFTPFile(join(self.home, path), mode)
+
+    def posix_rename(self, oldpath: str, newpath: str):
+        os.replace(join(self.home, oldpath), join(self.home, newpath))
+
+
+class LocalSFTPFile(io.FileIO):
+
+    def set_pipelined(self, pipelined: bool = True):
+        pass  # nothing to acknowledge
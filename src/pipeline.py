@@ -0,0 +1,126 @@
+import re
+import itertools
+from typing import Dict, List, Union, Optional, Any
+
+
+DOWNSTREAM_KEYS = [  # parameters which only change the plots and statistics after denoising and classification
+    'beta-diversity-feature-level',
+    'heatmap-read-fraction',
+    'n-taxa-barplot',
+    'colormap',
+    'invert-colors',
+    'publication-figure',
+    'skip-differential-abundance',
+    'differential-abundance-p-value',
+    'min-abundance-per-group',
+]
+SHARD_DIR_PREFIX = 'shard-'  # the shard runs are in <outdir>/shard-1, <outdir>/shard-2, ...
+APPEND_DIR_PREFIX = 'append-'  # the runs of appended samples are in <outdir>/append-<timestamp>
+QUICK_LOOK_DIR_PREFIX = 'quick-look-'  # the runs on a subsample of the reads are in <outdir>/quick-look-<reads>
+RESUME_STAGES = [  # in the order the pipeline runs them, each with the semantic types of the artifacts it ends with
+    ('Denoising', ['FeatureTable[Frequency]', 'FeatureData[Sequence]']),
+    ('Classification', ['FeatureData[Taxonomy]']),
+    ('Phylogeny', ['Phylogeny[Rooted]']),
+    ('Diversity', ['DistanceMatrix']),
+]
+LAST_STAGE = 'Plotting'  # only visualizations and tables after all artifacts
+START_STAGE_OPTION = 'start-stage'  # of a pipeline release which can start at a stage from the outputs of the earlier ones
+STOP_STAGE_OPTION = 'stop-stage'  # of a pipeline release which can stop after a stage
+STAGE_OPTIONS = [START_STAGE_OPTION, STOP_STAGE_OPTION]  # set by the app for each run, not in the form
+SWEEP_START_STAGE = 'Diversity'  # the first stage which the DOWNSTREAM_KEYS change
+PER_SAMPLE_STAGE = 'Denoising'  # the last stage run on each sample separately, by the shards and appended samples
+MERGED_START_STAGE = 'Classification'  # the first stage run over all samples, after merging the denoised ones
+
+
+def expand_grid(
+        parameters: Dict[str, Union[str, bool]],
+        sweep: Dict[str, List[str]]) -> List[Dict[str, Union[str, bool]]]:
+    """
+    One set of parameters per combination of the swept values, each with its own outdir under the given outdir,
+    the first combination (first value of every swept key) is the upstream run the others start from
+    """
+    for key in sweep.keys():
+        assert key in DOWNSTREAM_KEYS, f'"{key}" is not a downstream parameter, it cannot be swept'
+        assert type(parameters.get(key)) is str, f'"{key}" is not a parameter with values in this mode'
+        assert len(sweep[key]) > 0, f'No values given for "{key}"'
+
+    keys = list(sweep.keys())
+    ret = []
+    for values in itertools.product(*[sweep[k] for k in keys]):
+        point = dict(parameters)
+        point.update(zip(keys, values))
+        name = '_'.join(f'{k}-{v}' for k, v in zip(keys, values))
+        point['outdir'] = f"{parameters['outdir']}/{re.sub(r'[^A-Za-z0-9._-]', '-', name)}"
+        ret.append(point)
+    return ret
+
+
+def parse_sweep_values(text: str) -> List[str]:
+    """
+    Comma-separated values, e.g. '0.9, 0.95,0.99' -> ['0.9', '0.95', '0.99']
+    """
+    return [v.strip() for v in text.split(',') if v.strip() != '']
+
+
+def shard_outdirs(outdir: str, n_shards: int) -> List[str]:
+    return [f'{outdir}/{SHARD_DIR_PREFIX}{i + 1}' for i in range(n_shards)]
+
+
+def is_shard_of(outdir: str, parent_outdir: str) -> bool:
+    prefix = f'{parent_outdir}/{SHARD_DIR_PREFIX}'
+    return outdir.startswith(prefix) and outdir[len(prefix):].isdigit()
+
+
+def resume_stage(types: List[str]) -> str:
+    """
+    :param types: semantic types of the intact artifacts of a run
+    :return: the first stage without all of its artifacts, where a rerun in the same outdir starts doing work
+    """
+    for stage, stage_types in RESUME_STAGES:
+        if not all(t in types for t in stage_types):
+            return stage
+    return LAST_STAGE
+
+
+def stage_choice(schema: Dict[str, Dict[str, Any]], option: str, stage: str) -> Optional[str]:
+    """
+    The value of a stage option of a pipeline release for one of its stages,
+    the choice of the option with the name of the stage, e.g. 'diversity' for '--start-stage {denoising,...,diversity}'
+
+    :param schema: of the release, see src/schema.py
+    :param option: START_STAGE_OPTION or STOP_STAGE_OPTION
+    :param stage: of RESUME_STAGES or LAST_STAGE
+    :return: None if the release does not have the option or cannot start (stop) at that stage
+    """
+    choices = schema.get(option, {}).get('choices', [])
+    matched = [c for c in choices if c.lower() == stage.lower()]
+    return matched[0] if len(matched) > 0 else None
+
+
+def parse_quick_look_reads(text: str) -> float:
+    """
+    The reads per sample of a quick look, a fraction of them if below 1, e.g. '10000' -> 10000.0, '0.01' -> 0.01
+    """
+    try:
+        reads = float(text)
+    except ValueError:
+        raise AssertionError(f'"{text}" is neither a number of reads nor a fraction of them')
+    assert reads > 0, f'"{text}" is neither a number of reads nor a fraction of them'
+    assert reads < 1 or reads == int(reads), f'"{text}" is not a whole number of reads'
+    return reads
+
+
+def format_quick_look_reads(reads: float) -> str:
+    """
+    Without an exponent, as a whole number of reads or a fraction, e.g. 1000000.0 -> '1000000', 0.00001 -> '0.00001'
+    """
+    return str(int(reads)) if reads >= 1 else f'{reads:.10f}'.rstrip('0')
+
+
+def quick_look_parameters(parameters: Dict[str, Union[str, bool]], reads: float) -> Dict[str, Union[str, bool]]:
+    """
+    The same parameters, with the outdir and the fq-dir of the subsample under the outdir, e.g. 'output/quick-look-10000',
+    one per number of reads, so that the pipeline does not take the outputs of another subsample as done
+    """
+    outdir = f"{parameters['outdir']}/{QUICK_LOOK_DIR_PREFIX}{format_quick_look_reads(reads)}"
+    return {**parameters, 'outdir': outdir, 'fq-dir': f'{outdir}/fastq'}
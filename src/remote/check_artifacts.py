@@ -0,0 +1,77 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only
+
+usage: python check_artifacts.py --outdir <dir> --remove-broken <yes|no>
+
+Checks every artifact (.qza and .qzv) of the outdir, without those of the nested outdirs of sweeps and shards:
+an artifact is intact if it is a complete zip archive, all of its members match their CRC,
+and it has the metadata.yaml of a QIIME 2 artifact
+
+Prints a JSON with the semantic type of each intact artifact by its path relative to the outdir, and the broken ones,
+which the pipeline would otherwise take as done when the run is resumed, deleted with `--remove-broken yes`
+"""
+import os
+import json
+import zipfile
+import argparse
+
+
+EXIT_CODE_TXT = 'exit-code.txt'  # the same as in src/controller.py
+COMMAND_TXT = 'command.txt'
+ARTIFACT_SUFFIXES = ('.qza', '.qzv')
+
+
+def is_outdir(path):
+    return os.path.exists(os.path.join(path, COMMAND_TXT)) or os.path.exists(os.path.join(path, EXIT_CODE_TXT))
+
+
+def find_artifacts(outdir):
+    ret = []
+    for dirpath, dirnames, filenames in os.walk(outdir):
+        dirnames[:] = sorted(d for d in dirnames if not is_outdir(os.path.join(dirpath, d)))
+        for f in sorted(filenames):
+            if f.endswith(ARTIFACT_SUFFIXES):
+                ret.append(os.path.relpath(os.path.join(dirpath, f), outdir))
+    return ret
+
+
+def check_artifact(path):
+    """
+    :return: the semantic type of the artifact, e.g. 'FeatureTable[Frequency]', or None if it is broken
+    """
+    try:
+        with zipfile.ZipFile(path) as z:
+            if z.testzip() is not None:  # the first member with a bad CRC
+                return None
+            for name in z.namelist():
+                if name.count('/') == 1 and name.endswith('/metadata.yaml'):  # <uuid>/metadata.yaml
+                    for line in z.read(name).decode().splitlines():
+                        if line.startswith('type:'):
+                            return line[len('type:'):].strip()
+    except (OSError, zipfile.BadZipFile, EOFError):  # e.g. truncated while it was written
+        pass
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--outdir', required=True)
+    parser.add_argument('--remove-broken', default='no')
+    args = parser.parse_args()
+
+    assert os.path.isdir(args.outdir), f'"{args.outdir}" is not a directory'
+    intact, broken = {}, []
+    for path in find_artifacts(args.outdir):
+        type_ = check_artifact(os.path.join(args.outdir, path))
+        if type_ is not None:
+            intact[path] = type_
+        else:
+            broken.append(path)
+            if args.remove_broken == 'yes':
+                os.remove(os.path.join(args.outdir, path))
+
+    print(json.dumps({'intact': intact, 'broken': broken}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only,
+from the remote root dir, either sent by the app or installed in the crontab
+
+usage: python compact_runs.py --days <n> --threads <n> --jobs <n> --min-mb <mb> --temporary <json> --dry-run {yes,no}
+
+Finds the outdirs of the runs which finished successfully at least `days` ago, i.e. with an exit-code.txt of 0 that old,
+deletes the temporary paths the pipeline leaves in them (`temporary`, relative to each outdir) and compresses
+their bulky text outputs (COMPRESS_SUFFIXES, at least `min-mb`) in place to .gz, `jobs` outdirs at a time,
+each with `threads` / `jobs` threads of pigz, or with the gzip module where pigz is not installed
+
+The inputs of a run which are in its outdir, e.g. the uploaded sample sheet, are read from its PARAMETERS_JSON
+and never compressed, the runs without one are skipped, their inputs are unknown
+
+Prints a JSON list with the bytes of each outdir before and after and the paths deleted and compressed,
+the outdirs compacted before are skipped, with `dry-run` nothing is changed and the paths are only listed
+"""
+import os
+import json
+import time
+import gzip
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+
+EXIT_CODE_TXT = 'exit-code.txt'  # the same as in src/controller.py
+COMMAND_TXT = 'command.txt'
+PARAMETERS_JSON = 'parameters.json'
+KEEP_FILES = [  # read by the app after the run, never compressed
+    EXIT_CODE_TXT, COMMAND_TXT, PARAMETERS_JSON, 'progress.txt', 'progress-times.tsv', 'job-stats.json', 'fingerprint.txt',
+]
+PARTIAL_SUFFIX = '.gz.partial'  # left by a compression of this script which crashed
+COMPRESS_SUFFIXES = ['.tsv', '.csv', '.txt', '.fasta', '.fa', '.fna', '.fastq', '.fq', '.sam', '.log', '.nwk', '.newick']
+COMPACTED_TXT = '.compacted'  # marks an outdir compacted since its run finished
+SKIPPED_DIRS = ['.qiime2app']  # the app's own state under the remote root dir
+
+
+def find_finished_outdirs(root, min_age_seconds, now):
+    ret = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS)
+        if EXIT_CODE_TXT not in filenames or PARAMETERS_JSON not in filenames:
+            continue
+        with open(os.path.join(dirpath, EXIT_CODE_TXT)) as fh:
+            if fh.read().strip() != '0':
+                continue  # failed or killed, to be resumed as it is
+        exit_code_mtime = os.path.getmtime(os.path.join(dirpath, EXIT_CODE_TXT))
+        if now - exit_code_mtime < min_age_seconds:
+            continue
+        compacted = os.path.join(dirpath, COMPACTED_TXT)
+        if os.path.exists(compacted) and os.path.getmtime(compacted) >= exit_code_mtime:
+            continue
+        ret.append(os.path.relpath(dirpath, root))
+    return ret
+
+
+def is_outdir(path):
+    """
+    The outdir of another run, e.g. of a sweep or a shard, has its own retention
+    """
+    return os.path.exists(os.path.join(path, COMMAND_TXT)) or os.path.exists(os.path.join(path, EXIT_CODE_TXT))
+
+
+def walk_own_files(outdir):
+    """
+    :return: (dirpath, dirnames, filenames) like os.walk(), without the nested outdirs
+    """
+    for dirpath, dirnames, filenames in os.walk(outdir):
+        dirnames[:] = [d for d in dirnames if not is_outdir(os.path.join(dirpath, d))]
+        yield dirpath, dirnames, filenames
+
+
+def disk_usage(outdir):
+    total = 0
+    for dirpath, _, filenames in walk_own_files(outdir):
+        for f in filenames:
+            path = os.path.join(dirpath, f)
+            if not os.path.islink(path):
+                total += os.path.getsize(path)
+    return total
+
+
+def input_paths(outdir, root):
+    """
+    :return: the absolute paths of the parameters of the run which are in its outdir, e.g. the sample sheet
+    """
+    with open(os.path.join(outdir, PARAMETERS_JSON)) as fh:
+        parameters = json.load(fh)['parameters']
+    ret = []
+    for value in parameters.values():
+        if type(value) is not str or value == '':
+            continue
+        path = os.path.abspath(os.path.join(root, value))  # relative to the remote root dir
+        if path.startswith(os.path.abspath(outdir) + os.sep):
+            ret.append(path)
+    return ret
+
+
+def is_under(path, paths):
+    path = os.path.abspath(path)
+    return any(path == p or path.startswith(p + os.sep) for p in paths)
+
+
+def find_temporary(outdir, temporary, inputs):
+    ret = []
+    for t in temporary:
+        path = os.path.normpath(os.path.join(outdir, t))
+        if not path.startswith(os.path.normpath(outdir) + os.sep):
+            continue  # not in the outdir, e.g. '..'
+        if os.path.lexists(path) and not is_under(path, inputs) and not is_outdir(path):
+            ret.append(path)
+    for dirpath, _, filenames in walk_own_files(outdir):
+        ret += [os.path.join(dirpath, f) for f in filenames if f.endswith(PARTIAL_SUFFIX)]
+    return ret
+
+
+def delete(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def find_bulky_files(outdir, min_bytes, excluded):
+    ret = []
+    for dirpath, _, filenames in walk_own_files(outdir):
+        for f in filenames:
+            path = os.path.join(dirpath, f)
+            if dirpath == outdir and f in KEEP_FILES:
+                continue
+            if os.path.islink(path) or not f.lower().endswith(tuple(COMPRESS_SUFFIXES)) or is_under(path, excluded):
+                continue
+            if os.path.getsize(path) >= min_bytes:
+                ret.append(path)
+    return ret
+
+
+def compress(path, threads):
+    """
+    Replaces the file with <path>.gz, keeping its mode and modification time
+    """
+    if shutil.which('pigz') is not None:
+        subprocess.run(['pigz', '--processes', str(threads), '--force', path], check=True)
+        return
+    tmp = f'{path}{PARTIAL_SUFFIX}'  # a crash leaves no truncated .gz in place of the original
+    with open(path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+        shutil.copyfileobj(src, dst, length=2 ** 20)
+    shutil.copystat(path, tmp)
+    os.replace(tmp, f'{path}.gz')
+    os.remove(path)
+
+
+def compact(outdir, threads, min_bytes, temporary, root='.', dry_run=False):
+    """
+    :param temporary: the paths the pipeline leaves in the outdir, relative to it
+    :param root: the remote root dir, which the paths of the parameters are relative to
+    """
+    before = disk_usage(outdir)
+    inputs = input_paths(outdir, root=root)
+    deleted = find_temporary(outdir, temporary=temporary, inputs=inputs)
+    files = find_bulky_files(  # the temporary paths are deleted first
+        outdir, min_bytes=min_bytes, excluded=inputs + [os.path.abspath(p) for p in deleted])
+    if not dry_run:
+        for path in deleted:
+            delete(path)
+        for path in files:
+            compress(path, threads=threads)
+        with open(os.path.join(outdir, COMPACTED_TXT), 'w'):
+            pass
+    return {
+        'outdir': outdir,
+        'before': before,
+        'after': before if dry_run else disk_usage(outdir),
+        'deleted': [os.path.relpath(p, outdir) for p in deleted],
+        'compressed': [os.path.relpath(p, outdir) for p in files],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--min-mb', type=float, default=1)
+    parser.add_argument('--temporary', type=json.loads, default=[], help='JSON list of paths relative to each outdir')
+    parser.add_argument('--dry-run', choices=['yes', 'no'], default='no')
+    args = parser.parse_args()
+
+    outdirs = find_finished_outdirs(root='.', min_age_seconds=args.days * 86400, now=time.time())
+    jobs = max(1, min(args.jobs, len(outdirs)))
+    threads = max(1, args.threads // jobs)  # the thread budget is shared by the outdirs compacted in parallel
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:  # pigz and zlib release the GIL
+        futures = [
+            executor.submit(compact, o, threads, int(args.min_mb * 2 ** 20), args.temporary, '.', args.dry_run == 'yes')
+            for o in outdirs]
+        print(json.dumps([f.result() for f in futures]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Runs on the server in the environment activated by .profile, standard library and h5py of the qiime2 environment
+
+usage: python compare_runs.py --outdirs <json> --level <feature|species|genus|...> --top <n>
+
+Reads the feature table and the taxonomy of each run, at the same relative path in every outdir,
+and prints a compact JSON summary: the richness of each run, the relative abundance of the taxa
+which differ the most between the runs, and the Bray-Curtis distances between the runs
+
+The artifacts are recognized by the semantic type in their metadata.yaml, not by file name
+"""
+import os
+import json
+import zipfile
+import argparse
+
+
+TABLE_TYPE = 'FeatureTable[Frequency]'
+TAXONOMY_TYPE = 'FeatureData[Taxonomy]'
+LEVELS = ['kingdom', 'phylum', 'class', 'order', 'family', 'genus', 'species']  # the ranks of the taxonomy strings
+
+
+def semantic_type(qza):
+    try:
+        with zipfile.ZipFile(qza) as z:
+            for name in z.namelist():
+                if name.count('/') == 1 and name.endswith('/metadata.yaml'):  # <uuid>/metadata.yaml
+                    for line in z.read(name).decode().splitlines():
+                        if line.startswith('type:'):
+                            return line[len('type:'):].strip()
+    except (OSError, zipfile.BadZipFile):
+        pass
+    return None
+
+
+def find_artifacts(outdir, types):
+    ret = {}
+    for root, _, files in os.walk(outdir):
+        for f in files:
+            if f.endswith('.qza'):
+                path = os.path.join(root, f)
+                type_ = semantic_type(path)
+                if type_ in types:
+                    ret[os.path.relpath(path, outdir)] = type_
+    return ret
+
+
+def read_member(qza, name):
+    with zipfile.ZipFile(qza) as z:
+        for member in z.namelist():
+            if member.split('/', 1)[-1] == f'data/{name}':
+                return z.read(member)
+    raise FileNotFoundError(f'"data/{name}" not in "{qza}"')
+
+
+def read_feature_table(qza):
+    """
+    :return: {feature: {sample: count}} of the non-zero counts, from the CSR matrix of the BIOM (HDF5) table
+    """
+    import io
+    import h5py
+    with h5py.File(io.BytesIO(read_member(qza, 'feature-table.biom')), 'r') as h5:
+        features = [x.decode() if isinstance(x, bytes) else x for x in h5['observation/ids'][:]]
+        samples = [x.decode() if isinstance(x, bytes) else x for x in h5['sample/ids'][:]]
+        data = h5['observation/matrix/data'][:]
+        indices = h5['observation/matrix/indices'][:]
+        indptr = h5['observation/matrix/indptr'][:]
+    table = {}
+    for i, feature in enumerate(features):
+        row = {samples[indices[j]]: float(data[j]) for j in range(indptr[i], indptr[i + 1]) if data[j] != 0}
+        if len(row) > 0:
+            table[feature] = row
+    return table
+
+
+def read_taxonomy(qza):
+    """
+    :return: {feature: taxon string}
+    """
+    ret = {}
+    for line in read_member(qza, 'taxonomy.tsv').decode().splitlines()[1:]:  # skip the header
+        fields = line.split('\t')
+        if len(fields) >= 2:
+            ret[fields[0]] = fields[1]
+    return ret
+
+
+def taxon_at_level(taxon, level):
+    ranks = [r.strip() for r in taxon.split(';') if r.strip() != '']
+    n = LEVELS.index(level) + 1
+    return ';'.join(ranks[:n]) if len(ranks) >= n else ';'.join(ranks + ['Unassigned'])
+
+
+def richness(table):
+    """
+    :return: the number of features, and the mean number of features per sample
+    """
+    per_sample = {}
+    for row in table.values():
+        for sample in row:
+            per_sample[sample] = per_sample.get(sample, 0) + 1
+    mean = sum(per_sample.values()) / len(per_sample) if len(per_sample) > 0 else 0
+    return len(table), mean, len(per_sample)
+
+
+def relative_abundance(table, taxonomy, level):
+    """
+    :return: {taxon: fraction of all reads of the run}, pooled over its samples
+    """
+    counts = {}
+    for feature, row in table.items():
+        key = feature if level == 'feature' else taxon_at_level(taxonomy.get(feature, 'Unassigned'), level)
+        counts[key] = counts.get(key, 0) + sum(row.values())
+    total = sum(counts.values())
+    return {k: v / total for k, v in counts.items()} if total > 0 else {}
+
+
+def bray_curtis(a, b):
+    keys = set(a) | set(b)
+    total = sum(a.get(k, 0) + b.get(k, 0) for k in keys)
+    if total == 0:
+        return 0.0
+    return sum(abs(a.get(k, 0) - b.get(k, 0)) for k in keys) / total
+
+
+def top_deltas(abundances, top):
+    """
+    :return: the `top` taxa with the largest range of relative abundance across the runs, largest first
+    """
+    taxa = set(t for a in abundances for t in a)
+    spread = {t: max(a.get(t, 0) for a in abundances) - min(a.get(t, 0) for a in abundances) for t in taxa}
+    return sorted(taxa, key=lambda t: (-spread[t], t))[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--outdirs', required=True)
+    parser.add_argument('--level', default='genus')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    outdirs = json.loads(args.outdirs)
+    artifacts = [find_artifacts(o, types=[TABLE_TYPE, TAXONOMY_TYPE]) for o in outdirs]
+    common = set.intersection(*[set(a) for a in artifacts])
+    tables = sorted(p for p in common if artifacts[0][p] == TABLE_TYPE)
+    taxonomies = sorted(p for p in common if artifacts[0][p] == TAXONOMY_TYPE)
+    assert len(tables) > 0, f'No feature table found in all of {outdirs}'
+    assert args.level == 'feature' or len(taxonomies) > 0, f'No taxonomy found in all of {outdirs}'
+
+    runs, abundances = [], []
+    for outdir in outdirs:
+        table = read_feature_table(os.path.join(outdir, tables[0]))
+        taxonomy = read_taxonomy(os.path.join(outdir, taxonomies[0])) if len(taxonomies) > 0 else {}
+        n_features, mean_richness, n_samples = richness(table)
+        runs.append({
+            'outdir': outdir,
+            'samples': n_samples,
+            'features': n_features,
+            'mean_richness': round(mean_richness, 1),
+        })
+        abundances.append(relative_abundance(table, taxonomy, args.level))
+
+    taxa = top_deltas(abundances, top=args.top)
+    print(json.dumps({
+        'table': tables[0],
+        'level': args.level,
+        'runs': runs,
+        'taxa': taxa,
+        'abundance': [[round(a.get(t, 0), 5) for t in taxa] for a in abundances],  # runs x taxa
+        'distances': [[round(bray_curtis(a, b), 4) for b in abundances] for a in abundances],
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Runs on the server in the environment activated by .profile, standard library and Pillow of the qiime2 environment
+
+usage: python figures.py --outdir <dir> [--thumbnails <json> --size <px>]
+
+Without --thumbnails, prints a JSON list of the figures (.png, .jpg, .svg, .pdf) of the outdir,
+without those of the nested outdirs of sweeps and shards: the path relative to the outdir, the size and the mtime
+
+With --thumbnails, a JSON list of such paths, prints a JSON of the base64 PNG thumbnail of each, at most `size` pixels wide and high,
+made with Pillow (a dependency of matplotlib), or without Pillow the image itself if it is a small PNG or JPEG,
+None for the figures which cannot be thumbnailed, e.g. PDF
+"""
+import os
+import io
+import json
+import base64
+import argparse
+
+
+EXIT_CODE_TXT = 'exit-code.txt'  # the same as in src/controller.py
+COMMAND_TXT = 'command.txt'
+FIGURE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.svg', '.pdf')
+RASTER_SUFFIXES = ('.png', '.jpg', '.jpeg')
+RAW_MAX_BYTES = 2 ** 20  # of a figure sent as it is in place of its thumbnail when Pillow is missing
+
+
+def is_outdir(path):
+    return os.path.exists(os.path.join(path, COMMAND_TXT)) or os.path.exists(os.path.join(path, EXIT_CODE_TXT))
+
+
+def find_figures(outdir):
+    ret = []
+    for dirpath, dirnames, filenames in os.walk(outdir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.') and not is_outdir(os.path.join(dirpath, d)))
+        for f in sorted(filenames):
+            if f.lower().endswith(FIGURE_SUFFIXES):
+                path = os.path.join(dirpath, f)
+                stat = os.stat(path)
+                ret.append({
+                    'path': os.path.relpath(path, outdir),
+                    'bytes': stat.st_size,
+                    'mtime': stat.st_mtime_ns,
+                })
+    return ret
+
+
+def thumbnail(path, size):
+    """
+    :return: the PNG or JPEG bytes of the thumbnail, or None
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+
+    if Image is not None and path.lower().endswith(RASTER_SUFFIXES):
+        with Image.open(path) as im:
+            im.thumbnail((size, size))
+            if im.mode not in ('RGB', 'RGBA', 'L'):
+                im = im.convert('RGBA')
+            buf = io.BytesIO()
+            im.save(buf, format='PNG', optimize=True)
+            return buf.getvalue()
+
+    if path.lower().endswith(RASTER_SUFFIXES) and os.path.getsize(path) <= RAW_MAX_BYTES:
+        with open(path, 'rb') as fh:
+            return fh.read()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--outdir', required=True)
+    parser.add_argument('--thumbnails', default='')
+    parser.add_argument('--size', type=int, default=256)
+    args = parser.parse_args()
+
+    assert os.path.isdir(args.outdir), f'"{args.outdir}" is not a directory'
+    if args.thumbnails == '':
+        print(json.dumps(find_figures(args.outdir)))
+        return
+
+    outdir = os.path.abspath(args.outdir)
+    ret = {}
+    for path in json.loads(args.thumbnails):
+        full = os.path.abspath(os.path.join(outdir, path))
+        assert full.startswith(outdir + os.sep), f'"{path}" is outside the outdir'
+        try:
+            data = thumbnail(full, size=args.size)
+        except Exception:  # e.g. a figure still being written
+            data = None
+        ret[path] = base64.b64encode(data).decode() if data is not None else None
+    print(json.dumps(ret))
+
+
+if __name__ == '__main__':
+    main()
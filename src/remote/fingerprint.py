@@ -0,0 +1,125 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only
+
+usage: python fingerprint.py --payloads <json> --fq-dir <dir> --suffixes <json> --sample-ids-fd <fd>
+                             --registry-dir <dir> --cache <json>
+
+The sample IDs are read as a JSON list from the file descriptor `sample-ids-fd`, not from an argument,
+which the IDs of a sample sheet with thousands of samples would make longer than the kernel allows (E2BIG)
+
+Fingerprints each run from the client's payload (parameters, sample sheet checksum, pipeline version)
+and the SHA-256 of the input FASTQ files shared by the runs, then looks it up among the finished runs
+
+Prints a list of {"fingerprint": ..., "outdir": <outdir of an identical finished run, or null>}, one per payload
+"""
+import os
+import json
+import fcntl
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+HASH_CHUNK = 2 ** 20
+HASH_THREADS = 4
+FINGERPRINT_TXT = 'fingerprint.txt'  # written into the outdir by each job
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def find_fastqs(fq_dir, suffixes, sample_ids):
+    """
+    The files of the samples in the sample sheet, or all files with the suffixes
+    when none of the sample IDs match a file (e.g. the IDs are not in the first column)
+    """
+    if not os.path.isdir(fq_dir):
+        return []  # the pipeline reports it, the run is never registered
+    names = sorted(os.listdir(fq_dir))
+    all_ = [n for n in names if any(n.endswith(s) for s in suffixes)]
+    ids = set(sample_ids)
+    matched = [n for n in all_ if any(n[:-len(s)] in ids for s in suffixes if n.endswith(s))]
+    return matched if len(matched) > 0 else all_
+
+
+def hash_fastqs(fq_dir, names, cache_json):
+    """
+    Checksums are cached by absolute path, size and mtime, so resubmissions do not re-read the reads
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(cache_json)), exist_ok=True)
+    with open(cache_json + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        try:
+            with open(cache_json) as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            cache = {}
+
+        paths = {n: os.path.abspath(os.path.join(fq_dir, n)) for n in names}
+        keys = {}
+        for n, path in paths.items():
+            st = os.stat(path)
+            keys[n] = f'{st.st_size}:{st.st_mtime_ns}'
+
+        todo = [n for n in names if cache.get(paths[n], {}).get('key') != keys[n]]
+        with ThreadPoolExecutor(max_workers=HASH_THREADS) as executor:  # hashlib releases the GIL
+            for n, checksum in zip(todo, executor.map(lambda n: hash_file(paths[n]), todo)):
+                cache[paths[n]] = {'key': keys[n], 'sha256': checksum}
+
+        with open(cache_json + '.tmp', 'w') as fh:
+            json.dump(cache, fh)
+        os.replace(cache_json + '.tmp', cache_json)
+
+    return {n: cache[paths[n]]['sha256'] for n in names}
+
+
+def lookup(registry_dir, fingerprint):
+    try:
+        with open(os.path.join(registry_dir, fingerprint)) as fh:
+            outdir = fh.read().strip()
+    except OSError:
+        return None
+    try:  # the finished run may have been deleted or rerun with other inputs since
+        with open(os.path.join(outdir, FINGERPRINT_TXT)) as fh:
+            return outdir if fh.read().strip() == fingerprint else None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--payloads', required=True)
+    parser.add_argument('--fq-dir', required=True)
+    parser.add_argument('--suffixes', required=True)
+    parser.add_argument('--sample-ids-fd', type=int, required=True)
+    parser.add_argument('--registry-dir', required=True)
+    parser.add_argument('--cache', required=True)
+    args = parser.parse_args()
+
+    with os.fdopen(args.sample_ids_fd) as fh:
+        sample_ids = json.load(fh)
+    names = find_fastqs(
+        fq_dir=args.fq_dir,
+        suffixes=json.loads(args.suffixes),
+        sample_ids=sample_ids)
+    fastqs = hash_fastqs(fq_dir=args.fq_dir, names=names, cache_json=args.cache)
+
+    ret = []
+    for payload in json.loads(args.payloads):
+        payload['fastq_sha256'] = fastqs
+        fingerprint = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        ret.append({
+            'fingerprint': fingerprint,
+            'outdir': lookup(registry_dir=args.registry_dir, fingerprint=fingerprint),
+        })
+    print(json.dumps(ret))
+
+
+if __name__ == '__main__':
+    main()
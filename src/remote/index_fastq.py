@@ -0,0 +1,147 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only
+
+usage: python index_fastq.py --fq-dir <dir> --fq1-suffix <suffix> [--fq2-suffix <suffix>] --cache <json>
+
+Lists the fq dir once, or takes the listing from the cache while the mtime of the dir is unchanged,
+and indexes the sample names by the suffixes of their R1 (and R2) files
+
+Prints the paired sample names, and what would break a run:
+samples with only one of the read files, the same sample and read in more than one file (e.g. .fastq.gz and .fastq),
+and the FASTQ files matching none of the suffixes, with the suffixes that would match most of them
+"""
+import os
+import re
+import json
+import fcntl
+import argparse
+
+
+FASTQ_NAME = re.compile(r'\.(fastq|fq)(\.gz)?$', re.IGNORECASE)
+READ_SUFFIX = re.compile(r'[._-]R?([12])(_001)?\.(fastq|fq)(\.gz)?$', re.IGNORECASE)  # e.g. _R1.fastq.gz, _R2_001.fq.gz
+MAX_EXAMPLES = 10  # of the unmatched files
+
+
+def list_fq_dir(fq_dir, cache_json):
+    """
+    One listing of a dir with tens of thousands of files is slow on network file systems,
+    the cache entry of each dir is valid while its mtime (changed by adding, removing or renaming files) is the same
+    """
+    fq_dir = os.path.abspath(fq_dir)
+    mtime_ns = os.stat(fq_dir).st_mtime_ns
+    os.makedirs(os.path.dirname(os.path.abspath(cache_json)), exist_ok=True)
+    with open(cache_json + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(cache_json) as fh:
+                cache = json.load(fh)
+        except (OSError, ValueError):
+            cache = {}
+
+        entry = cache.get(fq_dir)
+        if entry is not None and entry['mtime_ns'] == mtime_ns:
+            return entry['names'], True
+
+        with os.scandir(fq_dir) as it:
+            names = sorted(e.name for e in it if FASTQ_NAME.search(e.name) and not e.is_dir())
+        cache[fq_dir] = {'mtime_ns': mtime_ns, 'names': names}
+        with open(cache_json + '.tmp', 'w') as fh:
+            json.dump(cache, fh)
+        os.replace(cache_json + '.tmp', cache_json)
+        return names, False
+
+
+def base_suffix(suffix):
+    """
+    The suffix without the FASTQ extension, e.g. '_R1' of '_R1.fastq.gz', to find the same read in other formats
+    """
+    return FASTQ_NAME.sub('', suffix)
+
+
+def build_index(names, suffixes):
+    """
+    :param suffixes: [fq1 suffix] or [fq1 suffix, fq2 suffix]
+    :return: {sample: [file of each suffix, None where missing]}, {sample: other files of the same read}, unmatched files
+    """
+    index, duplicates, unmatched = {}, {}, []
+    bases = [base_suffix(s) for s in suffixes]
+    for name in names:
+        matched = False
+        for i, suffix in enumerate(suffixes):
+            if name.endswith(suffix):
+                index.setdefault(name[:-len(suffix)], [None] * len(suffixes))[i] = name
+                matched = True
+                break
+        if matched:
+            continue
+        stem = FASTQ_NAME.sub('', name)
+        for base in bases:  # the same read with another extension
+            if base != '' and stem.endswith(base):
+                duplicates.setdefault(stem[:-len(base)], []).append(name)
+                matched = True
+                break
+        if not matched:
+            unmatched.append(name)
+    unmatched += sorted(f for s, files in duplicates.items() if s not in index for f in files)  # not duplicates of anything
+    duplicates = {s: files for s, files in duplicates.items() if s in index}
+    return index, duplicates, unmatched
+
+
+def paired_samples(index):
+    return sorted(s for s, files in index.items() if None not in files)
+
+
+def suggest_suffixes(names, n_suffixes):
+    """
+    :return: the suffixes matching the most files, e.g. ['_R1_001.fastq.gz', '_R2_001.fastq.gz'], or None
+    """
+    counts = {}
+    for name in names:
+        if n_suffixes == 2:
+            m = READ_SUFFIX.search(name)
+            if m is None or m.group(1) != '1':
+                continue
+            suffix = name[m.start():]
+        else:
+            suffix = FASTQ_NAME.search(name).group(0)
+        counts[suffix] = counts.get(suffix, 0) + 1
+    if len(counts) == 0:
+        return None
+    fq1 = max(counts, key=lambda s: (counts[s], s))
+    if n_suffixes == 1:
+        return [fq1]
+    i = READ_SUFFIX.search(fq1).start(1)
+    return [fq1, fq1[:i] + '2' + fq1[i + 1:]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fq-dir', required=True)
+    parser.add_argument('--fq1-suffix', required=True)
+    parser.add_argument('--fq2-suffix', default='')
+    parser.add_argument('--cache', required=True)
+    args = parser.parse_args()
+
+    assert os.path.isdir(args.fq_dir), f'"{args.fq_dir}" is not a directory'
+    suffixes = [s for s in [args.fq1_suffix, args.fq2_suffix] if s != '']
+    names, cached = list_fq_dir(args.fq_dir, cache_json=args.cache)
+    index, duplicates, unmatched = build_index(names, suffixes=suffixes)
+
+    suggested = suggest_suffixes(names, n_suffixes=len(suffixes))
+    if suggested is not None and len(paired_samples(build_index(names, suffixes=suggested)[0])) <= len(paired_samples(index)):
+        suggested = None  # the configured suffixes match as many samples
+
+    print(json.dumps({
+        'files': len(names),
+        'cached': cached,
+        'samples': paired_samples(index),
+        'unpaired': {s: [f for f in files if f is not None] for s, files in sorted(index.items()) if None in files},
+        'duplicates': duplicates,
+        'unmatched': len(unmatched),
+        'unmatched_examples': unmatched[:MAX_EXAMPLES],
+        'suggested_suffixes': suggested,
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,545 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only
+
+usage: python job_wrapper.py --stats <job-stats.json> --threads <n>
+                             [--samples <file> --sample-seconds <s>]
+                             [--reference-cache-dir <dir> --reference-cache-gb <gb>]
+                             [--placement <file> --pin-cpus <yes|no> --nice <n> --io-priority <best-effort|idle>
+                              --cgroup-memory-gb <gb>] -- <command...>
+
+Runs the command, passes its exit status through, and writes the wall time,
+peak memory, CPU time and I/O counters of the whole process tree to a JSON sidecar
+
+With a samples file, the CPU, RSS and disk I/O of the process tree are also sampled at a fixed interval,
+appended as fixed-size binary records (SAMPLE_FORMAT) that can be read while the job runs
+
+With a reference cache dir, the reference .qza arguments of the command are pointed at
+verified copies on node-local disk, shared by the jobs on the same host
+
+With a placement file, the command runs on `threads` CPUs not used by the other jobs on the host, at a lower
+CPU and I/O priority, and in a cgroup with memory and CPU limits where systemd allows it, see Placement
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import socket
+import struct
+import signal
+import hashlib
+import resource
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+REFERENCE_ARGS = ['--nb-classifier-qza', '--reference-sequence-qza', '--reference-taxonomy-qza']
+HASH_CHUNK = 2 ** 20
+SAMPLE_FORMAT = '<5f'  # elapsed seconds, CPU cores, RSS bytes, read bytes/s, write bytes/s
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def read_proc_io():
+    """
+    /proc/self/io also counts the I/O of the children which have been waited for
+    """
+    ret = {}
+    try:
+        with open('/proc/self/io') as fh:
+            for line in fh:
+                key, val = line.split(':')
+                ret[key] = int(val)
+    except (OSError, ValueError):
+        pass
+    return ret
+
+
+def read_proc_tree(root_pid):
+    """
+    :return: {pid: (cpu_ticks, rss_bytes, read_bytes, write_bytes)} of the root process and its descendants
+    """
+    procs = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as fh:
+                fields = fh.read().rsplit(')', 1)[1].split()  # after the command name, which may contain spaces
+        except (OSError, IndexError):
+            continue  # exited in between
+        procs[int(name)] = fields
+
+    children = {}
+    for pid, fields in procs.items():
+        children.setdefault(int(fields[1]), []).append(pid)
+
+    ret = {}
+    todo = [root_pid] if root_pid in procs else []
+    while len(todo) > 0:
+        pid = todo.pop()
+        todo += children.get(pid, [])
+        fields = procs[pid]
+        io = {}
+        try:
+            with open(f'/proc/{pid}/io') as fh:
+                for line in fh:
+                    key, val = line.split(':')
+                    io[key] = int(val)
+        except (OSError, ValueError):
+            pass
+        ret[pid] = (
+            int(fields[11]) + int(fields[12]),  # utime + stime
+            int(fields[21]) * PAGE_SIZE,
+            io.get('read_bytes', 0),
+            io.get('write_bytes', 0))
+    return ret
+
+
+class Sampler(threading.Thread):
+    """
+    Appends one record per interval, written in one call so that a reader sees whole records,
+    except maybe the last one
+
+    The CPU and I/O of a process are counted from the previous sample, or from its start if it is new,
+    the last interval of a process that exited in between is not counted
+
+    max_tree_rss is the peak of the summed RSS of the process tree over the samples,
+    None if no sample was taken, e.g. when the job ended within the first interval
+    """
+
+    def __init__(self, root_pid, samples_file, interval):
+        super().__init__(daemon=True)
+        self.root_pid = root_pid
+        self.samples_file = samples_file
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.max_tree_rss = None
+
+    def run(self):
+        start = prev_time = time.time()
+        prev = {}
+        with open(self.samples_file, 'wb', buffering=0) as fh:
+            while not self.stopped.wait(self.interval):
+                try:
+                    cur = read_proc_tree(self.root_pid)
+                except OSError:
+                    return  # no /proc, not Linux
+                now = time.time()
+                seconds = now - prev_time
+
+                def delta(i):
+                    return sum(v[i] - prev.get(pid, (0, 0, 0, 0))[i] for pid, v in cur.items())
+
+                rss = sum(v[1] for v in cur.values())
+                self.max_tree_rss = rss if self.max_tree_rss is None else max(self.max_tree_rss, rss)
+                fh.write(struct.pack(
+                    SAMPLE_FORMAT,
+                    now - start,
+                    delta(0) / CLOCK_TICKS / seconds,
+                    rss,
+                    delta(2) / seconds,
+                    delta(3) / seconds))
+                prev, prev_time = cur, now
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class ReferenceCache:
+    """
+    One entry dir per source file, keyed by its absolute path, size and mtime,
+    so a replaced reference file is staged again
+
+    <cache_dir>/<key>/<basename>   the verified copy
+    <cache_dir>/<key>/.sha256      written last, an entry without it is incomplete
+    <cache_dir>/<key>/.pid-<pid>   one per job using the entry, which is never evicted while in use
+
+    The mtime of the .sha256 file is the last use (the entry dir's own mtime changes with the pid markers),
+    the least recently used entries are evicted when the cache exceeds its size budget,
+    under an exclusive lock shared by all jobs on the host
+    """
+
+    def __init__(self, cache_dir, budget_bytes):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.budget_bytes = budget_bytes
+        self.entries = []
+
+    def stage(self, src):
+        src = os.path.abspath(src)
+        st = os.stat(src)
+        key = hashlib.sha256(f'{src}:{st.st_size}:{st.st_mtime_ns}'.encode()).hexdigest()[:16]
+        entry = os.path.join(self.cache_dir, key)
+        dst = os.path.join(entry, os.path.basename(src))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)  # the first job copies, concurrent jobs wait for it
+
+            if not os.path.exists(os.path.join(entry, '.sha256')):
+                shutil.rmtree(entry, ignore_errors=True)  # incomplete from an interrupted job
+                os.makedirs(entry)
+                self.__evict(needed=st.st_size, staging=entry)
+                print(f'Staging reference "{src}" to "{dst}"', flush=True)
+                checksum = copy_and_hash(src=src, dst=dst)
+                assert hash_file(dst) == checksum, f'Staged copy of "{src}" does not match the source'
+                with open(os.path.join(entry, '.sha256'), 'w') as fh:
+                    fh.write(checksum)
+
+            open(os.path.join(entry, f'.pid-{os.getpid()}'), 'w').close()
+            now = time.time()  # not the coarse clock of the file system, which ties entries used in a row
+            os.utime(os.path.join(entry, '.sha256'), (now, now))
+            self.entries.append(entry)
+
+        return dst
+
+    def release(self):
+        for entry in self.entries:
+            try:
+                os.remove(os.path.join(entry, f'.pid-{os.getpid()}'))
+            except OSError:
+                pass
+
+    def __evict(self, needed, staging):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and path != staging:
+                try:
+                    last_use = os.stat(os.path.join(path, '.sha256')).st_mtime
+                except OSError:
+                    last_use = 0  # incomplete, left by an interrupted job
+                entries.append((last_use, path, dir_size(path)))
+
+        total = sum(size for _, _, size in entries) + needed
+        for _, path, size in sorted(entries):  # least recently used first
+            if total <= self.budget_bytes:
+                break
+            if in_use(path):
+                continue
+            print(f'Evicting reference cache entry "{path}"', flush=True)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def copy_and_hash(src, dst):
+    h = hashlib.sha256()
+    with open(src, 'rb') as reader, open(dst, 'wb') as writer:
+        for chunk in iter(lambda: reader.read(HASH_CHUNK), b''):
+            h.update(chunk)
+            writer.write(chunk)
+    return h.hexdigest()
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dir_size(path):
+    return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+
+def in_use(entry):
+    for name in os.listdir(entry):
+        if name.startswith('.pid-'):
+            try:
+                os.kill(int(name[len('.pid-'):]), 0)
+                return True
+            except (OSError, ValueError):
+                os.remove(os.path.join(entry, name))  # left behind by a job that died
+    return False
+
+
+def stage_references(cmd, cache):
+    """
+    Rewrites both `--key=path` and `--key path` forms of REFERENCE_ARGS,
+    a reference which fails to stage is left at its original path
+    """
+    ret = list(cmd)
+    for i, arg in enumerate(cmd):
+        for key in REFERENCE_ARGS:
+            if arg.startswith(f'{key}='):
+                j, src, prefix = i, arg[len(key) + 1:], f'{key}='
+            elif arg == key and i + 1 < len(cmd):
+                j, src, prefix = i + 1, cmd[i + 1], ''
+            else:
+                continue
+            try:
+                ret[j] = prefix + cache.stage(src)
+            except Exception as e:
+                print(f'Warning: reference "{src}" not staged: {e!r}', flush=True)
+    return ret
+
+
+class Placement:
+    """
+    Where and how the job runs, recorded as JSON in its placement file, one per running job in the placements dir
+
+    The CPUs are chosen under an exclusive lock shared by the jobs of all hosts, among the CPUs the job may run on
+    (e.g. restricted by Slurm), the ones used by the fewest other running jobs on the same host first,
+    so that the jobs get disjoint CPU sets as long as there are enough CPUs
+
+    The nice value and the CPU affinity are set in the child before the command starts, and inherited by its children,
+    the idle I/O class is set by `ionice`, and the cgroup limits by a transient systemd scope of the user,
+    both run the command in their own process (exec), so that the process tree stays the same
+    """
+
+    def __init__(self, placement_file, threads, pin_cpus, nice, io_priority, cgroup_memory_gb):
+        self.placement_file = placement_file
+        self.threads = threads
+        self.pin_cpus = pin_cpus
+        self.nice = nice
+        self.io_priority = io_priority
+        self.cgroup_memory_gb = cgroup_memory_gb
+        self.host = socket.gethostname()
+        self.cpus = []
+        self.prefix = []
+        self.notes = []
+
+    def place(self):
+        placements_dir = os.path.dirname(os.path.abspath(self.placement_file))
+        os.makedirs(placements_dir, exist_ok=True)
+        with open(os.path.join(placements_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self.pin_cpus:
+                self.cpus = choose_cpus(
+                    allowed=sorted(os.sched_getaffinity(0)),
+                    used=self.__cpus_of_other_jobs(placements_dir),
+                    n=self.threads)
+            self.__write()
+
+        if self.io_priority == 'idle':
+            if shutil.which('ionice') is not None:
+                self.prefix += ['ionice', '-c', '3']
+            else:
+                self.notes.append('no ionice')
+        if self.cgroup_memory_gb > 0:
+            limits = ['-p', f'MemoryMax={self.cgroup_memory_gb:g}G', '-p', f'CPUQuota={self.threads * 100}%']
+            if systemd_scope_available():
+                self.prefix = ['systemd-run', '--user', '--scope', '--quiet'] + limits + ['--'] + self.prefix
+            else:
+                self.notes.append('no cgroup')
+        self.__write()
+
+    def preexec(self):
+        """
+        Runs in the child between fork and exec
+        """
+        if len(self.cpus) > 0:
+            os.sched_setaffinity(0, self.cpus)
+        if self.nice > 0:
+            os.nice(self.nice)
+
+    def describe(self):
+        ret = [self.host]
+        if len(self.cpus) > 0:
+            ret.append(f'CPUs {format_cpu_list(self.cpus)}')
+        if self.nice > 0:
+            ret.append(f'nice {self.nice}')
+        if self.io_priority == 'idle' and 'no ionice' not in self.notes:
+            ret.append('I/O idle')
+        if self.cgroup_memory_gb > 0 and 'no cgroup' not in self.notes:
+            ret.append(f'cgroup {self.cgroup_memory_gb:g} GB, {self.threads} CPUs')
+        return ', '.join(ret + self.notes)
+
+    def release(self):
+        try:
+            os.remove(self.placement_file)
+        except OSError:
+            pass
+
+    def __cpus_of_other_jobs(self, placements_dir):
+        ret = []
+        for name in os.listdir(placements_dir):
+            path = os.path.join(placements_dir, name)
+            if name.startswith('.') or os.path.abspath(path) == os.path.abspath(self.placement_file):
+                continue
+            try:
+                with open(path) as fh:
+                    other = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            if other.get('host') != self.host:
+                continue
+            try:
+                os.kill(other['pid'], 0)
+            except (OSError, KeyError, TypeError):
+                os.remove(path)  # left behind by a job that died
+                continue
+            ret += other.get('cpus', [])
+        return ret
+
+    def __write(self):
+        placements_dir, name = os.path.split(self.placement_file)
+        tmp = os.path.join(placements_dir, f'.{name}.tmp')  # a dot file, not listed by the dashboard
+        with open(tmp, 'w') as fh:
+            json.dump({'host': self.host, 'pid': os.getpid(), 'cpus': self.cpus, 'text': self.describe()}, fh)
+        os.replace(tmp, self.placement_file)
+
+
+def choose_cpus(allowed, used, n):
+    """
+    :return: the n allowed CPUs used by the fewest other jobs, the lowest numbers first on ties
+    """
+    counts = {cpu: 0 for cpu in allowed}
+    for cpu in used:
+        if cpu in counts:
+            counts[cpu] += 1
+    return sorted(sorted(allowed, key=lambda cpu: (counts[cpu], cpu))[:max(1, n)])
+
+
+def format_cpu_list(cpus):
+    """
+    [0, 1, 2, 3, 8, 10] -> '0-3,8,10', like the cpuset lists of the kernel
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if len(ranges) > 0 and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{a}-{b}' if b > a else str(a) for a, b in ranges)
+
+
+def systemd_scope_available():
+    """
+    A transient scope needs the systemd user manager, which may not run for SSH or batch sessions
+    """
+    if shutil.which('systemd-run') is None:
+        return False
+    try:
+        return subprocess.run(
+            ['systemd-run', '--user', '--scope', '--quiet', 'true'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def run(cmd, stats_json, threads, samples_file='', sample_seconds=5.0, placement=None):
+    start = datetime.now()
+    start_perf = time.time()
+    io_before = read_proc_io()
+
+    if placement is not None:
+        p = subprocess.Popen(placement.prefix + cmd, preexec_fn=placement.preexec)
+    else:
+        p = subprocess.Popen(cmd)
+
+    sampler = None
+    if samples_file != '':
+        os.makedirs(os.path.dirname(os.path.abspath(samples_file)), exist_ok=True)
+        sampler = Sampler(root_pid=p.pid, samples_file=samples_file, interval=sample_seconds)
+        sampler.start()
+
+    def forward(signum, frame):
+        p.send_signal(signum)
+
+    for s in [signal.SIGHUP, signal.SIGINT, signal.SIGTERM]:
+        signal.signal(s, forward)
+
+    exit_code = p.wait()
+    if sampler is not None:
+        sampler.stop()
+
+    wall_seconds = time.time() - start_perf
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io_after = read_proc_io()
+
+    def io_delta(key):
+        if key not in io_after:
+            return None
+        return io_after[key] - io_before.get(key, 0)
+
+    stats = {
+        'host': socket.gethostname(),
+        'command': cmd,
+        'threads': threads,
+        'start_time': start.strftime(TIME_FORMAT),
+        'end_time': datetime.now().strftime(TIME_FORMAT),
+        'wall_seconds': round(wall_seconds, 3),
+        'exit_code': exit_code,  # negative when killed by a signal
+        'max_rss_kb': usage.ru_maxrss,  # peak of the largest single process, in kilobytes on Linux
+        'user_cpu_seconds': round(usage.ru_utime, 3),
+        'sys_cpu_seconds': round(usage.ru_stime, 3),
+        'read_bytes': io_delta('read_bytes'),  # from the storage layer
+        'write_bytes': io_delta('write_bytes'),
+        'read_chars': io_delta('rchar'),  # including page cache hits
+        'write_chars': io_delta('wchar'),
+        'block_input_ops': usage.ru_inblock,
+        'block_output_ops': usage.ru_oublock,
+    }
+    if sampler is not None and sampler.max_tree_rss is not None:
+        stats['max_tree_rss_kb'] = sampler.max_tree_rss // 1024  # peak of the whole process tree, as sampled
+    if placement is not None:
+        stats['placement'] = placement.describe()
+
+    tmp = stats_json + '.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(stats, fh, indent=4)
+    os.replace(tmp, stats_json)
+
+    return exit_code
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stats', required=True)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--samples', default='')
+    parser.add_argument('--sample-seconds', type=float, default=5.0)
+    parser.add_argument('--reference-cache-dir', default='')
+    parser.add_argument('--reference-cache-gb', type=float, default=50)
+    parser.add_argument('--placement', default='')
+    parser.add_argument('--pin-cpus', default='no')
+    parser.add_argument('--nice', type=int, default=0)
+    parser.add_argument('--io-priority', default='best-effort')
+    parser.add_argument('--cgroup-memory-gb', type=lambda v: float(v) if v != '' else 0.0, default=0.0)
+    parser.add_argument('cmd', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ['--'] else args.cmd
+
+    cache = None
+    if args.reference_cache_dir != '':
+        cache = ReferenceCache(cache_dir=args.reference_cache_dir, budget_bytes=args.reference_cache_gb * 2 ** 30)
+        cmd = stage_references(cmd=cmd, cache=cache)
+
+    placement = None
+    if args.placement != '':
+        placement = Placement(
+            placement_file=args.placement,
+            threads=args.threads,
+            pin_cpus=args.pin_cpus == 'yes',
+            nice=args.nice,
+            io_priority=args.io_priority,
+            cgroup_memory_gb=args.cgroup_memory_gb)
+
+    try:
+        if placement is not None:
+            placement.place()
+        exit_code = run(
+            cmd=cmd,
+            stats_json=args.stats,
+            threads=args.threads,
+            samples_file=args.samples,
+            sample_seconds=args.sample_seconds,
+            placement=placement)
+    finally:
+        if cache is not None:
+            cache.release()
+        if placement is not None:
+            placement.release()
+    sys.exit(exit_code if exit_code >= 0 else 128 - exit_code)  # like bash for a signal
+
+
+if __name__ == '__main__':
+    main()
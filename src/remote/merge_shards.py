@@ -0,0 +1,80 @@
+"""
+Runs on the server in the environment activated by .profile, standard library and the `qiime` CLI
+
+usage: python merge_shards.py --shards <json> --outdir <dir>
+
+Merges the feature tables and representative sequences of the shard runs into the outdir,
+at the same relative paths, so that the run over all samples, which starts after denoising, finds them in place,
+the outdir may be one of the shards, e.g. an earlier run that new samples are appended to
+
+The artifacts are recognized by the semantic type in their metadata.yaml, not by file name,
+and only the ones present in every shard are merged
+"""
+import os
+import sys
+import json
+import zipfile
+import argparse
+import subprocess
+
+
+MERGE_ARGS = {  # semantic type -> qiime feature-table action, input option, output option
+    'FeatureTable[Frequency]': ('merge', '--i-tables', '--o-merged-table'),
+    'FeatureData[Sequence]': ('merge-seqs', '--i-data', '--o-merged-data'),
+}
+
+
+def semantic_type(qza):
+    try:
+        with zipfile.ZipFile(qza) as z:
+            for name in z.namelist():
+                if name.count('/') == 1 and name.endswith('/metadata.yaml'):  # <uuid>/metadata.yaml
+                    for line in z.read(name).decode().splitlines():
+                        if line.startswith('type:'):
+                            return line[len('type:'):].strip()
+    except (OSError, zipfile.BadZipFile):
+        pass
+    return None
+
+
+def find_artifacts(shard):
+    ret = {}
+    for root, _, files in os.walk(shard):
+        for f in files:
+            if f.endswith('.qza'):
+                path = os.path.join(root, f)
+                type_ = semantic_type(path)
+                if type_ in MERGE_ARGS:
+                    ret[os.path.relpath(path, shard)] = type_
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', required=True)
+    parser.add_argument('--outdir', required=True)
+    args = parser.parse_args()
+
+    shards = json.loads(args.shards)
+    artifacts = [find_artifacts(shard) for shard in shards]
+    common = sorted(set.intersection(*[set(a) for a in artifacts]))
+    assert len(common) > 0, f'No feature table or representative sequences found in all of {shards}'
+
+    for relpath in common:
+        action, i_option, o_option = MERGE_ARGS[artifacts[0][relpath]]
+        dst = os.path.join(args.outdir, relpath)
+        tmp = dst[:-len('.qza')] + '.merging.qza'  # replaces dst only when merged, dst may be an input
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        cmd = ['qiime', 'feature-table', action]
+        for shard in shards:
+            cmd += [i_option, os.path.join(shard, relpath)]
+        cmd += [o_option, tmp]
+        print(' '.join(cmd), flush=True)
+        exit_code = subprocess.call(cmd)
+        if exit_code != 0:
+            sys.exit(exit_code)
+        os.replace(tmp, dst)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only
+
+usage: python preview_fastq.py --fq-dir <dir> --fq1-suffix <suffix> [--fq2-suffix <suffix>]
+                               --files <n> --reads <n> --max-ee <current max-expected-error-bases>
+
+Streams the first `reads` reads of `files` R1 files (and their R2 files) evenly sampled from the fq dir,
+decompressing only the start of each file, and prints a compact JSON summary of each read end:
+the quality per position, the length distribution, the known primer at the read starts,
+and the expected errors of the reads after the primer
+
+Suggests the 5' clipping of each read end (the end of its primer) and a max expected errors
+that keeps MAX_EE_RETAINED of the reads of the worse read end
+"""
+import os
+import re
+import gzip
+import json
+import math
+import argparse
+
+
+PHRED_OFFSET = 33
+MAX_QUALITY = 94  # of the printable characters
+ERROR_PROBABILITY = [10 ** (-max(c - PHRED_OFFSET, 0) / 10) for c in range(128)]  # by quality character
+PRIMERS = {  # 16S rRNA gene primers, 5' to 3' as at the start of the reads
+    '27F': 'AGAGTTTGATCMTGGCTCAG',
+    '341F': 'CCTACGGGNGGCWGCAG',
+    '515F': 'GTGCCAGCMGCCGCGGTAA',
+    '515F-Parada': 'GTGYCAGCMGCCGCGGTAA',
+    '785F': 'GGATTAGATACCCBDGTAGTC',
+    '805R': 'GACTACHVGGGTATCTAATCC',
+    '806R': 'GGACTACHVGGGTWTCTAAT',
+    '806R-Apprill': 'GGACTACNVGGGTWTCTAAT',
+    '926R': 'CCGYCAATTYMTTTRAGTTT',
+    '1492R': 'GGTTACCTTGTTACGACTT',
+}
+IUPAC = {
+    'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+    'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT',
+}
+MAX_PRIMER_OFFSET = 8  # of the heterogeneity spacers before the primer
+PRIMER_END_QUANTILE = 0.95
+MIN_PRIMER_FRACTION = 0.5  # of the reads starting with the primer to suggest clipping it
+MAX_EE_RETAINED = 0.9
+MIN_MAX_EE = 2.0  # the default of DADA2
+LENGTH_BIN = 10
+
+
+def primer_regex(primer):
+    """
+    Also matches the sequencer's N at any position of the primer
+    """
+    bases = ''.join(f'[{IUPAC[b]}N]' for b in primer)
+    return re.compile(f'^[ACGTN]{{0,{MAX_PRIMER_OFFSET}}}?{bases}')
+
+
+PRIMER_REGEXES = {name: primer_regex(p) for name, p in PRIMERS.items()}
+
+
+def read_fastq(path, n):
+    """
+    :return: the first n (sequence, quality) of the file, reading only as much of it as needed
+    """
+    open_ = gzip.open if path.endswith('.gz') else open
+    ret = []
+    with open_(path, 'rt') as fh:
+        while len(ret) < n:
+            header = fh.readline()
+            if header == '':
+                break
+            seq = fh.readline().rstrip('\n')
+            fh.readline()
+            qual = fh.readline().rstrip('\n')
+            ret.append((seq, qual))
+    return ret
+
+
+def sample_files(fq_dir, suffix, n):
+    """
+    :return: n of the file names evenly spaced in their sorted order, so that the pick is reproducible
+    """
+    names = sorted(f for f in os.listdir(fq_dir) if f.endswith(suffix))
+    if len(names) <= n:
+        return names
+    return [names[i * len(names) // n] for i in range(n)]
+
+
+def quantile(sorted_values, q):
+    if len(sorted_values) == 0:
+        return 0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def quality_per_position(reads):
+    """
+    :return: mean, median and lower quartile of the quality at each position, over the reads that long
+    """
+    counts = []  # position -> number of bases of each quality
+    for _, qual in reads:
+        while len(counts) < len(qual):
+            counts.append([0] * MAX_QUALITY)
+        for i, q in enumerate(qual.encode()):
+            counts[i][min(q - PHRED_OFFSET, MAX_QUALITY - 1)] += 1
+
+    mean, median, q25 = [], [], []
+    for position in counts:
+        n = sum(position)
+        mean.append(round(sum(q * k for q, k in enumerate(position)) / n, 1))
+        cumulative, percentiles = 0, {}
+        for q, k in enumerate(position):
+            cumulative += k
+            for p in [0.25, 0.5]:
+                if p not in percentiles and cumulative >= p * n:
+                    percentiles[p] = q
+        q25.append(percentiles[0.25])
+        median.append(percentiles[0.5])
+    return {'mean': mean, 'median': median, 'q25': q25}
+
+
+def length_distribution(reads):
+    lengths = sorted(len(seq) for seq, _ in reads)
+    histogram = {}
+    for length in lengths:
+        b = length // LENGTH_BIN * LENGTH_BIN
+        histogram[b] = histogram.get(b, 0) + 1
+    return {
+        'min': lengths[0] if len(lengths) > 0 else 0,
+        'median': quantile(lengths, 0.5),
+        'max': lengths[-1] if len(lengths) > 0 else 0,
+        'histogram': sorted(histogram.items()),  # [bin start, number of reads]
+    }
+
+
+def detect_primer(reads):
+    """
+    :return: the primer found at the start of the most reads, the fraction of those reads, and where it ends
+             in PRIMER_END_QUANTILE of them, i.e. the bases to clip with the spacers of varying length, or None
+    """
+    best_name, best_ends = None, []
+    for name, regex in PRIMER_REGEXES.items():
+        ends = [m.end() for m in (regex.match(seq) for seq, _ in reads) if m is not None]
+        if len(ends) > len(best_ends):
+            best_name, best_ends = name, ends
+    if best_name is None:
+        return None
+    return {
+        'name': best_name,
+        'fraction': round(len(best_ends) / len(reads), 3),
+        'end': quantile(sorted(best_ends), PRIMER_END_QUANTILE),
+    }
+
+
+def expected_errors(qual):
+    return sum(ERROR_PROBABILITY[q] for q in qual.encode())
+
+
+def summarize(reads, max_ee):
+    primer = detect_primer(reads)
+    clip = primer['end'] if primer is not None and primer['fraction'] >= MIN_PRIMER_FRACTION else None
+    errors = sorted(expected_errors(qual[clip or 0:]) for _, qual in reads)
+    return {
+        'reads': len(reads),
+        'lengths': length_distribution(reads),
+        'quality': quality_per_position(reads),
+        'primer': primer,
+        'clip': clip,
+        'expected_errors': {
+            'median': round(quantile(errors, 0.5), 2),
+            'retained_quantile': round(quantile(errors, MAX_EE_RETAINED), 2),
+            'retained_at_max_ee': round(sum(e <= max_ee for e in errors) / len(errors), 3) if len(errors) > 0 else 0,
+        },
+    }
+
+
+def suggest(summaries):
+    """
+    :param summaries: {'r1': summary, 'r2': summary} or {'r1': summary}
+    :return: suggested values of the pipeline parameters, only those that can be inferred
+    """
+    ret = {}
+    for end, key in [('r1', 'clip-r1-5-prime'), ('r2', 'clip-r2-5-prime')]:
+        if end in summaries and summaries[end]['clip'] is not None:
+            ret[key] = str(summaries[end]['clip'])
+    worst = max(s['expected_errors']['retained_quantile'] for s in summaries.values())
+    ret['max-expected-error-bases'] = f'{max(MIN_MAX_EE, math.ceil(worst)):.1f}'
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fq-dir', required=True)
+    parser.add_argument('--fq1-suffix', required=True)
+    parser.add_argument('--fq2-suffix', default='')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--reads', type=int, default=10000)
+    parser.add_argument('--max-ee', type=float, default=8.0)
+    args = parser.parse_args()
+
+    assert os.path.isdir(args.fq_dir), f'"{args.fq_dir}" is not a directory'
+    r1_files = sample_files(args.fq_dir, suffix=args.fq1_suffix, n=args.files)
+    assert len(r1_files) > 0, f'No "*{args.fq1_suffix}" file in "{args.fq_dir}"'
+    per_file = max(1, args.reads // len(r1_files))
+
+    reads = {'r1': []}
+    if args.fq2_suffix != '':
+        reads['r2'] = []
+    for f in r1_files:
+        reads['r1'] += read_fastq(os.path.join(args.fq_dir, f), n=per_file)
+        if 'r2' in reads:
+            r2 = f[:-len(args.fq1_suffix)] + args.fq2_suffix
+            if os.path.exists(os.path.join(args.fq_dir, r2)):
+                reads['r2'] += read_fastq(os.path.join(args.fq_dir, r2), n=per_file)
+    if 'r2' in reads and len(reads['r2']) == 0:
+        del reads['r2']
+
+    summaries = {end: summarize(r, max_ee=args.max_ee) for end, r in reads.items() if len(r) > 0}
+    assert len(summaries) > 0, f'No reads in {r1_files}'
+    print(json.dumps({
+        'files': r1_files,
+        'summaries': summaries,
+        'suggestions': suggest(summaries),
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Runs on the server in the environment activated by .profile, standard library only
+
+usage: python subsample_fastq.py --fq-dir <dir> --suffixes <json> --sample-sheet <file> --outdir <dir>
+                                 --reads <n or fraction> --seed <int> --threads <n>
+
+Writes a random subsample of the reads of each sample in the sample sheet into the outdir, with the same file names,
+in one pass over the (gzipped) FASTQ files without decompressing them to disk:
+with a fraction (e.g. 0.01), each read is kept with that probability,
+with a number of reads (e.g. 10000), that many reads are drawn by reservoir sampling, holding only those reads in memory
+
+The reads of a pair are drawn together from the R1 and R2 files read in lockstep, so the subsample stays paired,
+the same seed draws the same reads, and the samples are subsampled in parallel on `threads` processes
+"""
+import os
+import csv
+import gzip
+import json
+import random
+import argparse
+import multiprocessing
+
+
+COMPRESS_LEVEL = 1  # the subsample is read once by the quick look
+
+
+def read_sample_ids(sample_sheet):
+    """
+    The first column without the header row
+    """
+    assert sample_sheet.endswith(('.csv', '.tsv', '.tab')), \
+        f'Cannot read the sample IDs of "{sample_sheet}", save it as .csv or .tsv for a quick look'
+    delimiter = ',' if sample_sheet.endswith('.csv') else '\t'
+    with open(sample_sheet, newline='', encoding='utf-8', errors='replace') as fh:
+        rows = [row for row in csv.reader(fh, delimiter=delimiter) if len(row) > 0 and not row[0].startswith('#')]
+    return [row[0].strip().lstrip('﻿') for row in rows[1:]]
+
+
+def find_samples(fq_dir, suffixes, sample_ids):
+    """
+    :return: {sample: [file of each suffix]} of the samples of the sample sheet with a file for every suffix
+    """
+    names = set(os.listdir(fq_dir))
+    samples = sorted({n[:-len(s)] for n in names for s in suffixes if n.endswith(s)})
+    complete = {s: [s + suffix for suffix in suffixes] for s in samples if all(s + suffix in names for suffix in suffixes)}
+    matched = {s: files for s, files in complete.items() if s in set(sample_ids)}
+    assert len(matched) > 0, \
+        f'None of the {len(sample_ids)} sample IDs of the sample sheet has FASTQ files in "{fq_dir}" ' \
+        f'with the suffixes {suffixes}, check that the sample IDs are in the first column'
+    return matched
+
+
+def open_fastq(path, mode, gzipped):
+    return gzip.open(path, mode, compresslevel=COMPRESS_LEVEL) if gzipped else open(path, mode)
+
+
+def iter_records(fhs):
+    """
+    The records (4 lines) of the files in lockstep, one tuple of records per read (pair)
+    """
+    while True:
+        records = tuple(b''.join(fh.readline() for _ in range(4)) for fh in fhs)
+        if any(r == b'' for r in records):
+            return
+        yield records
+
+
+def subsample(fq_dir, files, outdir, reads, seed, sample):
+    """
+    :param reads: the fraction of the reads if below 1, otherwise the number of reads
+    :return: the sample, the number of reads read and written
+    """
+    rng = random.Random(f'{seed}:{sample}')
+    ins = [open_fastq(os.path.join(fq_dir, f), 'rb', gzipped=f.endswith('.gz')) for f in files]
+    outs = [open_fastq(os.path.join(outdir, f'.{f}.partial'), 'wb', gzipped=f.endswith('.gz')) for f in files]
+    n_in, n_out = 0, 0
+    try:
+        if reads < 1:
+            for records in iter_records(ins):
+                n_in += 1
+                if rng.random() < reads:
+                    n_out += 1
+                    for out, record in zip(outs, records):
+                        out.write(record)
+        else:
+            k = int(reads)
+            reservoir = []  # [index, records], algorithm R
+            for records in iter_records(ins):
+                if n_in < k:
+                    reservoir.append((n_in, records))
+                else:
+                    j = rng.randrange(n_in + 1)
+                    if j < k:
+                        reservoir[j] = (n_in, records)
+                n_in += 1
+            for _, records in sorted(reservoir, key=lambda x: x[0]):  # in the order of the input
+                for out, record in zip(outs, records):
+                    out.write(record)
+            n_out = len(reservoir)
+    finally:
+        for fh in ins + outs:
+            fh.close()
+    for f in files:
+        os.replace(os.path.join(outdir, f'.{f}.partial'), os.path.join(outdir, f))
+    return sample, n_in, n_out
+
+
+def subsample_star(args):
+    return subsample(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fq-dir', required=True)
+    parser.add_argument('--suffixes', required=True)
+    parser.add_argument('--sample-sheet', required=True)
+    parser.add_argument('--outdir', required=True)
+    parser.add_argument('--reads', type=float, required=True)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    assert os.path.isdir(args.fq_dir), f'"{args.fq_dir}" is not a directory'
+    assert args.reads > 0, f'--reads should be a fraction or a number of reads, not {args.reads:g}'
+    samples = find_samples(
+        fq_dir=args.fq_dir, suffixes=json.loads(args.suffixes), sample_ids=read_sample_ids(args.sample_sheet))
+    os.makedirs(args.outdir, exist_ok=True)
+
+    tasks = [(args.fq_dir, files, args.outdir, args.reads, args.seed, sample) for sample, files in samples.items()]
+    total_in, total_out = 0, 0
+    with multiprocessing.get_context('fork').Pool(max(1, min(args.threads, len(tasks)))) as pool:  # the script is read from stdin
+        for sample, n_in, n_out in pool.imap(subsample_star, tasks):
+            print(f'{sample}: {n_out} of {n_in} reads', flush=True)
+            total_in += n_in
+            total_out += n_out
+    print(f'Subsampled {total_out} of {total_in} reads of {len(tasks)} samples into "{args.outdir}"', flush=True)
+
+
+if __name__ == '__main__':
+    main()
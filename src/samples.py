@@ -0,0 +1,40 @@
+import struct
+from typing import Dict, List, Tuple
+
+
+SAMPLE_FORMAT = '<5f'  # the same as in src/remote/job_wrapper.py
+SAMPLE_SIZE = struct.calcsize(SAMPLE_FORMAT)
+SAMPLE_FIELDS = ['seconds', 'cpu_cores', 'rss_bytes', 'read_bytes_per_second', 'write_bytes_per_second']
+
+
+def parse_samples(data: bytes) -> Dict[str, List[float]]:
+    """
+    Whole records only, a partial record at the end (still being written) is left for the next fetch
+    """
+    n = len(data) // SAMPLE_SIZE
+    records = struct.iter_unpack(SAMPLE_FORMAT, data[:n * SAMPLE_SIZE])
+    columns = list(zip(*records)) if n > 0 else [()] * len(SAMPLE_FIELDS)
+    return {field: list(col) for field, col in zip(SAMPLE_FIELDS, columns)}
+
+
+def downsample_min_max(
+        xs: List[float],
+        ys: List[float],
+        n_buckets: int) -> Tuple[List[float], List[float]]:
+    """
+    Keeps the minimum and the maximum of each of `n_buckets` consecutive buckets, in their order,
+    so that the peaks stay visible at one bucket per pixel however long the run
+    """
+    if len(xs) <= 2 * n_buckets:
+        return xs, ys
+    ret_x, ret_y = [], []
+    for b in range(n_buckets):
+        start = len(xs) * b // n_buckets
+        end = len(xs) * (b + 1) // n_buckets
+        bucket = ys[start:end]
+        i_min = start + bucket.index(min(bucket))
+        i_max = start + bucket.index(max(bucket))
+        for i in sorted({i_min, i_max}):
+            ret_x.append(xs[i])
+            ret_y.append(ys[i])
+    return ret_x, ret_y
@@ -0,0 +1,104 @@
+import re
+import json
+from os.path import exists
+from typing import Dict, List, Union, Optional, Any
+from .pipeline import STAGE_OPTIONS
+
+
+SKIPPED_OPTIONS = [  # not parameters of a run, or set by the app
+    'help',
+    'version',
+    'sample-sheet',
+]
+OPTION_LINE = re.compile(r'^ {1,8}-')  # wrapped help lines are indented further
+LONG_OPTION = re.compile(r'^--(?P<key>[\w-]+)( (?P<metavar>.*))?$')
+CHOICES = re.compile(r'\{([^{}]+)\}')
+DEFAULT = re.compile(r'[(\[]default:\s*([^)\]]*)[)\]]', re.IGNORECASE)
+NO_DEFAULT = ['', 'None', 'False']  # of an option without a value, or of a store_true flag
+
+
+def parse_help(stdout: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parses the argparse `--help` output of a qiime2_pipeline release into its options,
+    {key: {'flag': True for a store_true option, 'choices': [...], 'default': str or None}} in the order of the help
+
+    An option line is its invocation, e.g. '-f FQ_DIR, --fq-dir FQ_DIR' or '--paired-end-mode {merge,pool}',
+    then two or more spaces and the help text, which may continue on the next lines
+
+    An option takes a value if its invocation has a metavar, also an empty one ('-o , --outdir'),
+    or if its help states a default, e.g. '(default: %(default)s)', the choices are those of the metavar
+    """
+    ret = {}
+    entries = []  # [invocation, help]
+    for line in stdout.splitlines():
+        if OPTION_LINE.match(line):
+            invocation, _, help_ = line.strip().partition('  ')
+            entries.append([invocation, help_.strip()])
+        elif len(entries) > 0 and line.startswith(' ') and line.strip() != '':
+            entries[-1][1] += ' ' + line.strip()
+        else:
+            entries.append(['', ''])  # ends the help text of the last option, e.g. at a blank line
+
+    for invocation, help_ in entries:
+        parts = invocation.split(', ')  # not at the commas of the choices, e.g. {merge,pool}
+        m = LONG_OPTION.match(parts[-1].strip())
+        if m is None or m.group('key') in SKIPPED_OPTIONS:
+            continue
+        metavar = (m.group('metavar') or '').strip()
+        default = DEFAULT.search(help_)
+        default = default.group(1).strip().strip('\'"') if default is not None else ''
+        empty_metavar = any(p.endswith(' ') for p in parts[:-1])  # '-o , --outdir'
+        choices = CHOICES.search(metavar)
+        ret[m.group('key')] = {
+            'flag': metavar == '' and not empty_metavar and default in NO_DEFAULT,
+            'choices': [c.strip() for c in choices.group(1).split(',')] if choices is not None else [],
+            'default': default if default not in NO_DEFAULT else None,
+        }
+    return ret
+
+
+def merge_schema(
+        key_to_values: Dict[str, Union[List[str], bool]],
+        schema: Dict[str, Dict[str, Any]],
+        known_keys: List[str]) -> Dict[str, Union[List[str], bool]]:
+    """
+    The parameters of a mode for the pipeline release of the schema:
+    the mode's own values of the options the release still has, keeping only its valid choices,
+    followed by the options the app does not know, with their default (and choices) from the help
+
+    The known options the mode does not have belong to the other mode, e.g. 'fq2-suffix' in PacBio mode,
+    and the STAGE_OPTIONS are set by the app for each run, they are not in the form
+    """
+    ret = {}
+    for key, values in key_to_values.items():
+        if key not in schema:
+            continue  # removed by this release
+        option = schema[key]
+        if option['flag'] or len(option['choices']) == 0:
+            ret[key] = values
+            continue
+        valid = [v for v in values if v in option['choices']]
+        ret[key] = valid + [c for c in option['choices'] if c not in valid]
+    for key, option in schema.items():
+        if key in known_keys or key in STAGE_OPTIONS:
+            continue
+        if option['flag']:
+            ret[key] = False
+        elif len(option['choices']) > 0:
+            default = option['default']
+            ret[key] = ([default] if default in option['choices'] else []) + [c for c in option['choices'] if c != default]
+        else:
+            ret[key] = [option['default'] or '']
+    return ret
+
+
+def load_schema(file: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    if not exists(file):
+        return None
+    with open(file) as fh:
+        return json.load(fh)
+
+
+def save_schema(file: str, schema: Dict[str, Dict[str, Any]]):
+    with open(file, 'w') as fh:
+        json.dump(schema, fh, indent=2)
@@ -0,0 +1,114 @@
+import re
+import json
+from os.path import exists
+from typing import Dict, List, Tuple, Any
+
+
+STAGE_MARKERS = [  # stage, pattern of its lines in the pipeline's output, the first matching stage wins
+    ('Import', r'tools import|importing'),
+    ('Trimming', r'cutadapt|trimm'),
+    ('Denoising', r'dada2|deblur|denois'),
+    ('Clustering', r'cluster-features|\botus?\b|clustering'),
+    ('Classification', r'feature-classifier|classify|classification'),
+    ('Diversity', r'diversity|rarefaction|rarefy'),  # before phylogeny, e.g. core-metrics-phylogenetic
+    ('Phylogeny', r'phylogen|mafft|fasttree'),
+    ('Differential Abundance', r'differential|ancom'),
+    ('Plotting', r'barplot|heatmap|plotting'),
+]
+OTHER_STAGE = 'Other'  # the lines before the first marker
+
+
+class Timeline:
+    """
+    Stages of one run from its timestamped output lines ('<epoch seconds>\t<line>'),
+    a stage starts at the first line matching its marker and lasts until the next stage starts
+
+    Fed incrementally with the bytes from `offset` on, a partial last line is left for the next feed
+    """
+
+    first_timestamp: str  # tells whether the output is still the one of the same run
+    offset: int
+    stages: List[List[Any]]  # [stage, start, end] in seconds since the epoch
+
+    def __init__(self):
+        self.first_timestamp = ''
+        self.offset = 0
+        self.stages = []
+
+    def feed(self, data: bytes):
+        lines = data.split(b'\n')[:-1]  # the last item is '' or a partial line
+        for line in lines:
+            self.offset += len(line) + 1
+            timestamp, _, text = line.decode(errors='replace').partition('\t')
+            try:
+                t = int(timestamp)
+            except ValueError:
+                continue
+            if self.first_timestamp == '':
+                self.first_timestamp = timestamp
+            stage = match_stage(text=text)
+            if stage is None:
+                stage = self.stages[-1][0] if len(self.stages) > 0 else OTHER_STAGE
+            if len(self.stages) > 0 and self.stages[-1][0] == stage:
+                self.stages[-1][2] = t
+            else:
+                if len(self.stages) > 0:
+                    self.stages[-1][2] = t  # the previous stage lasts until this one starts
+                self.stages.append([stage, t, t])
+
+    def durations(self) -> Dict[str, int]:
+        ret = {}
+        for stage, start, end in self.stages:
+            ret[stage] = ret.get(stage, 0) + end - start
+        return ret
+
+    def save(self, file: str):
+        with open(file, 'w') as fh:
+            json.dump(self.__dict__, fh)
+
+    @classmethod
+    def load(cls, file: str) -> 'Timeline':
+        ret = cls()
+        if exists(file):
+            with open(file) as fh:
+                ret.__dict__.update(json.load(fh))
+        return ret
+
+
+def match_stage(text: str):
+    for stage, pattern in STAGE_MARKERS:
+        if re.search(pattern, text, flags=re.IGNORECASE):
+            return stage
+    return None
+
+
+def differing_args(commands: Dict[str, List[str]]) -> Dict[str, str]:
+    """
+    The arguments which are not the same in all the commands, i.e. the parameter set of each run,
+    leaving out the ones of its own outdir and sample sheet
+    """
+    args = {
+        key: set(a for a in cmd if not a.startswith(('--outdir=', '--sample-sheet=')))
+        for key, cmd in commands.items()
+    }
+    common = set.intersection(*args.values()) if len(args) > 0 else set()
+    return {key: ' '.join(sorted(a - common)) for key, a in args.items()}
+
+
+def aggregate_by_parameters(
+        timelines: Dict[str, Timeline],
+        commands: Dict[str, List[str]]) -> List[Tuple[str, int, Dict[str, float]]]:
+    """
+    :return: list of (parameter set, number of runs, mean seconds of each stage), in the order first seen
+    """
+    parameter_sets = differing_args(commands=commands)
+    groups: Dict[str, List[Dict[str, int]]] = {}
+    for key, timeline in timelines.items():
+        groups.setdefault(parameter_sets.get(key, ''), []).append(timeline.durations())
+
+    ret = []
+    for parameter_set, durations in groups.items():
+        stages = set(stage for d in durations for stage in d)
+        means = {stage: sum(d.get(stage, 0) for d in durations) / len(durations) for stage in stages}
+        ret.append((parameter_set, len(durations), means))
+    return ret
@@ -0,0 +1,97 @@
+import re
+import gzip
+from os.path import basename
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterator, Optional
+
+
+FASTQ_NAME = re.compile(r'\.(fastq|fq)(\.gz)?$', re.IGNORECASE)
+READ_SUFFIX = re.compile(r'[._-]R?([12])(_001)?\.(fastq|fq)(\.gz)?$', re.IGNORECASE)  # the same as in src/remote/index_fastq.py
+BLOCK_SIZE = 4 * 2 ** 20  # of uncompressed reads, each compressed into its own gzip member
+COMPRESS_LEVEL = 6  # the default of gzip
+BLOCKS_PER_THREAD = 2  # in flight, bounds the memory to about BLOCK_SIZE * BLOCKS_PER_THREAD * threads
+WRITE_SIZE = 2 ** 20  # of the non-compressed uploads
+
+
+def remote_fastq_name(name: str, fq1_suffix: str, fq2_suffix: str = '') -> Optional[str]:
+    """
+    The name of the local FASTQ file with the configured suffix of its read, e.g. 'S1_R1_001.fastq' -> 'S1_R1.fastq.gz',
+    so that the pipeline finds it in the fq-dir whatever the sequencing core named it
+
+    :return: None if the file is not a FASTQ file, or it is read 2 without an fq2-suffix
+    """
+    if FASTQ_NAME.search(name) is None:
+        return None
+    if fq2_suffix == '':  # single-end
+        return FASTQ_NAME.sub('', name) + fq1_suffix
+    m = READ_SUFFIX.search(name)
+    if m is None:
+        return None
+    return name[:m.start()] + (fq1_suffix if m.group(1) == '1' else fq2_suffix)
+
+
+def needs_compression(local: str, remote: str) -> bool:
+    return remote.lower().endswith('.gz') and not local.lower().endswith('.gz')
+
+
+def needs_decompression(local: str, remote: str) -> bool:
+    """
+    A gzipped file uploaded with an uncompressed suffix, e.g. 'S1_R1.fastq.gz' with the fq1-suffix '_R1.fastq',
+    would not be readable as the plain FASTQ its name says
+    """
+    return local.lower().endswith('.gz') and not remote.lower().endswith('.gz')
+
+
+def compress_blocks(fh: BinaryIO, threads: int, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Compresses the stream in blocks on `threads` threads, each block into a complete gzip member,
+    and yields the members in order, which together are one valid gzip file (RFC 1952, like the output of `bgzip`)
+
+    zlib releases the GIL while compressing, at most BLOCKS_PER_THREAD blocks per thread are read ahead
+    """
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = deque()
+        while True:
+            block = fh.read(block_size)
+            if block == b'':
+                break
+            pending.append(executor.submit(gzip.compress, block, COMPRESS_LEVEL, mtime=0))
+            if len(pending) >= threads * BLOCKS_PER_THREAD:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def upload_fastq(sftp, local: str, remote: str, threads: int) -> int:
+    """
+    Writes the local FASTQ file straight into the remote file, compressed on the fly if only the remote name ends with .gz,
+    decompressed on the fly if only the local name does, first to <remote>.partial so that an interrupted upload does not leave a truncated file with the name of the reads
+
+    :param sftp: paramiko's SFTPClient of the connection, or LocalConnection.sftp()
+    :return: the number of bytes written to the remote file
+    """
+    partial = f'{remote}.partial'
+    sent = 0
+    with open(local, 'rb') as src, sftp.open(partial, 'wb') as dst:
+        dst.set_pipelined(True)  # does not wait for the acknowledgement of each write
+        if needs_compression(local=local, remote=remote):
+            blocks = compress_blocks(src, threads=threads)
+        elif needs_decompression(local=local, remote=remote):
+            reads = gzip.GzipFile(fileobj=src)
+            blocks = iter(lambda: reads.read(WRITE_SIZE), b'')
+        else:
+            blocks = iter(lambda: src.read(WRITE_SIZE), b'')
+        for data in blocks:
+            dst.write(data)
+            sent += len(data)
+    try:
+        sftp.posix_rename(partial, remote)
+    except IOError:  # a server without the posix-rename extension of OpenSSH, where rename() does not replace
+        try:
+            sftp.remove(remote)
+        except IOError:
+            pass
+        sftp.rename(partial, remote)
+    print(f'Uploaded "{basename(local)}" to "{remote}", {sent / 2 ** 20:.1f} MB', flush=True)
+    return sent
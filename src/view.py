@@ -1,17 +1,36 @@
 from os.path import dirname
-from typing import List, Dict, Union, Tuple
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from datetime import datetime
+from typing import List, Dict, Union, Tuple, Optional, Any
+from PyQt5.QtCore import Qt, QPointF, QSize, QUrl, QTimer, pyqtSignal
+from PyQt5.QtGui import QIcon, QPainter, QPen, QPolygonF, QPixmap, QDesktopServices
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, \
     QPushButton, QScrollArea, QCheckBox, QMessageBox, QFileDialog, QDialog, QFormLayout, \
-    QLineEdit, QDialogButtonBox, QTableWidget, QTableWidgetItem
+    QLineEdit, QDialogButtonBox, QTableWidget, QTableWidgetItem, QSystemTrayIcon, QListWidget, QListWidgetItem, QListView
+from .pipeline import parse_sweep_values, is_shard_of
+from .samples import SAMPLE_SIZE, SAMPLE_FIELDS, parse_samples, downsample_min_max
+from .timeline import STAGE_MARKERS, OTHER_STAGE
+from .schema import merge_schema
+from .backend import backend_names
 
 
 EDIT_KEY_TO_TYPE = {
     'User': QComboBox,
     'Host': QComboBox,
     'Port': QComboBox,
+    'Dashboard Hosts': QComboBox,
     'Qiime2 Pipeline': QComboBox,
+    'Scratch Dir': QComboBox,
+    'Scratch Min Free GB': QComboBox,
+    'Reference Cache Dir': QComboBox,
+    'Reference Cache GB': QComboBox,
+    'Pin CPUs': QComboBox,
+    'Nice': QComboBox,
+    'IO Priority': QComboBox,
+    'Cgroup Memory GB': QComboBox,
+    'Samples Per Shard': QComboBox,
+    'Quick Look Reads': QComboBox,
+    'Job Backend': QComboBox,
+    'Compact After Days': QComboBox,
 
     'fq-dir': QComboBox,
     'fq1-suffix': QComboBox,
@@ -51,12 +70,25 @@ BUTTON_KEY_TO_LABEL = {
     'pacbio_mode': 'PacBio Mode',
     'load_parameters': 'Load Parameters',
     'save_parameters': 'Save Parameters',
+    'preview_fastq': 'Preview FASTQ',
+    'check_sample_sheet': 'Check Sample Sheet',
+    'upload_reads': 'Upload Reads',
     'show_dashboard': 'Dashboard',
     'submit': 'Submit',
+    'submit_quick_look': 'Quick Look',
+    'submit_sweep': 'Submit Sweep',
+    'submit_sharded': 'Submit Sharded',
+    'append_samples': 'Append Samples',
 }
 DASHBOARD_BUTTON_KEY_TO_LABEL = {
     'update_dashboard': 'Update',
     'kill_jobs': 'Kill Jobs',
+    'resume_runs': 'Resume',
+    'resource_chart': 'Resource Chart',
+    'compare_stages': 'Compare Stages',
+    'compare_runs': 'Compare Runs',
+    'figure_gallery': 'Figures',
+    'compact_runs': 'Compact Runs',
 }
 
 
@@ -66,7 +98,20 @@ class IlluminaMode:
         'User': [''],
         'Host': ['255.255.255.255'],
         'Port': ['22'],
+        'Dashboard Hosts': [''],  # comma-separated, listed together in the dashboard, empty for the Host only
         'Qiime2 Pipeline': ['qiime2_pipeline-2.10.2'],
+        'Scratch Dir': ['/tmp', '/dev/shm'],
+        'Scratch Min Free GB': ['20'],
+        'Reference Cache Dir': ['', '/tmp/qiime2app-references'],  # empty to read the references in place
+        'Reference Cache GB': ['50'],
+        'Pin CPUs': ['no', 'yes'],  # to CPUs not used by the other jobs on the host
+        'Nice': ['0', '10', '19'],
+        'IO Priority': ['best-effort', 'idle'],
+        'Cgroup Memory GB': ['', '16', '32', '64'],  # empty for no cgroup limits
+        'Samples Per Shard': ['200'],  # for Submit Sharded
+        'Quick Look Reads': ['10000', '0.01'],  # per sample for Quick Look, a fraction of the reads if below 1
+        'Job Backend': backend_names(),  # 'local' on Linux only
+        'Compact After Days': ['30', '7', '0'],  # for Compact Runs
     }
     QIIME2_KEY_TO_VALUES: Dict[str, Union[List[str], bool]] = {
         'fq-dir': ['data'],
@@ -106,8 +151,15 @@ class IlluminaMode:
         'pacbio_mode',
         'load_parameters',
         'save_parameters',
+        'preview_fastq',
+        'check_sample_sheet',
+        'upload_reads',
         'show_dashboard',
         'submit',
+        'submit_quick_look',
+        'submit_sweep',
+        'submit_sharded',
+        'append_samples',
     ]
 
 
@@ -117,7 +169,20 @@ class PacBioMode:
         'User': [''],
         'Host': ['255.255.255.255'],
         'Port': ['22'],
+        'Dashboard Hosts': [''],  # comma-separated, listed together in the dashboard, empty for the Host only
         'Qiime2 Pipeline': ['qiime2_pipeline-2.10.2'],
+        'Scratch Dir': ['/tmp', '/dev/shm'],
+        'Scratch Min Free GB': ['20'],
+        'Reference Cache Dir': ['', '/tmp/qiime2app-references'],  # empty to read the references in place
+        'Reference Cache GB': ['50'],
+        'Pin CPUs': ['no', 'yes'],  # to CPUs not used by the other jobs on the host
+        'Nice': ['0', '10', '19'],
+        'IO Priority': ['best-effort', 'idle'],
+        'Cgroup Memory GB': ['', '16', '32', '64'],  # empty for no cgroup limits
+        'Samples Per Shard': ['200'],  # for Submit Sharded
+        'Quick Look Reads': ['10000', '0.01'],  # per sample for Quick Look, a fraction of the reads if below 1
+        'Job Backend': backend_names(),  # 'local' on Linux only
+        'Compact After Days': ['30', '7', '0'],  # for Compact Runs
     }
     QIIME2_KEY_TO_VALUES: Dict[str, Union[List[str], bool]] = {
         'fq-dir': ['data'],
@@ -153,8 +218,15 @@ class PacBioMode:
         'illumina_mode',
         'load_parameters',
         'save_parameters',
+        'preview_fastq',
+        'check_sample_sheet',
+        'upload_reads',
         'show_dashboard',
         'submit',
+        'submit_quick_look',
+        'submit_sweep',
+        'submit_sharded',
+        'append_samples',
     ]
 
 
@@ -188,6 +260,9 @@ class Dashboard(QWidget):
 
     vertical_layout: QVBoxLayout
     table: QTableWidget
+    host_to_jobs: Dict[str, List[Tuple[str, ...]]]
+    finished_table: QTableWidget
+    finished_events: Dict[str, Tuple[str, str, str, str, str, Dict[str, Any]]]
     button_layout: QHBoxLayout
     buttons: List[Button]
 
@@ -200,9 +275,15 @@ class Dashboard(QWidget):
         self.vertical_layout = QVBoxLayout()
         self.setLayout(self.vertical_layout)
 
+        self.vertical_layout.addWidget(QLabel('Running Jobs', self))
         self.table = QTableWidget(parent=self)
+        self.table.setSortingEnabled(True)  # e.g. by host
         self.vertical_layout.addWidget(self.table)
 
+        self.vertical_layout.addWidget(QLabel('Finished Jobs', self))
+        self.finished_table = QTableWidget(parent=self)
+        self.vertical_layout.addWidget(self.finished_table)
+
         self.button_layout = QHBoxLayout()
         self.button_layout.addStretch(1)
         self.vertical_layout.addLayout(self.button_layout)
@@ -214,35 +295,161 @@ class Dashboard(QWidget):
             button = Button(key=key, qbutton=qbutton)
             self.buttons.append(button)
 
-        self.display_jobs(jobs=[])
-
-    def display_jobs(self, jobs: List[Tuple[str, str, str]]):
-        columns = ['Job ID', 'Start Time', 'Elapsed Time']
-        self.table.setRowCount(len(jobs))
-        self.table.setColumnCount(len(columns))
-        self.table.setHorizontalHeaderLabels(columns)
-
-        for row, job in enumerate(jobs):
-            job_id, start_time, elapsed_time = job
-            for col, text in enumerate([job_id, start_time, elapsed_time]):
+        self.finished_events = {}
+        self.host_to_jobs = {}
+        self.display_jobs(host_to_jobs={})
+        self.display_finished_jobs(events=[])
+
+    def display_jobs(self, host_to_jobs: Dict[str, List[Tuple[str, ...]]], replace: bool = False):
+        """
+        The running jobs are grouped by host, in the order of the hosts, and can be sorted by any column
+
+        :param replace: also removes the jobs of the hosts not in `host_to_jobs`, otherwise only those of its hosts are updated
+        """
+        if replace:
+            self.host_to_jobs = {}
+        self.host_to_jobs.update(host_to_jobs)
+
+        rows = [(host, ) + tuple(job) for host, jobs in self.host_to_jobs.items() for job in jobs]
+        columns = ['Host', 'Job ID', 'Start Time', 'Elapsed Time', 'Progress', 'Placement']  # only the local backend reports the progress
+        self.__fill_table(table=self.table, columns=columns, rows=rows)
+
+    def display_finished_jobs(self, events: List[Tuple[str, str, str, str, str, Dict[str, Any]]]):
+        """
+        Events accumulate as the watcher receives them, the newest is shown on top
+        """
+        for event in events:
+            self.finished_events[event[0]] = event
+
+        rows = []
+        for _, event in sorted(self.finished_events.items(), reverse=True):
+            _, job_name, exit_code, end_time, outdir, stats = event
+            rows.append((
+                job_name,
+                exit_code,
+                end_time,
+                format_seconds(stats.get('wall_seconds')),
+                format_bytes(kilobytes_to_bytes(stats.get('max_rss_kb'))),
+                format_bytes(kilobytes_to_bytes(stats.get('max_tree_rss_kb'))),
+                format_seconds(stats.get('user_cpu_seconds')),
+                format_seconds(stats.get('sys_cpu_seconds')),
+                format_cpu_efficiency(stats),
+                format_bytes(stats.get('read_bytes')),
+                format_bytes(stats.get('write_bytes')),
+                format_sharded_wall_time(
+                    outdir=outdir, end_time=end_time, stats=stats, events=list(self.finished_events.values())),
+                stats.get('placement', ''),
+                outdir,
+            ))
+
+        columns = [
+            'Job Name', 'Exit Code', 'End Time', 'Wall Time', 'Peak RSS', 'Peak Tree RSS', 'User CPU', 'System CPU',
+            'CPU Efficiency', 'Disk Read', 'Disk Write', 'Sharded Wall Time', 'Placement', 'Outdir']
+        self.__fill_table(table=self.finished_table, columns=columns, rows=rows)
+
+    def __fill_table(self, table: QTableWidget, columns: List[str], rows: List[Tuple[str, ...]]):
+        sorting = table.isSortingEnabled()
+        table.setSortingEnabled(False)  # otherwise the rows are moved while being filled
+        table.setRowCount(len(rows))
+        table.setColumnCount(len(columns))
+        table.setHorizontalHeaderLabels(columns)
+
+        for row, texts in enumerate(rows):
+            for col, text in enumerate(texts):
                 item = QTableWidgetItem(text)
                 item.setFlags(item.flags() & ~Qt.ItemIsEditable)  # makes the item immutable, i.e. user cannot edit it
-                self.table.setItem(row, col, item)
+                table.setItem(row, col, item)
 
-        self.table.resizeColumnsToContents()
+        table.setSortingEnabled(sorting)
+        table.resizeColumnsToContents()
 
-    def get_selected_job_ids(self) -> List[str]:
+    def get_selected_jobs(self) -> List[Tuple[str, str]]:
+        """
+        :return: the host and the job ID of each selected running job, in the order shown
+        """
         selected_rows = []
         for item in self.table.selectedItems():
             row = item.row()
             if row not in selected_rows:
                 selected_rows.append(row)
 
-        job_ids = [
-            self.table.item(row, 0).text()  # column 0 is the job_id
+        jobs = [
+            (self.table.item(row, 0).text(), self.table.item(row, 1).text())  # column 0 is the host, 1 the job_id
             for row in selected_rows
         ]
-        return job_ids
+        return jobs
+
+    def get_selected_finished_events(self) -> List[Tuple[str, str, str, str, str, Dict[str, Any]]]:
+        events = [event for _, event in sorted(self.finished_events.items(), reverse=True)]  # in the order shown
+        rows = sorted(set(item.row() for item in self.finished_table.selectedItems()))
+        return [events[row] for row in rows]
+
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return ''
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f'{int(hours)}h {int(minutes)}m {int(seconds)}s'
+
+
+def kilobytes_to_bytes(kilobytes: Optional[int]) -> Optional[int]:
+    return None if kilobytes is None else kilobytes * 1024
+
+
+def format_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return ''
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024:
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+        n /= 1024
+    return f'{n:.1f} TB'
+
+
+def format_sharded_wall_time(
+        outdir: str,
+        end_time: str,
+        stats: Dict[str, Any],
+        events: List[Tuple[str, str, str, str, str, Dict[str, Any]]]) -> str:
+    """
+    For a run over shards, the measured wall-clock time from the start of its first shard to its own end,
+    to compare with the 'Wall Time' of an unsharded run of the same samples
+
+    Shards which ended after the run are of a later submission into the same outdir
+    """
+    try:
+        end = parse_end_time(end_time).timestamp()
+        starts = [
+            parse_end_time(shard_end_time).timestamp() - shard_stats['wall_seconds']
+            for _, _, _, shard_end_time, shard_outdir, shard_stats in events
+            if is_shard_of(outdir=shard_outdir, parent_outdir=outdir)
+            and parse_end_time(shard_end_time).timestamp() <= end
+        ]
+    except (KeyError, TypeError, ValueError):  # stats or end time missing
+        return ''
+    if len(starts) == 0 or 'wall_seconds' not in stats:
+        return ''  # not sharded, or not run
+    return format_seconds(end - min(starts))
+
+
+def parse_end_time(end_time: str) -> datetime:
+    """
+    The end time of an event, e.g. '02/16/2025 03:25:51 PM'
+    """
+    return datetime.strptime(end_time, '%m/%d/%Y %I:%M:%S %p')
+
+
+def format_cpu_efficiency(stats: Dict[str, Any]) -> str:
+    """
+    CPU time over the wall time of all requested threads,
+    a low value means `threads` could be reduced without slowing the job down
+    """
+    try:
+        cpu = stats['user_cpu_seconds'] + stats['sys_cpu_seconds']
+        return f'{cpu / (stats["wall_seconds"] * stats["threads"]):.0%}'
+    except (KeyError, TypeError, ZeroDivisionError):
+        return ''
 
 
 class View(QWidget):
@@ -251,9 +458,15 @@ class View(QWidget):
     ICON_FILE = 'icon/logo.ico'
     WIDTH, HEIGHT = 1000, 1000
 
-    edits: List[Edit]
+    edits: Dict[str, Edit]  # by key
     buttons: List[Button]
     dashboard: Dashboard
+    resource_chart: 'ResourceChart'
+    stage_comparison: 'StageComparison'
+    run_comparison: 'RunComparison'
+    compaction_report: 'CompactionReport'
+    fastq_preview: 'FastqPreview'
+    gallery: 'Gallery'
 
     question_layout: QVBoxLayout
     button_layout: QHBoxLayout
@@ -263,6 +476,8 @@ class View(QWidget):
     dashboard: Dashboard
 
     mode: Union[IlluminaMode, PacBioMode]
+    schema: Optional[Dict[str, Dict[str, Any]]]  # of the pipeline release, None for the options of IlluminaMode and PacBioMode
+    qiime2_key_to_values: Dict[str, Union[List[str], bool]]  # of the mode, for the pipeline release of the schema
 
     def __init__(self):
         super().__init__()
@@ -272,6 +487,12 @@ class View(QWidget):
         self.__init_edits()
         self.__init_buttons()
         self.dashboard = Dashboard()
+        self.resource_chart = ResourceChart()
+        self.stage_comparison = StageComparison()
+        self.run_comparison = RunComparison()
+        self.compaction_report = CompactionReport()
+        self.fastq_preview = FastqPreview()
+        self.gallery = Gallery()
 
         self.__init_question_layout()
         self.__init_button_layout()
@@ -280,24 +501,27 @@ class View(QWidget):
 
         self.__init_ui_methods()
 
+        self.schema = None
         self.show_illumina_mode()
 
     def __init_edits(self):
-        self.edits = []
+        self.edits = {}
         for key, type_ in EDIT_KEY_TO_TYPE.items():
-            qlabel = QLabel(f'{key}:', self)
+            self.edits[key] = self.__new_edit(key=key, type_=type_)
 
-            if type_ is QCheckBox:
-                qedit = QCheckBox(self)
-            else:
-                qedit = QComboBox(self)
-                qedit.setEditable(True)
+    def __new_edit(self, key: str, type_: type) -> Edit:
+        qlabel = QLabel(f'{key}:', self)
+
+        if type_ is QCheckBox:
+            qedit = QCheckBox(self)
+        else:
+            qedit = QComboBox(self)
+            qedit.setEditable(True)
 
-            qlabel.hide()  # hide by default, show it later depending on the mode
-            qedit.hide()
+        qlabel.hide()  # hide by default, show it later depending on the mode
+        qedit.hide()
 
-            edit = Edit(key=key, qlabel=qlabel, qedit=qedit)
-            self.edits.append(edit)
+        return Edit(key=key, qlabel=qlabel, qedit=qedit)
 
     def __init_buttons(self):
         self.buttons = []
@@ -309,7 +533,7 @@ class View(QWidget):
 
     def __init_question_layout(self):
         self.question_layout = QVBoxLayout()
-        for edit in self.edits:
+        for edit in self.edits.values():
             self.question_layout.addWidget(edit.qlabel)
             self.question_layout.addWidget(edit.qedit)
 
@@ -333,12 +557,16 @@ class View(QWidget):
         self.setLayout(self.main_layout)
 
     def __init_ui_methods(self):
+        self.notify = Notification(self)
         self.message_box_info = MessageBoxInfo(self)
         self.message_box_error = MessageBoxError(self)
         self.message_box_yes_no = MessageBoxYesNo(self)
+        self.message_box_choice = MessageBoxChoice(self)
         self.file_dialog_open = FileDialogOpen(self)
+        self.file_dialog_open_files = FileDialogOpenFiles(self)
         self.file_dialog_save = FileDialogSave(self)
         self.password_dialog = PasswordDialog(self)
+        self.sweep_dialog = SweepDialog(self)
 
     def show_illumina_mode(self):
         self.mode = IlluminaMode()
@@ -348,14 +576,37 @@ class View(QWidget):
         self.mode = PacBioMode()
         self.__show_mode()
 
+    def set_schema(self, schema: Optional[Dict[str, Dict[str, Any]]]):
+        """
+        Shows the options of the pipeline release instead of the hardcoded ones of the modes, see src/schema.py,
+        adding edits for the options new to the app, and keeping the values entered for the options still there
+        """
+        self.schema = schema
+        for key, option in (schema or {}).items():
+            if key not in self.edits:
+                edit = self.__new_edit(key=key, type_=QCheckBox if option['flag'] else QComboBox)
+                self.edits[key] = edit
+                n = self.question_layout.count() - 1  # before the button layout
+                self.question_layout.insertWidget(n, edit.qlabel)
+                self.question_layout.insertWidget(n + 1, edit.qedit)
+
+        parameters = {k: v for k, v in self.get_key_values().items() if v is not False}  # a present flag is checked
+        self.__show_mode()
+        self.set_parameters(parameters=parameters)
+
     def __show_mode(self):
 
         self.setWindowTitle(f'{self.TITLE} - {self.mode.NAME}')
 
+        self.qiime2_key_to_values = self.mode.QIIME2_KEY_TO_VALUES
+        if self.schema is not None:
+            self.qiime2_key_to_values = merge_schema(
+                key_to_values=self.mode.QIIME2_KEY_TO_VALUES, schema=self.schema, known_keys=list(EDIT_KEY_TO_TYPE.keys()))
+
         key_to_values: Dict[str, Union[List[str], bool]]
-        key_to_values = {**self.mode.SSH_KEY_TO_VALUES, **self.mode.QIIME2_KEY_TO_VALUES}  # combine the two dictionaries
+        key_to_values = {**self.mode.SSH_KEY_TO_VALUES, **self.qiime2_key_to_values}  # combine the two dictionaries
 
-        for edit in self.edits:
+        for edit in self.edits.values():
 
             values = key_to_values.get(edit.key, None)
 
@@ -380,7 +631,7 @@ class View(QWidget):
                 button.qbutton.hide()
 
     def get_key_values(self) -> Dict[str, Union[str, bool]]:
-        keys = list(self.mode.SSH_KEY_TO_VALUES.keys()) + list(self.mode.QIIME2_KEY_TO_VALUES.keys())
+        keys = list(self.mode.SSH_KEY_TO_VALUES.keys()) + list(self.qiime2_key_to_values.keys())
         return self.__get_key_values(keys=keys)
 
     def get_ssh_key_values(self) -> Dict[str, Union[str, bool]]:
@@ -388,14 +639,15 @@ class View(QWidget):
         return self.__get_key_values(keys=keys)
 
     def get_qiime2_key_values(self) -> Dict[str, Union[str, bool]]:
-        keys = list(self.mode.QIIME2_KEY_TO_VALUES.keys())
+        keys = list(self.qiime2_key_to_values.keys())
         return self.__get_key_values(keys=keys)
 
     def __get_key_values(self, keys: List[str]) -> Dict[str, str]:
         ret = {}
 
-        for edit in self.edits:
-            if edit.key not in keys:
+        for key in keys:
+            edit = self.edits.get(key, None)
+            if edit is None:
                 continue
 
             e = edit.qedit
@@ -403,29 +655,29 @@ class View(QWidget):
                 continue
 
             if type(e) is QComboBox:
-                ret[edit.key] = e.currentText()
+                ret[key] = e.currentText()
             elif type(e) is QCheckBox:
-                ret[edit.key] = e.isChecked()
+                ret[key] = e.isChecked()
 
         return ret
 
     def set_parameters(self, parameters: Dict[str, Union[str, bool]]):
         # Reset all visible flags to False because
         #   when a flag is not present in parameters, it should be False
-        for edit in self.edits:
+        for edit in self.edits.values():
             e = edit.qedit
             if e.isHidden():
                 continue
             if type(e) is QCheckBox:
                 e.setChecked(False)
 
-        for edit in self.edits:
-            e = edit.qedit
-            if e.isHidden():
+        for key, val in parameters.items():
+            edit = self.edits.get(key, None)
+            if edit is None or val is None:
                 continue
 
-            val = parameters.get(edit.key, None)
-            if val is None:
+            e = edit.qedit
+            if e.isHidden():
                 continue
 
             if type(e) is QComboBox:
@@ -441,13 +693,61 @@ class View(QWidget):
         self.dashboard.raise_()
         self.dashboard.activateWindow()
 
-    def display_jobs(self, jobs: List[Tuple[str, str, str]]):
-        self.dashboard.display_jobs(jobs)
+    def display_jobs(self, host_to_jobs: Dict[str, List[Tuple[str, ...]]], replace: bool = False):
+        self.dashboard.display_jobs(host_to_jobs=host_to_jobs, replace=replace)
         self.dashboard.raise_()
         self.dashboard.activateWindow()
 
+    def show_resource_chart(self):
+        self.resource_chart.show()
+        self.resource_chart.update()  # repaint with the new samples
+        self.resource_chart.raise_()
+        self.resource_chart.activateWindow()
+
+    def show_stage_comparison(self, rows: List[Tuple[str, int, Dict[str, float]]]):
+        self.stage_comparison.display(rows=rows)
+        self.stage_comparison.show()
+        self.stage_comparison.raise_()
+        self.stage_comparison.activateWindow()
+
+    def show_run_comparison(self, summary: Dict[str, Any]):
+        self.run_comparison.display(summary=summary)
+        self.run_comparison.show()
+        self.run_comparison.raise_()
+        self.run_comparison.activateWindow()
+
+    def show_compaction_report(self, runs: List[Dict[str, Any]]):
+        self.compaction_report.display(runs=runs)
+        self.compaction_report.show()
+        self.compaction_report.raise_()
+        self.compaction_report.activateWindow()
+
+    def show_fastq_preview(self, summary: Dict[str, Any]):
+        self.fastq_preview.display(summary=summary)
+        self.fastq_preview.show()
+        self.fastq_preview.raise_()
+        self.fastq_preview.activateWindow()
+
+    def show_gallery(self, title: str, figures: List[Dict[str, Any]]):
+        self.gallery.display(title=title, figures=figures)
+        self.gallery.show()
+        self.gallery.raise_()
+        self.gallery.activateWindow()
+
+    def open_file(self, file: str):
+        """
+        With the default viewer of the desktop, e.g. for a PDF figure
+        """
+        QDesktopServices.openUrl(QUrl.fromLocalFile(file))
+
     def closeEvent(self, event):
         self.dashboard.close()
+        self.resource_chart.close()
+        self.stage_comparison.close()
+        self.run_comparison.close()
+        self.compaction_report.close()
+        self.fastq_preview.close()
+        self.gallery.close()
 
 
 #
@@ -497,6 +797,47 @@ class MessageBoxYesNo(MessageBox):
         return self.box.exec_() == QMessageBox.Yes
 
 
+class MessageBoxChoice(MessageBox):
+
+    TITLE = ' '
+    ICON = QMessageBox.Question
+
+    def __call__(self, msg: str, choices: List[str]) -> str:
+        """
+        :return: the text of the clicked button, the last choice when the box is closed
+        """
+        self.box.setText(msg)
+        for button in self.box.buttons():
+            self.box.removeButton(button)
+        buttons = [self.box.addButton(c, QMessageBox.AcceptRole) for c in choices]
+        self.box.setEscapeButton(buttons[-1])
+        self.box.exec_()
+        clicked = self.box.clickedButton()
+        return clicked.text() if clicked in buttons else choices[-1]
+
+
+#
+
+
+class Notification:
+    """
+    Desktop notification from the system tray, also printed to the console
+    """
+
+    tray_icon: Optional[QSystemTrayIcon]
+
+    def __init__(self, parent: QWidget):
+        self.tray_icon = None
+        if QSystemTrayIcon.isSystemTrayAvailable():
+            self.tray_icon = QSystemTrayIcon(parent.windowIcon(), parent)
+            self.tray_icon.show()
+
+    def __call__(self, title: str, msg: str):
+        if self.tray_icon is not None and QSystemTrayIcon.supportsMessages():
+            self.tray_icon.showMessage(title, msg)
+        print(f'{title}: {msg}', flush=True)
+
+
 #
 
 
@@ -532,6 +873,25 @@ class FileDialogOpen(FileDialog):
         return ''
 
 
+class FileDialogOpenFiles(FileDialog):
+
+    def __call__(self, title: str) -> List[str]:
+        d = QFileDialog(self.parent)
+        d.resize(1200, 800)
+        d.setWindowTitle(title)
+        d.setNameFilters([
+            'FASTQ Files (*.fastq *.fq *.fastq.gz *.fq.gz)',
+            'All Files (*.*)',
+        ])
+        d.selectNameFilter('FASTQ Files (*.fastq *.fq *.fastq.gz *.fq.gz)')
+        d.setOptions(QFileDialog.DontUseNativeDialog)
+        d.setFileMode(QFileDialog.ExistingFiles)  # any number of existing files can be selected
+        response = d.exec_()
+        if response == QFileDialog.Accepted:
+            return d.selectedFiles()
+        return []
+
+
 class FileDialogSave(FileDialog):
 
     def __call__(self, filename: str = '') -> str:
@@ -608,3 +968,500 @@ class PasswordDialog:
             return self.line_edit.text()
         else:
             return ''
+
+
+#
+
+
+class SweepDialog:
+
+    TITLE = 'Sweep'
+    HINT = 'Comma-separated values of the downstream parameters, one run per combination:'
+
+    parent: QWidget
+
+    def __init__(self, parent: QWidget):
+        self.parent = parent
+
+    def __call__(self, parameters: Dict[str, str]) -> Dict[str, List[str]]:
+        """
+        :param parameters: the sweepable parameters and their current values, to start from
+        :return: the keys with more than one value, empty if cancelled
+        """
+        dialog = QDialog(parent=self.parent)
+        dialog.setWindowTitle(self.TITLE)
+        layout = QFormLayout(dialog)
+        layout.addRow(QLabel(self.HINT, parent=dialog))
+
+        line_edits = {}
+        for key, val in parameters.items():
+            line_edits[key] = QLineEdit(val, parent=dialog)
+            layout.addRow(f'{key}:', line_edits[key])
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=dialog)
+        button_box.accepted.connect(dialog.accept)
+        button_box.rejected.connect(dialog.reject)
+        layout.addWidget(button_box)
+
+        if dialog.exec_() != QDialog.Accepted:
+            return {}
+
+        ret = {}
+        for key, line_edit in line_edits.items():
+            values = parse_sweep_values(line_edit.text())
+            if len(values) > 1:
+                ret[key] = values
+        return ret
+
+
+#
+
+
+class ResourceChart(QWidget):
+    """
+    One panel per resource over the run time, the samples are appended as they are fetched
+    and downsampled to one min/max bucket per pixel when drawn
+    """
+
+    TITLE = 'Resource Chart'
+    ICON_FILE = 'icon/logo.ico'
+    WIDTH, HEIGHT = 800, 600
+    MARGIN = 10
+    PANELS = [  # sample field, title, format of the values
+        ('cpu_cores', 'CPU (cores)', lambda v: f'{v:.1f}'),
+        ('rss_bytes', 'RSS', lambda v: format_bytes(int(v))),
+        ('read_bytes_per_second', 'Disk Read', lambda v: f'{format_bytes(int(v))}/s'),
+        ('write_bytes_per_second', 'Disk Write', lambda v: f'{format_bytes(int(v))}/s'),
+    ]
+
+    job_name: Optional[str]
+    n_bytes: int
+    columns: Dict[str, List[float]]
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowIcon(QIcon(f'{dirname(dirname(__file__))}/{self.ICON_FILE}'))
+        self.resize(self.WIDTH, self.HEIGHT)
+        self.reset(job_name=None)
+
+    def reset(self, job_name: Optional[str]):
+        self.job_name = job_name
+        self.n_bytes = 0  # of the whole records received, where the next fetch starts
+        self.columns = {field: [] for field in SAMPLE_FIELDS}
+        self.setWindowTitle(f'{self.TITLE} - {job_name}')
+
+    def append(self, data: bytes):
+        for field, values in parse_samples(data=data).items():
+            self.columns[field] += values
+        self.n_bytes += len(data) // SAMPLE_SIZE * SAMPLE_SIZE
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        xs = self.columns['seconds']
+        if len(xs) == 0:
+            painter.drawText(self.rect(), Qt.AlignCenter, 'No samples yet')
+            return
+
+        panel_height = self.height() // len(self.PANELS)
+        width = self.width() - 2 * self.MARGIN
+        x_max = max(xs[-1], 1.0)
+        text_height = painter.fontMetrics().height()
+        for i, (field, title, format_value) in enumerate(self.PANELS):
+            ys = self.columns[field]
+            y_max = max(max(ys), 1e-9)
+            painter.setPen(QPen(Qt.black))
+            painter.drawText(
+                self.MARGIN, i * panel_height + text_height,
+                f'{title}    peak {format_value(y_max)}    last {format_value(ys[-1])}    {format_seconds(xs[-1])}')
+            top = i * panel_height + text_height + self.MARGIN // 2
+            height = panel_height - text_height - self.MARGIN
+            painter.drawRect(self.MARGIN, top, width, height)
+
+            dx, dy = downsample_min_max(xs=xs, ys=ys, n_buckets=max(width, 1))
+            points = QPolygonF([
+                QPointF(
+                    self.MARGIN + x / x_max * width,
+                    top + height - y / y_max * height)
+                for x, y in zip(dx, dy)
+            ])
+            painter.setPen(QPen(Qt.blue))
+            painter.drawPolyline(points)
+
+
+#
+
+
+class StageComparison(QWidget):
+    """
+    Mean stage durations of each parameter set, the longest stage is the hot path
+    """
+
+    TITLE = 'Stage Comparison'
+    ICON_FILE = 'icon/logo.ico'
+    WIDTH, HEIGHT = 1000, 400
+
+    table: QTableWidget
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(self.TITLE)
+        self.setWindowIcon(QIcon(f'{dirname(dirname(__file__))}/{self.ICON_FILE}'))
+        self.resize(self.WIDTH, self.HEIGHT)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        self.table = QTableWidget(parent=self)
+        layout.addWidget(self.table)
+
+    def display(self, rows: List[Tuple[str, int, Dict[str, float]]]):
+        """
+        :param rows: list of (parameter set, number of runs, mean seconds of each stage)
+        """
+        present = set(stage for _, _, means in rows for stage in means)
+        stages = [s for s in [OTHER_STAGE] + [s for s, _ in STAGE_MARKERS] if s in present]
+        columns = ['Parameters', 'Runs', 'Hot Path'] + stages + ['Total']
+
+        self.table.setRowCount(len(rows))
+        self.table.setColumnCount(len(columns))
+        self.table.setHorizontalHeaderLabels(columns)
+        for row, (parameter_set, n_runs, means) in enumerate(rows):
+            hot_path = max(means, key=means.get) if len(means) > 0 else ''
+            texts = [parameter_set or '(all the same)', str(n_runs), hot_path]
+            texts += [format_seconds(means[s]) if s in means else '' for s in stages]
+            texts += [format_seconds(sum(means.values()))]
+            for col, text in enumerate(texts):
+                item = QTableWidgetItem(text)
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row, col, item)
+        self.table.resizeColumnsToContents()
+
+
+#
+
+
+class RunComparison(QWidget):
+    """
+    The summary from src/remote/compare_runs.py: richness of each run, relative abundance of the taxa
+    which differ the most between the runs, and the Bray-Curtis distances between the runs
+    """
+
+    TITLE = 'Run Comparison'
+    ICON_FILE = 'icon/logo.ico'
+    WIDTH, HEIGHT = 1000, 800
+
+    label: QLabel
+    runs_table: QTableWidget
+    taxa_table: QTableWidget
+    distances_table: QTableWidget
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(self.TITLE)
+        self.setWindowIcon(QIcon(f'{dirname(dirname(__file__))}/{self.ICON_FILE}'))
+        self.resize(self.WIDTH, self.HEIGHT)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        self.label = QLabel(self)
+        layout.addWidget(self.label)
+        self.runs_table = QTableWidget(parent=self)
+        self.taxa_table = QTableWidget(parent=self)
+        self.distances_table = QTableWidget(parent=self)
+        for title, table in [
+                ('Richness', self.runs_table),
+                ('Relative Abundance of the Most Different Taxa', self.taxa_table),
+                ('Bray-Curtis Distance', self.distances_table)]:
+            layout.addWidget(QLabel(title, self))
+            layout.addWidget(table)
+
+    def display(self, summary: Dict[str, Any]):
+        self.label.setText(f'Feature table "{summary["table"]}" at the {summary["level"]} level')
+        outdirs = [r['outdir'] for r in summary['runs']]
+
+        self.__fill_table(
+            table=self.runs_table,
+            columns=['Outdir', 'Samples', 'Features', 'Mean Features per Sample'],
+            rows=[(r['outdir'], str(r['samples']), str(r['features']), str(r['mean_richness'])) for r in summary['runs']])
+
+        self.__fill_table(  # one row per taxon, one column per run
+            table=self.taxa_table,
+            columns=['Taxon'] + outdirs,
+            rows=[
+                tuple([taxon] + [f'{row[j]:.2%}' for row in summary['abundance']])
+                for j, taxon in enumerate(summary['taxa'])
+            ])
+
+        self.__fill_table(
+            table=self.distances_table,
+            columns=[''] + outdirs,
+            rows=[tuple([outdir] + [f'{d:.3f}' for d in row]) for outdir, row in zip(outdirs, summary['distances'])])
+
+    def __fill_table(self, table: QTableWidget, columns: List[str], rows: List[Tuple[str, ...]]):
+        table.setRowCount(len(rows))
+        table.setColumnCount(len(columns))
+        table.setHorizontalHeaderLabels(columns)
+        for row, texts in enumerate(rows):
+            for col, text in enumerate(texts):
+                item = QTableWidgetItem(text)
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                table.setItem(row, col, item)
+        table.resizeColumnsToContents()
+
+
+#
+
+
+class CompactionReport(QWidget):
+    """
+    The disk space reclaimed per run by src/remote/compact_runs.py
+    """
+
+    TITLE = 'Compaction Report'
+    ICON_FILE = 'icon/logo.ico'
+    WIDTH, HEIGHT = 1000, 400
+
+    label: QLabel
+    table: QTableWidget
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(self.TITLE)
+        self.setWindowIcon(QIcon(f'{dirname(dirname(__file__))}/{self.ICON_FILE}'))
+        self.resize(self.WIDTH, self.HEIGHT)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        self.label = QLabel(self)
+        layout.addWidget(self.label)
+        self.table = QTableWidget(parent=self)
+        layout.addWidget(self.table)
+
+    def display(self, runs: List[Dict[str, Any]]):
+        """
+        :param runs: list of {'outdir', 'before', 'after', 'deleted', 'compressed'}, in bytes and lists of paths
+        """
+        reclaimed = sum(r['before'] - r['after'] for r in runs)
+        self.label.setText(f'{format_bytes(reclaimed)} reclaimed from {len(runs)} runs')
+
+        columns = ['Outdir', 'Before', 'After', 'Reclaimed', 'Deleted', 'Compressed']
+        self.table.setRowCount(len(runs))
+        self.table.setColumnCount(len(columns))
+        self.table.setHorizontalHeaderLabels(columns)
+        for row, r in enumerate(sorted(runs, key=lambda r: r['after'] - r['before'])):  # the most reclaimed first
+            texts = [
+                r['outdir'],
+                format_bytes(r['before']),
+                format_bytes(r['after']),
+                format_bytes(r['before'] - r['after']),
+                str(len(r['deleted'])),
+                str(len(r['compressed'])),
+            ]
+            for col, text in enumerate(texts):
+                item = QTableWidgetItem(text)
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row, col, item)
+        self.table.resizeColumnsToContents()
+
+
+#
+
+
+class Gallery(QWidget):
+    """
+    The figures of a run as a grid of thumbnails, each requested with `thumbnails_needed` only once it is scrolled into view,
+    and `figure_clicked` to open the figure itself, `closed` when the window is closed
+    """
+
+    TITLE = 'Figures'
+    ICON_FILE = 'icon/logo.ico'
+    WIDTH, HEIGHT = 1000, 800
+    THUMBNAIL_SIZE = 256
+
+    thumbnails_needed = pyqtSignal(list)  # figures, see src/remote/figures.py
+    figure_clicked = pyqtSignal(dict)
+    closed = pyqtSignal()
+
+    label: QLabel
+    list_widget: QListWidget
+    figures: List[Dict[str, Any]]
+    requested: set  # paths of the figures whose thumbnails were requested
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(self.TITLE)
+        self.setWindowIcon(QIcon(f'{dirname(dirname(__file__))}/{self.ICON_FILE}'))
+        self.resize(self.WIDTH, self.HEIGHT)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        self.label = QLabel(self)
+        layout.addWidget(self.label)
+
+        self.list_widget = QListWidget(self)
+        self.list_widget.setViewMode(QListView.IconMode)
+        self.list_widget.setResizeMode(QListView.Adjust)
+        self.list_widget.setMovement(QListView.Static)
+        self.list_widget.setUniformItemSizes(True)
+        self.list_widget.setIconSize(QSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE))
+        self.list_widget.setGridSize(QSize(self.THUMBNAIL_SIZE + 24, self.THUMBNAIL_SIZE + 48))
+        self.list_widget.setWordWrap(True)
+        self.list_widget.verticalScrollBar().valueChanged.connect(self.request_visible)
+        self.list_widget.itemClicked.connect(self.__on_item_clicked)
+        layout.addWidget(self.list_widget)
+
+        self.figures = []
+        self.requested = set()
+
+    def display(self, title: str, figures: List[Dict[str, Any]]):
+        self.setWindowTitle(f'{self.TITLE} - {title}')
+        self.label.setText(f'{len(figures)} figures, {format_bytes(sum(f["bytes"] for f in figures))}, click to open')
+        self.list_widget.clear()
+        self.figures = figures
+        self.requested = set()
+        for i, figure in enumerate(figures):
+            item = QListWidgetItem(figure['path'].split('/')[-1])
+            item.setToolTip(figure['path'])
+            item.setData(Qt.UserRole, i)
+            item.setSizeHint(self.list_widget.gridSize())
+            self.list_widget.addItem(item)
+        QTimer.singleShot(0, self.request_visible)  # once laid out
+
+    def request_visible(self):
+        viewport = self.list_widget.viewport().rect()
+        needed = []
+        for row in range(self.list_widget.count()):
+            figure = self.figures[row]
+            if figure['path'] in self.requested:
+                continue
+            if self.list_widget.visualItemRect(self.list_widget.item(row)).intersects(viewport):
+                needed.append(figure)
+        if len(needed) > 0:
+            self.requested.update(f['path'] for f in needed)
+            self.thumbnails_needed.emit(needed)
+
+    def set_thumbnail(self, path: str, data: Optional[bytes]):
+        """
+        :param data: PNG or JPEG bytes, None for a figure without thumbnail, e.g. PDF
+        """
+        for row in range(self.list_widget.count()):
+            if self.figures[row]['path'] != path:
+                continue
+            pixmap = QPixmap()
+            if data is not None and pixmap.loadFromData(data):
+                pixmap = pixmap.scaled(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                self.list_widget.item(row).setIcon(QIcon(pixmap))
+
+    def forget_requested(self, paths: list):
+        """
+        Of the thumbnails which could not be fetched, so that they are requested again once scrolled into view
+        """
+        self.requested.difference_update(paths)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.request_visible()
+
+    def closeEvent(self, event):
+        super().closeEvent(event)
+        self.closed.emit()
+
+    def __on_item_clicked(self, item: QListWidgetItem):
+        self.figure_clicked.emit(self.figures[item.data(Qt.UserRole)])
+
+
+#
+
+
+class FastqPreview(QWidget):
+    """
+    The summary from src/remote/preview_fastq.py: one column per read end, and the quality per position
+    """
+
+    TITLE = 'FASTQ Preview'
+    ICON_FILE = 'icon/logo.ico'
+    WIDTH, HEIGHT = 800, 800
+
+    label: QLabel
+    table: QTableWidget
+    chart: 'QualityChart'
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(self.TITLE)
+        self.setWindowIcon(QIcon(f'{dirname(dirname(__file__))}/{self.ICON_FILE}'))
+        self.resize(self.WIDTH, self.HEIGHT)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        self.label = QLabel(self)
+        self.label.setWordWrap(True)
+        layout.addWidget(self.label)
+        self.table = QTableWidget(parent=self)
+        layout.addWidget(self.table)
+        self.chart = QualityChart(parent=self)
+        layout.addWidget(self.chart, stretch=1)
+
+    def display(self, summary: Dict[str, Any]):
+        self.label.setText(f'First reads of {", ".join(summary["files"])}')
+
+        ends = list(summary['summaries'].keys())
+        rows = [
+            ('Reads', lambda s: str(s['reads'])),
+            ('Length (min / median / max)', lambda s: f'{s["lengths"]["min"]} / {s["lengths"]["median"]} / {s["lengths"]["max"]}'),
+            ('Primer', lambda s: f'{s["primer"]["name"]} in {s["primer"]["fraction"]:.1%}' if s['primer'] is not None else 'none found'),
+            ('Suggested 5\' Clipping', lambda s: str(s['clip']) if s['clip'] is not None else ''),
+            ('Expected Errors (median)', lambda s: str(s['expected_errors']['median'])),
+            ('Reads Kept at Current Max', lambda s: f'{s["expected_errors"]["retained_at_max_ee"]:.1%}'),
+        ]
+        self.table.setRowCount(len(rows))
+        self.table.setColumnCount(len(ends))
+        self.table.setHorizontalHeaderLabels([e.upper() for e in ends])
+        self.table.setVerticalHeaderLabels([title for title, _ in rows])
+        for row, (_, format_value) in enumerate(rows):
+            for col, end in enumerate(ends):
+                item = QTableWidgetItem(format_value(summary['summaries'][end]))
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row, col, item)
+        self.table.resizeColumnsToContents()
+        self.table.setFixedHeight(self.table.horizontalHeader().height() + self.table.verticalHeader().length() + 2)  # no scrolling
+
+        self.chart.qualities = {end.upper(): s['quality'] for end, s in summary['summaries'].items()}
+        self.chart.update()
+
+
+class QualityChart(QWidget):
+    """
+    The median (solid) and the lower quartile (dashed) of the quality at each position, one color per read end
+    """
+
+    MARGIN = 30
+    MAX_QUALITY = 42
+    COLORS = [Qt.blue, Qt.red]
+
+    qualities: Dict[str, Dict[str, List[float]]]
+
+    def __init__(self, parent: QWidget):
+        super().__init__(parent)
+        self.qualities = {}
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        length = max([len(q['median']) for q in self.qualities.values()], default=0)
+        if length == 0:
+            return
+
+        m = self.MARGIN
+        width, height = self.width() - 2 * m, self.height() - 2 * m
+        painter.setPen(QPen(Qt.black))
+        painter.drawRect(m, m, width, height)
+        for q in range(0, self.MAX_QUALITY + 1, 10):
+            y = m + height - q / self.MAX_QUALITY * height
+            painter.drawText(0, int(y), str(q))
+        painter.drawText(m, self.height() - m // 4, f'Quality per position (1 - {length})')
+
+        for i, (end, quality) in enumerate(self.qualities.items()):
+            color = self.COLORS[i % len(self.COLORS)]
+            painter.setPen(QPen(color))
+            painter.drawText(m + width - 40, m + (i + 1) * painter.fontMetrics().height(), end)
+            for key, style in [('median', Qt.SolidLine), ('q25', Qt.DashLine)]:
+                painter.setPen(QPen(color, 1, style))
+                painter.drawPolyline(QPolygonF([
+                    QPointF(m + x / max(length - 1, 1) * width, m + height - min(y, self.MAX_QUALITY) / self.MAX_QUALITY * height)
+                    for x, y in enumerate(quality[key])
+                ]))
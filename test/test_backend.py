@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import subprocess
+from typing import Tuple
+from src.backend import Backend, get_backend, backend_names, parse_screen_ls, parse_clock_duration
+from .setup import TestCase
+
+
+class TestFunction(TestCase):
+
+    def test_backend_names(self):
+        self.assertListEqual(['screen', 'slurm', 'pbs', 'local'], backend_names(platform='linux'))
+        self.assertListEqual(['screen', 'slurm', 'pbs'], backend_names(platform='darwin'))
+        self.assertListEqual(['screen', 'slurm', 'pbs'], backend_names(platform='win32'))
+
+    def test_incomplete_backend_is_refused(self):
+        class NoKill(Backend):  # without build_kill_cmd()
+            def build_submit_cmd(self, job_name, cmd_txt, outdir, threads, after=None):
+                return ''
+
+            def build_is_running_cmd(self, job_name):
+                return ''
+
+            def build_status_cmd(self):
+                return ''
+
+            def parse_status(self, stdout):
+                return []
+
+        with self.assertRaises(TypeError):
+            NoKill()
+        for name in backend_names():
+            get_backend(name)  # all implemented
+
+    def test_parse_screen_ls(self):
+        stdout = f'''\
+There are screens on:
+	835269.outdir_1	(02/16/2025 09:12:36 PM)	(Detached)
+	833015.outdir_2	(02/16/2025 03:25:51 PM)	(Detached)
+2 Sockets in /run/screen/S-linyc74.'''
+        jobs = parse_screen_ls(stdout=stdout)
+        self.assertTupleEqual(('835269.outdir_1', '02/16/2025 09:12:36 PM'), jobs[0][0:2])
+        self.assertTupleEqual(('833015.outdir_2', '02/16/2025 03:25:51 PM'), jobs[1][0:2])
+
+    def test_parse_squeue(self):
+        stdout = '''\
+1234|outdir_1|2025-02-16T15:25:51|1-02:03:04|RUNNING
+1235|outdir_2|N/A|0:00|PENDING
+'''
+        jobs = get_backend(name='slurm').parse_status(stdout=stdout)
+        self.assertListEqual([
+            ('1234.outdir_1', '2025-02-16 15:25:51', '26h 3m'),
+            ('1235.outdir_2', '', 'PENDING'),
+        ], jobs)
+
+    def test_parse_qstat(self):
+        stdout = '''\
+linyc74
+Job Id: 1234.headnode
+    Job_Name = outdir_1
+    Job_Owner = linyc74@login1
+    job_state = R
+    resources_used.walltime = 01:02:03
+    start_time = Sun Feb 16 15:25:51 2025
+
+Job Id: 1235.headnode
+    Job_Name = outdir_2
+    Job_Owner = linyc74@login1
+    job_state = Q
+
+Job Id: 1236.headnode
+    Job_Name = outdir_3
+    Job_Owner = someone@login1
+    job_state = R
+
+Job Id: 1237.headnode
+    Job_Name = outdir_4
+    Job_Owner = linyc74@login1
+    job_state = C
+'''
+        jobs = get_backend(name='pbs').parse_status(stdout=stdout)
+        self.assertListEqual([
+            ('1234.outdir_1', 'Sun Feb 16 15:25:51 2025', '1h 2m'),
+            ('1235.outdir_2', '', 'QUEUED'),
+        ], jobs)
+
+    def test_parse_ps(self):
+        stdout = '''\
+4321|Mon Oct 19 16:39:29 2026|1-01:02:03|outdir_1|Denoising\r 50%\r100%
+4322|Mon Oct 19 16:40:00 2026|00:05|outdir_2|
+'''
+        jobs = get_backend(name='local').parse_status(stdout=stdout)
+        self.assertListEqual([
+            ('4321.outdir_1', '10/19/2026 04:39:29 PM', '25h 2m', '100%'),
+            ('4322.outdir_2', '10/19/2026 04:40:00 PM', '0h 0m', ''),
+        ], jobs)
+
+    def test_parse_clock_duration(self):
+        self.assertEqual(184, parse_clock_duration('3:04'))
+        self.assertEqual(7384, parse_clock_duration('02:03:04'))
+        self.assertEqual(93784, parse_clock_duration('1-02:03:04'))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(AssertionError):
+            get_backend(name='lsf')
+
+
+class TestScheduler(TestCase):
+    """
+    Submits, lists and kills jobs through the commands of each backend,
+    with the fake Slurm and PBS commands in test/test_backend/bin, and on this machine for the local backend
+    """
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.env = dict(
+            os.environ,
+            PATH=f'{os.path.abspath(self.indir)}/bin:{os.environ["PATH"]}',
+            FAKE_SCHEDULER_DIR=os.path.abspath(f'{self.workdir}/scheduler'),
+            USER='qiime2app')
+        os.makedirs(f'{self.workdir}/outdir_1')
+        with open(f'{self.workdir}/outdir_1/command.txt', 'w') as fh:
+            fh.write('echo Denoising > outdir_1/progress.txt\necho started > outdir_1/started.txt\nsleep 30\n')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def run_bash(self, cmd: str) -> str:
+        return subprocess.run(
+            ['bash', '-c', cmd], cwd=self.workdir, env=self.env, capture_output=True, text=True, check=True).stdout
+
+    def submit_and_kill(self, name: str) -> Tuple[str, ...]:
+        """
+        :return: the job as listed while running
+        """
+        backend = get_backend(name=name)
+        self.submit_id = backend.parse_submit_id(stdout=self.run_bash(backend.build_submit_cmd(
+            job_name='outdir_1', cmd_txt='outdir_1/command.txt', outdir='outdir_1', threads='2')))
+        for _ in range(50):
+            if os.path.exists(f'{self.workdir}/outdir_1/started.txt'):
+                break
+            time.sleep(0.1)
+
+        jobs = backend.parse_status(stdout=self.run_bash(backend.build_status_cmd()))
+        self.assertEqual(1, len(jobs))
+        self.assertEqual('outdir_1', backend.job_name_of(job_id=jobs[0][0]))
+        self.assertEqual('0h 0m', jobs[0][2])
+        job = jobs[0]
+        self.assertTrue(self.is_running(backend, job_name='outdir_1'))
+        self.assertFalse(self.is_running(backend, job_name='outdir_2'))
+
+        self.run_bash(backend.build_kill_cmd(job_id=jobs[0][0]))
+        time.sleep(0.5)
+        jobs = backend.parse_status(stdout=self.run_bash(backend.build_status_cmd()))
+        self.assertListEqual([], jobs)
+        self.assertFalse(self.is_running(backend, job_name='outdir_1'))
+        return job
+
+    def is_running(self, backend, job_name: str) -> bool:
+        cmd = backend.build_is_running_cmd(job_name=job_name)
+        return subprocess.run(['bash', '-c', cmd], cwd=self.workdir, env=self.env).returncode == 0
+
+    def submit_after(self, name: str) -> dict:
+        """
+        :return: the job submitted after the one of submit_and_kill(), as recorded by the fake scheduler
+        """
+        backend = get_backend(name=name)
+        os.makedirs(f'{self.workdir}/outdir_2')
+        with open(f'{self.workdir}/outdir_2/command.txt', 'w') as fh:
+            fh.write('true\n')
+        submit_id = backend.parse_submit_id(stdout=self.run_bash(backend.build_submit_cmd(
+            job_name='outdir_2', cmd_txt='outdir_2/command.txt', outdir='outdir_2', threads='2', after=[self.submit_id])))
+        with open(f'{self.workdir}/scheduler/{submit_id.split(".")[0]}.json') as fh:
+            return json.load(fh)
+
+    def test_slurm(self):
+        self.submit_and_kill(name='slurm')
+        self.assertEqual(1, len([f for f in os.listdir(f'{self.workdir}/outdir_1') if f.startswith('slurm-')]))
+        self.assertEqual('1001', self.submit_id)
+        self.assertEqual('afterok:1001', self.submit_after(name='slurm')['dependency'])
+
+    def test_pbs(self):
+        self.submit_and_kill(name='pbs')
+        self.assertTrue(os.path.exists(f'{self.workdir}/outdir_1/pbs.out'))
+        self.assertEqual('1001.fakehost', self.submit_id)
+        self.assertEqual('depend=afterok:1001.fakehost', self.submit_after(name='pbs')['dependency'])
+
+    def test_local(self):
+        job = self.submit_and_kill(name='local')
+        self.assertEqual('Denoising', job[3])
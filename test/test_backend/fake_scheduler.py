@@ -0,0 +1,121 @@
+"""
+A stand-in for the Slurm and PBS commands used by src/backend.py, runs each job as a local process
+
+usage: python fake_scheduler.py <sbatch|squeue|scancel|qsub|qstat|qselect|qdel> [args...]
+
+The jobs are kept as JSON files in $FAKE_SCHEDULER_DIR, with their dependency, which is recorded but not enforced
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import subprocess
+from datetime import datetime
+
+
+STATE_DIR = os.environ['FAKE_SCHEDULER_DIR']
+
+
+def next_id():
+    os.makedirs(STATE_DIR, exist_ok=True)
+    ids = [int(f[:-len('.json')]) for f in os.listdir(STATE_DIR) if f.endswith('.json')]
+    return max(ids, default=1000) + 1
+
+
+def start(name, script, output, env=None, dependency=None):
+    id_ = next_id()
+    with open(output.replace('%j', str(id_)), 'w') as fh:
+        p = subprocess.Popen(
+            ['bash', '-c', script], stdout=fh, stderr=subprocess.STDOUT, env=env, start_new_session=True)
+    with open(f'{STATE_DIR}/{id_}.json', 'w') as fh:
+        json.dump({'id': id_, 'name': name, 'pid': p.pid, 'start': time.time(), 'dependency': dependency}, fh)
+    return id_
+
+
+def jobs():
+    ret = []
+    for f in sorted(os.listdir(STATE_DIR)) if os.path.isdir(STATE_DIR) else []:
+        if f.endswith('.json'):
+            with open(f'{STATE_DIR}/{f}') as fh:
+                ret.append(json.load(fh))
+    return ret
+
+
+def is_running(job):
+    try:
+        with open(f'/proc/{job["pid"]}/stat') as fh:
+            return fh.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except OSError:
+        return False
+
+
+def clock(seconds):
+    seconds = int(seconds)
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def kill(id_):
+    for job in jobs():
+        if str(job['id']) == id_ and is_running(job):
+            os.killpg(job['pid'], signal.SIGTERM)
+
+
+def main():
+    cmd, argv = sys.argv[1], sys.argv[2:]
+    parser = argparse.ArgumentParser()
+
+    if cmd == 'sbatch':
+        for a in ['--job-name', '--cpus-per-task', '--output', '--wrap', '--dependency', '--kill-on-invalid-dep']:
+            parser.add_argument(a)
+        parser.add_argument('--parsable', action='store_true')
+        args = parser.parse_args(argv)
+        print(start(name=args.job_name, script=args.wrap, output=args.output, dependency=args.dependency))
+
+    elif cmd == 'squeue':
+        for a in ['--user', '--name', '--format']:
+            parser.add_argument(a)
+        parser.add_argument('--noheader', action='store_true')
+        args = parser.parse_args(argv)
+        for job in filter(is_running, jobs()):
+            if args.name is not None and job['name'] != args.name:
+                continue
+            started = datetime.fromtimestamp(job['start']).strftime('%Y-%m-%dT%H:%M:%S')
+            if args.format == '%i':
+                print(job['id'])
+            else:
+                print(f"{job['id']}|{job['name']}|{started}|{clock(time.time() - job['start'])}|RUNNING")
+
+    elif cmd == 'qsub':
+        for a in ['-N', '-l', '-j', '-o', '-W']:
+            parser.add_argument(a)
+        args = parser.parse_args(argv)
+        env = dict(os.environ, PBS_O_WORKDIR=os.getcwd())
+        print(f'{start(name=args.N, script=sys.stdin.read(), output=args.o, env=env, dependency=args.W)}.fakehost')
+
+    elif cmd == 'qselect':
+        for a in ['-u', '-N', '-s']:
+            parser.add_argument(a)
+        args = parser.parse_args(argv)
+        for job in filter(is_running, jobs()):
+            if job['name'] == args.N:
+                print(f"{job['id']}.fakehost")
+
+    elif cmd == 'qstat':
+        for job in jobs():
+            started = datetime.fromtimestamp(job['start']).strftime('%a %b %d %H:%M:%S %Y')
+            print(f"Job Id: {job['id']}.fakehost")
+            print(f"    Job_Name = {job['name']}")
+            print(f"    Job_Owner = {os.environ['USER']}@fakehost")
+            print(f"    job_state = {'R' if is_running(job) else 'C'}")
+            print(f"    resources_used.walltime = {clock(time.time() - job['start'])}")
+            print(f"    start_time = {started}")
+            print()
+
+    elif cmd in ['scancel', 'qdel']:
+        kill(id_=argv[0])
+
+
+if __name__ == '__main__':
+    main()
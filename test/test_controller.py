@@ -1,15 +1,382 @@
-from src.controller import parse_screen_ls
+import os
+import gzip
+import json
+import time
+import base64
+import signal
+import subprocess
+from typing import List
+from unittest.mock import patch
+from src.backend import parse_screen_ls, get_backend
+from src.controller import parse_wait_events, build_job_script, build_wait_events_cmd, \
+    parse_df_available_kb, build_remove_scratch_cmd, build_remote_script_cmd, build_copy_upstream_cmd, build_subsample_cmd, \
+    STATUS_SEPARATOR, JOB_STATS_JSON, SCRATCH_DIRS, FINGERPRINTS_DIR, \
+    FINGERPRINT_PY, EXIT_CODE_TXT, SAMPLES_DIR, PROGRESS_TIMES_TSV, build_parameters_json, parse_parameters_json, \
+    build_fetch_samples_cmd, parse_fetched_samples, build_fetch_timelines_cmd, \
+    PLACEMENTS_SEPARATOR, PLACEMENTS_DIR, parse_status_with_placements, dashboard_hosts, fan_out, LOCAL_HOST, \
+    EVENTS_DIR, EVENTS_KEEP_DAYS
+from src.timeline import Timeline
 from .setup import TestCase
 
 
 class TestFunction(TestCase):
 
-    def test_parse_screen_ls(self):
+    def test_parse_wait_events(self):
+        stdout = f'''\
+1739712000000000000.outdir_1\toutdir_1\t0\t02/16/2025 09:20:00 PM\tproject/outdir_1\t{{"max_rss_kb": 1024}}
+1739713000000000000.outdir_2\toutdir_2\t1\t02/16/2025 09:36:40 PM\toutdir_2
+{STATUS_SEPARATOR}
+No Sockets found in /run/screen/S-linyc74.
+'''
+        events, screen_ls_stdout = parse_wait_events(stdout=stdout)
+        self.assertTupleEqual(
+            ('1739712000000000000.outdir_1', 'outdir_1', '0', '02/16/2025 09:20:00 PM', 'project/outdir_1', {'max_rss_kb': 1024}),
+            events[0])
+        self.assertEqual('1', events[1][2])
+        self.assertDictEqual({}, events[1][5])
+        self.assertListEqual([], parse_screen_ls(stdout=screen_ls_stdout))
+
+    def test_parse_status_with_placements(self):
         stdout = f'''\
 There are screens on:
-	835269.outdir_1	(02/16/2025 09:12:36 PM)	(Detached)
-	833015.outdir_2	(02/16/2025 03:25:51 PM)	(Detached)
-2 Sockets in /run/screen/S-linyc74.'''
-        jobs = parse_screen_ls(stdout=stdout)
-        self.assertTupleEqual(('835269.outdir_1', '02/16/2025 09:12:36 PM'), jobs[0][0:2])
-        self.assertTupleEqual(('833015.outdir_2', '02/16/2025 03:25:51 PM'), jobs[1][0:2])
+\t12345.outdir_1\t(02/16/2025 09:20:00 PM)\t(Detached)
+\t12346.outdir_2\t(02/16/2025 09:21:00 PM)\t(Detached)
+2 Sockets in /run/screen/S-linyc74.
+{PLACEMENTS_SEPARATOR}
+outdir_1\t{{"host": "node1", "pid": 1, "cpus": [0, 1], "text": "node1, CPUs 0-1, nice 10"}}
+outdir_3\t{{"host": "node1", "pid": 2, "cpus": [2], "text": "node1, CPUs 2"}}
+'''
+        jobs = parse_status_with_placements(backend=get_backend(name='screen'), stdout=stdout)
+        self.assertListEqual(['node1, CPUs 0-1, nice 10', ''], [j[4] for j in jobs])
+        self.assertListEqual(['', ''], [j[3] for j in jobs])  # screen does not report the progress
+
+    def test_dashboard_hosts(self):
+        s = {'Host': 'server1', 'Dashboard Hosts': '', 'Job Backend': 'slurm'}
+        self.assertListEqual(['server1'], dashboard_hosts(ssh_key_values=s))
+        s['Dashboard Hosts'] = 'server1, server2,,server3, server2'
+        self.assertListEqual(['server1', 'server2', 'server3'], dashboard_hosts(ssh_key_values=s))
+        s['Job Backend'] = 'local'
+        self.assertListEqual([LOCAL_HOST], dashboard_hosts(ssh_key_values=s))
+
+    def test_parse_df_available_kb(self):
+        stdout = '''\
+Filesystem     1024-blocks      Used Available Capacity Mounted on
+/dev/nvme0n1p1   960302804 388166128 523263716      43% /scratch
+'''
+        self.assertEqual(523263716, parse_df_available_kb(stdout=stdout))
+
+    def test_parameters_json(self):
+        parameters = {
+            'fq-dir': 'data',
+            'colormap': 'Set1',
+            'skip-otu': True,
+            'outdir': "output's",
+            'sample-sheet': "output's/sample     sheet.csv",
+        }
+        text = build_parameters_json(pipeline='qiime2_pipeline-2.10.2', parameters=parameters)
+        pipeline, parsed = parse_parameters_json(text=text)
+        self.assertEqual('qiime2_pipeline-2.10.2', pipeline)
+        self.assertDictEqual(parameters, parsed)
+
+
+class TestFanOut(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.ssh_key_values = {'Host': '', 'User': '', 'Port': '22', 'Job Backend': 'local'}
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_all_hosts_at_once(self):
+        host_to_stdout = fan_out(
+            ssh_key_values=self.ssh_key_values,
+            ssh_password='',
+            hosts=['server1', 'server2', 'server3'],
+            command='date +%s.%N && sleep 1 && date +%s.%N',
+            cwd=os.path.abspath(self.workdir))
+        self.assertListEqual(['server1', 'server2', 'server3'], list(host_to_stdout.keys()))
+        starts, ends = zip(*[map(float, stdout.split()) for stdout in host_to_stdout.values()])
+        self.assertLess(max(starts), min(ends))  # all running at the same time, not one after the other
+
+    def test_timeout(self):
+        host_to_stdout = fan_out(
+            ssh_key_values=self.ssh_key_values,
+            ssh_password='',
+            hosts=['server1'],
+            command='sleep 30',
+            timeout=0.5,
+            cwd=os.path.abspath(self.workdir))
+        self.assertIsInstance(host_to_stdout['server1'], TimeoutError)
+
+
+class TestJobScript(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        open(f'{self.workdir}/.profile', 'w').close()  # nothing to activate
+        self.scratch_dir = os.path.abspath(f'{self.workdir}/scratch')
+        os.makedirs(self.scratch_dir)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def run_bash(self, script: str, stdin: str = '') -> str:
+        return subprocess.run(
+            ['bash', '-c', script], cwd=self.workdir, input=stdin, capture_output=True, text=True, timeout=30).stdout
+
+    def run_job(
+            self,
+            job_name: str,
+            qiime2_cmd: str,
+            fingerprint: str = '0' * 64,
+            upstream_outdirs: List[str] = None,
+            upstream_cmd: str = '',
+            upstream_running_cmds: List[str] = None):
+        os.makedirs(f'{self.workdir}/{job_name}', exist_ok=True)
+        self.run_bash(build_job_script(
+            qiime2_cmd=qiime2_cmd,
+            job_name=job_name,
+            outdir=job_name,
+            scratch_dir=self.scratch_dir,
+            fingerprint=fingerprint,
+            wrapper_options={'threads': '2', 'reference-cache-dir': ''},
+            upstream_outdirs=upstream_outdirs,
+            upstream_cmd=upstream_cmd,
+            upstream_running_cmds=upstream_running_cmds))
+
+    def test_job_script_writes_event(self):
+        self.run_job(job_name='outdir_1', qiime2_cmd='echo running')
+        stdout = self.run_bash(build_wait_events_cmd(last_event='', timeout=5, status_cmd='screen -ls'))
+        events, _ = parse_wait_events(stdout=stdout)
+        self.assertEqual(1, len(events))
+        self.assertEqual('outdir_1', events[0][1])
+
+    def test_wait_events_returns_only_newer_events(self):
+        for job_name in ['outdir_1', 'outdir_2']:
+            self.run_job(job_name=job_name, qiime2_cmd='true')
+        stdout = self.run_bash(build_wait_events_cmd(last_event='', timeout=5, status_cmd='screen -ls'))
+        events, _ = parse_wait_events(stdout=stdout)
+        stdout = self.run_bash(build_wait_events_cmd(last_event=events[0][0], timeout=5, status_cmd='screen -ls'))
+        events, _ = parse_wait_events(stdout=stdout)
+        self.assertListEqual(['outdir_2'], [e[1] for e in events])
+
+    def test_old_events_are_deleted(self):
+        os.makedirs(f'{self.workdir}/{EVENTS_DIR}')
+        old = f'{self.workdir}/{EVENTS_DIR}/1600000000000000000.outdir_0'
+        with open(old, 'w') as fh:
+            fh.write('outdir_0\t0\t09/13/2020 12:26:40 PM\toutdir_0\n')
+        os.utime(old, (time.time() - (EVENTS_KEEP_DAYS + 1) * 86400, ) * 2)
+        self.run_job(job_name='outdir_1', qiime2_cmd='true')
+        self.assertListEqual(['outdir_1'], [f.split('.', 1)[1] for f in os.listdir(f'{self.workdir}/{EVENTS_DIR}')])
+
+    def test_exit_code_and_job_stats(self):
+        qiime2_cmd = "python -c 'x = bytearray(64 * 2 ** 20); print(len(x)); exit(3)'"
+        self.run_job(job_name='outdir_1', qiime2_cmd=qiime2_cmd)
+
+        with open(f'{self.workdir}/outdir_1/{JOB_STATS_JSON}') as fh:
+            stats = json.load(fh)
+        self.assertEqual(3, stats['exit_code'])
+        self.assertEqual(2, stats['threads'])
+        self.assertGreater(stats['max_rss_kb'], 64 * 1024)
+
+        stdout = self.run_bash(build_wait_events_cmd(last_event='', timeout=5, status_cmd='screen -ls'))
+        events, _ = parse_wait_events(stdout=stdout)
+        self.assertEqual('3', events[0][2])  # not the exit code of `tee`
+        self.assertDictEqual(stats, events[0][5])
+
+        with open(f'{self.workdir}/outdir_1/progress.txt') as fh:
+            self.assertEqual(f'{64 * 2 ** 20}\n', fh.read())
+
+    def test_job_runs_with_its_placement(self):
+        os.makedirs(f'{self.workdir}/outdir_1', exist_ok=True)
+        self.run_bash(build_job_script(
+            qiime2_cmd="python -c 'import os; print(os.nice(0))'",
+            job_name='outdir_1',
+            outdir='outdir_1',
+            scratch_dir=self.scratch_dir,
+            fingerprint='0' * 64,
+            wrapper_options={'threads': '1', 'pin-cpus': 'yes', 'nice': '10', 'io-priority': 'best-effort', 'cgroup-memory-gb': ''}))
+
+        with open(f'{self.workdir}/outdir_1/progress.txt') as fh:
+            self.assertEqual('10', fh.read().splitlines()[-1])
+        with open(f'{self.workdir}/outdir_1/{JOB_STATS_JSON}') as fh:
+            self.assertIn('nice 10', json.load(fh)['placement'])
+        self.assertListEqual(['.lock'], os.listdir(f'{self.workdir}/{PLACEMENTS_DIR}'))
+
+    def test_killed_job_writes_event(self):
+        os.makedirs(f'{self.workdir}/outdir_1', exist_ok=True)
+        script = build_job_script(
+            qiime2_cmd="python -c 'import time; print(1, flush=True); time.sleep(60)'",
+            job_name='outdir_1',
+            outdir='outdir_1',
+            scratch_dir=self.scratch_dir,
+            fingerprint='0' * 64,
+            wrapper_options={'threads': '1', 'reference-cache-dir': ''})
+        proc = subprocess.Popen(['bash', '-c', script], cwd=self.workdir, start_new_session=True)
+        for _ in range(100):
+            if os.path.exists(f'{self.workdir}/outdir_1/progress.txt') and \
+                    os.path.getsize(f'{self.workdir}/outdir_1/progress.txt') > 0:
+                break
+            time.sleep(0.1)
+        os.killpg(proc.pid, signal.SIGTERM)  # like `scancel`
+        proc.wait(timeout=30)
+
+        stdout = self.run_bash(build_wait_events_cmd(last_event='', timeout=5, status_cmd='screen -ls'))
+        events, _ = parse_wait_events(stdout=stdout)
+        self.assertEqual(1, len(events))
+        self.assertEqual('outdir_1', events[0][1])
+        self.assertNotEqual('0', events[0][2])
+
+    def test_scratch_dir_is_tmpdir_and_removed(self):
+        self.run_job(job_name='outdir_1', qiime2_cmd="python -c 'import tempfile; print(tempfile.gettempdir())'")
+        with open(f'{self.workdir}/outdir_1/progress.txt') as fh:
+            tmpdir = fh.read().strip()
+        self.assertTrue(tmpdir.startswith(f'{self.scratch_dir}/qiime2app-outdir_1-'))
+        self.assertListEqual([], os.listdir(self.scratch_dir))
+        self.assertListEqual([], os.listdir(f'{self.workdir}/{SCRATCH_DIRS}'))
+
+    def test_remove_scratch_of_killed_job(self):
+        scratch = f'{self.scratch_dir}/qiime2app-outdir_1-abc123'
+        os.makedirs(f'{scratch}/q2-artifacts')
+        os.makedirs(f'{self.workdir}/{SCRATCH_DIRS}')
+        with open(f'{self.workdir}/{SCRATCH_DIRS}/outdir_1', 'w') as fh:
+            fh.write(f'{scratch}\n')
+        self.run_bash(build_remove_scratch_cmd(job_name='outdir_1'))
+        self.assertListEqual([], os.listdir(self.scratch_dir))
+        self.assertListEqual([], os.listdir(f'{self.workdir}/{SCRATCH_DIRS}'))
+
+    def test_downstream_run_starts_from_upstream_outdir(self):
+        self.run_job(job_name='upstream', qiime2_cmd="bash -c 'echo denoised > upstream/table.qza'")
+        self.run_job(
+            job_name='downstream',
+            qiime2_cmd='cat downstream/table.qza',
+            upstream_outdirs=['upstream'],
+            upstream_cmd=build_copy_upstream_cmd(upstream_outdir='upstream', outdir='downstream'))
+
+        with open(f'{self.workdir}/downstream/progress.txt') as fh:
+            self.assertEqual('denoised\n', fh.read())
+        with open(f'{self.workdir}/downstream/{EXIT_CODE_TXT}') as fh:
+            self.assertEqual('0\n', fh.read())
+
+    def test_downstream_run_fails_with_upstream(self):
+        self.run_job(job_name='upstream', qiime2_cmd='false')
+        self.run_job(job_name='downstream', qiime2_cmd='echo running', upstream_outdirs=['upstream'])
+
+        with open(f'{self.workdir}/downstream/progress.txt') as fh:
+            self.assertEqual('The upstream run "upstream" failed\n', fh.read())
+        stdout = self.run_bash(build_wait_events_cmd(last_event='', timeout=5, status_cmd='screen -ls'))
+        events, _ = parse_wait_events(stdout=stdout)
+        self.assertListEqual([('upstream', '1'), ('downstream', '1')], [e[1:3] for e in events])
+
+    def test_downstream_run_fails_when_upstream_died(self):
+        os.makedirs(f'{self.workdir}/upstream')  # without an exit code, e.g. killed with SIGKILL
+        with patch('src.controller.UPSTREAM_GRACE_SECONDS', 1), patch('src.controller.UPSTREAM_WAIT_SECONDS', 1):
+            self.run_job(
+                job_name='downstream',
+                qiime2_cmd='echo running',
+                upstream_outdirs=['upstream'],
+                upstream_running_cmds=['false'])  # gone from the backend
+
+        with open(f'{self.workdir}/downstream/progress.txt') as fh:
+            self.assertEqual('The upstream run "upstream" is no longer running and did not exit\n', fh.read())
+        with open(f'{self.workdir}/downstream/{EXIT_CODE_TXT}') as fh:
+            self.assertEqual('1\n', fh.read())
+
+    def test_run_waits_for_all_shards(self):
+        for shard in ['shard-1', 'shard-2']:
+            self.run_job(job_name=shard, qiime2_cmd=f"bash -c 'echo {shard} > {shard}/table.tsv'")
+        self.run_job(
+            job_name='merged',
+            qiime2_cmd='cat merged/table.tsv',
+            upstream_outdirs=['shard-1', 'shard-2'],
+            upstream_cmd='cat shard-1/table.tsv shard-2/table.tsv > merged/table.tsv')
+
+        with open(f'{self.workdir}/merged/progress.txt') as fh:
+            self.assertEqual('shard-1\nshard-2\n', fh.read())
+
+    def test_quick_look_runs_on_subsample(self):
+        os.makedirs(f'{self.workdir}/fastq')
+        for sample in ['S1', 'S2']:
+            for read in ['R1', 'R2']:
+                with gzip.open(f'{self.workdir}/fastq/{sample}_{read}.fastq.gz', 'wt') as fh:
+                    fh.writelines(f'@{sample}.{i}/{read}\nACGT\n+\nIIII\n' for i in range(1000))
+        os.makedirs(f'{self.workdir}/quick-look-10')
+        with open(f'{self.workdir}/quick-look-10/sample-sheet.csv', 'w') as fh:
+            fh.write('sample-id,group\nS1,A\n')
+        self.run_job(
+            job_name='quick-look-10',
+            qiime2_cmd="bash -c 'ls quick-look-10/fastq && zcat quick-look-10/fastq/S1_R1.fastq.gz | wc -l'",
+            upstream_outdirs=[],
+            upstream_cmd=build_subsample_cmd(
+                fq_dir='fastq',
+                suffixes=['_R1.fastq.gz', '_R2.fastq.gz'],
+                sample_sheet='quick-look-10/sample-sheet.csv',
+                outdir='quick-look-10/fastq',
+                reads=10,
+                threads='2'))
+
+        with open(f'{self.workdir}/quick-look-10/progress.txt') as fh:
+            self.assertEqual('S1_R1.fastq.gz\nS1_R2.fastq.gz\n40\n', fh.read())  # only the sample of the sample sheet
+        with open(f'{self.workdir}/quick-look-10/{EXIT_CODE_TXT}') as fh:
+            self.assertEqual('0\n', fh.read())
+
+    def fingerprint(self, fq_dir: str) -> dict:
+        stdout = self.run_bash(build_remote_script_cmd(script=FINGERPRINT_PY, args={
+            'payloads': json.dumps([{'parameters': {'fq-dir': fq_dir}}]),
+            'fq-dir': fq_dir,
+            'suffixes': json.dumps(['_R1.fastq.gz']),
+            'sample-ids-fd': '3',
+            'registry-dir': FINGERPRINTS_DIR,
+            'cache': '.qiime2app/fastq-hashes.json',
+        }, stdin_fd=3), stdin=json.dumps(['S1'] + [f'S{i:06d}' for i in range(20000)]))  # longer than an argument can be
+        return json.loads(stdout)[0]
+
+    def test_successful_run_is_registered_by_fingerprint(self):
+        os.makedirs(f'{self.workdir}/fq dir')
+        with open(f'{self.workdir}/fq dir/S1_R1.fastq.gz', 'w') as fh:
+            fh.write('@read\nACGT\n+\nFFFF\n')
+
+        first = self.fingerprint(fq_dir='fq dir')
+        self.assertIsNone(first['outdir'])
+
+        self.run_job(job_name='outdir_1', qiime2_cmd='false', fingerprint=first['fingerprint'])
+        self.assertIsNone(self.fingerprint(fq_dir='fq dir')['outdir'])  # failed runs are not reused
+
+        self.run_job(job_name='outdir_2', qiime2_cmd='true', fingerprint=first['fingerprint'])
+        self.assertDictEqual({'fingerprint': first['fingerprint'], 'outdir': 'outdir_2'}, self.fingerprint(fq_dir='fq dir'))
+
+        with open(f'{self.workdir}/fq dir/S1_R1.fastq.gz', 'a') as fh:
+            fh.write('@read\nACGT\n+\nFFFF\n')
+        self.assertNotEqual(first['fingerprint'], self.fingerprint(fq_dir='fq dir')['fingerprint'])
+
+    def test_fetch_samples_from_offset(self):
+        os.makedirs(f'{self.workdir}/{SAMPLES_DIR}')
+        with open(f'{self.workdir}/{SAMPLES_DIR}/outdir_1.bin', 'wb') as fh:
+            fh.write(bytes(range(40)))
+        stdout = self.run_bash(build_fetch_samples_cmd(job_name='outdir_1', offset=20))
+        self.assertTupleEqual((20, bytes(range(20, 40))), parse_fetched_samples(stdout=stdout))
+        stdout = self.run_bash(build_fetch_samples_cmd(job_name='outdir_1', offset=60))  # rerun, a new file
+        self.assertTupleEqual((0, bytes(range(40))), parse_fetched_samples(stdout=stdout))
+        stdout = self.run_bash(build_fetch_samples_cmd(job_name='outdir_2', offset=0))
+        self.assertTupleEqual((0, b''), parse_fetched_samples(stdout=stdout))
+
+    def test_timeline_from_progress_times(self):
+        self.run_job(job_name='outdir_1', qiime2_cmd="printf 'qiime dada2 denoise-single\\nno newline at the end'")
+        with open(f'{self.workdir}/outdir_1/{PROGRESS_TIMES_TSV}') as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual('no newline at the end', lines[1].split('\t', 1)[1])
+
+        timeline = Timeline()
+        for _ in range(2):  # the second fetch has nothing new
+            stdout = self.run_bash(build_fetch_timelines_cmd(outdir_to_timeline={'outdir_1': timeline}))
+            first_timestamp, data = stdout.rstrip('\n').split('\t')
+            self.assertEqual(timeline.first_timestamp or first_timestamp, first_timestamp)
+            timeline.feed(data=base64.b64decode(data))
+        self.assertEqual('Denoising', timeline.stages[0][0])
+        self.assertEqual(os.path.getsize(f'{self.workdir}/outdir_1/{PROGRESS_TIMES_TSV}'), timeline.offset)
+
+        timeline.first_timestamp = '0'  # as if the outdir was rerun since
+        stdout = self.run_bash(build_fetch_timelines_cmd(outdir_to_timeline={'outdir_1': timeline}))
+        self.assertEqual(timeline.offset, len(base64.b64decode(stdout.rstrip('\n').split('\t')[1])))
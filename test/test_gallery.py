@@ -0,0 +1,37 @@
+import os
+import time
+from src.gallery import ImageCache, cache_key
+from .setup import TestCase
+
+
+class TestImageCache(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.cache = ImageCache(directory=f'{self.outdir}/figures', max_bytes=2500)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_cache_key(self):
+        key = cache_key(server='me@server1:22', remote_path='output/plots/PCoA.PDF', mtime=1, kind='figure')
+        self.assertTrue(key.endswith('-figure.pdf'))
+        self.assertNotEqual(key, cache_key(server='me@server1:22', remote_path='output/plots/PCoA.PDF', mtime=2, kind='figure'))
+        self.assertNotEqual(key, cache_key(server='me@server2:22', remote_path='output/plots/PCoA.PDF', mtime=1, kind='figure'))
+
+    def test_get_and_put(self):
+        self.assertIsNone(self.cache.get(key='a-thumbnail.png'))
+        file = self.cache.put(key='a-thumbnail.png', data=b'png')
+        self.assertEqual(file, self.cache.get(key='a-thumbnail.png'))
+        with open(file, 'rb') as fh:
+            self.assertEqual(b'png', fh.read())
+
+    def test_least_recently_used_is_evicted(self):
+        for key in ['a.png', 'b.png']:
+            self.cache.put(key=key, data=b'x' * 1000)
+            time.sleep(0.02)
+        self.cache.get(key='a.png')  # used after b
+        time.sleep(0.02)
+        self.cache.put(key='c.png', data=b'x' * 1000)
+
+        self.assertListEqual(['a.png', 'c.png'], sorted(os.listdir(f'{self.outdir}/figures')))
@@ -1,3 +1,4 @@
+import zipfile
 from src.io import IO
 from .setup import TestCase
 
@@ -28,6 +29,131 @@ class TestIO(TestCase):
         self.assertEqual(actual['skip-otu'], True)
         self.assertEqual(actual['colors'], "#59A257,#4A759D")
 
+    def test_read_sample_ids(self):
+        with open(f'{self.outdir}/sample-sheet.csv', 'w') as fh:
+            fh.write('Sample,Group\nS1,A\n"S,2",B\n\n')
+        actual = IO().read_sample_ids(f'{self.outdir}/sample-sheet.csv')
+        self.assertListEqual(['S1', 'S,2'], actual)
+
+        with open(f'{self.outdir}/sample-sheet.csv', 'w') as fh:
+            fh.write('Sample,Group\n#q2:types,categorical\nS1,A\nS1,B\n')
+        actual = IO().read_sample_ids(f'{self.outdir}/sample-sheet.csv')
+        self.assertListEqual(['#q2:types', 'S1', 'S1'], actual)  # as it is, for the fingerprint
+
+        with self.assertRaises(AssertionError):
+            IO().read_sample_ids(f'{self.outdir}/sample-sheet.xls')
+
+    def test_scan_sample_sheet(self):
+        with open(f'{self.outdir}/sample-sheet.csv', 'wb') as fh:
+            fh.write(
+                b'\xef\xbb\xbfSample,Group,Age,Site\n'
+                b'#q2:types,categorical,,categorical\n'
+                b'S1,A,30,1\n'
+                b'S2,B,41.5,2\n'
+                b'# a comment\n'
+                b'S 3,B,,Caf\xe9\n'  # a space in the ID, and cp1252
+                b'S1,A,x\x01,3\n')  # repeated, with a control character
+        summary = IO().scan_sample_sheet(f'{self.outdir}/sample-sheet.csv')
+
+        self.assertListEqual(['Sample', 'Group', 'Age', 'Site'], summary.columns)
+        self.assertDictEqual({'Group': 'categorical', 'Age': 'categorical', 'Site': 'categorical'}, summary.column_types)
+        self.assertListEqual(['S1', 'S2', 'S 3'], summary.sample_ids)
+        self.assertListEqual(['S1'], summary.duplicate_ids)
+        self.assertListEqual(['S 3'], summary.bad_ids)
+        self.assertListEqual(['row 7, column "Age"'], summary.bad_cells)
+        self.assertListEqual([6], summary.encoding_error_lines)
+        self.assertEqual(4, len(summary.problems()))
+
+    def test_scan_many_encoding_errors(self):
+        with open(f'{self.outdir}/sample-sheet.csv', 'wb') as fh:
+            fh.write(b'Sample,Site\n' + b''.join(b'S%d,Caf\xe9\n' % i for i in range(100)))
+        summary = IO().scan_sample_sheet(f'{self.outdir}/sample-sheet.csv')
+        self.assertEqual(100, summary.n_encoding_error_lines)
+        self.assertListEqual([2, 3, 4, 5, 6], summary.encoding_error_lines)
+
+    def test_infer_column_types(self):
+        with open(f'{self.outdir}/sample-sheet.tsv', 'w') as fh:
+            fh.write('Sample\tAge\tGroup\tNote\nS1\t30\tA\t\nS2\t-1e3\t2\t\n')
+        summary = IO().scan_sample_sheet(f'{self.outdir}/sample-sheet.tsv')
+        self.assertDictEqual({'Age': 'numeric', 'Group': 'categorical', 'Note': 'empty'}, summary.column_types)
+        self.assertListEqual([], summary.problems())
+
+    def test_scan_xlsx(self):
+        file = f'{self.outdir}/sample-sheet.xlsx'
+        ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        rel = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+        with zipfile.ZipFile(file, 'w') as z:
+            z.writestr('xl/workbook.xml', f'<workbook {ns} {rel}><sheets><sheet name="Sheet1" sheetId="1" r:id="rId1"/></sheets></workbook>')
+            z.writestr('xl/_rels/workbook.xml.rels', (
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/></Relationships>'))
+            z.writestr('xl/sharedStrings.xml', f'<sst {ns}><si><t>Sample</t></si><si><t>Depth</t></si><si><t>S1</t></si></sst>')
+            z.writestr('xl/worksheets/sheet1.xml', (
+                f'<worksheet {ns}><sheetData>'
+                '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="s"><v>1</v></c></row>'
+                '<row r="2"><c r="A2" t="s"><v>2</v></c><c r="C2"><v>12.0</v></c></row>'
+                '<row r="3"><c r="A3" t="inlineStr"><is><t>S2</t></is></c><c r="C3"><v>7</v></c></row>'
+                '</sheetData></worksheet>'))
+        summary = IO().scan_sample_sheet(file)
+        self.assertListEqual(['Sample', '', 'Depth'], summary.columns)
+        self.assertListEqual(['S1', 'S2'], summary.sample_ids)
+        self.assertEqual('numeric', summary.column_types['Depth'])
+        self.assertListEqual(['S1', 'S2'], IO().read_sample_ids(file))
+
+    def test_scan_is_cached_until_file_changes(self):
+        file = f'{self.outdir}/sample-sheet.csv'
+        with open(file, 'w') as fh:
+            fh.write('Sample\nS1\n')
+        io = IO()
+        first = io.scan_sample_sheet(file)
+        self.assertIs(first, io.scan_sample_sheet(file))
+        with open(file, 'w') as fh:
+            fh.write('Sample\nS1\nS2\n')
+        self.assertListEqual(['S1', 'S2'], io.scan_sample_sheet(file).sample_ids)
+
+    def test_split_sample_sheet(self):
+        with open(f'{self.outdir}/sample-sheet.tsv', 'w') as fh:
+            fh.write('Sample\tGroup\nS1\tA\nS2\tA\nS3\tB\n')
+        actual = IO().split_sample_sheet(
+            file=f'{self.outdir}/sample-sheet.tsv', samples_per_shard=2, outdir=f'{self.outdir}/shards')
+
+        self.assertListEqual([
+            f'{self.outdir}/shards/shard-1/sample-sheet.tsv',
+            f'{self.outdir}/shards/shard-2/sample-sheet.tsv',
+        ], actual)
+        with open(actual[1]) as fh:
+            self.assertEqual('Sample\tGroup\nS3\tB\n', fh.read())
+
+    def test_subset_sample_sheet(self):
+        with open(f'{self.outdir}/sample-sheet.csv', 'w') as fh:
+            fh.write('Sample,Group\nS1,A\nS2,A\nS3,B\n')
+        actual = IO().subset_sample_sheet(
+            file=f'{self.outdir}/sample-sheet.csv', sample_ids=['S3', 'S1'], outdir=f'{self.outdir}/added')
+
+        self.assertEqual(f'{self.outdir}/added/sample-sheet.csv', actual)
+        with open(actual) as fh:
+            self.assertEqual('Sample,Group\nS1,A\nS3,B\n', fh.read())
+
+    def test_patch_sample_sheet(self):
+        with open(f'{self.outdir}/sample-sheet.csv', 'w') as fh:
+            fh.write('Sample,Group\nS1,A\nS2,A\nS1,B\nS3,B\n')
+        removed, added = IO().patch_sample_sheet(
+            file=f'{self.outdir}/sample-sheet.csv',
+            sample_ids=['S1', 'S3', 'S4'],
+            add_missing=True,
+            patched_file=f'{self.outdir}/patched.csv')
+
+        self.assertListEqual(['S2', 'S1'], removed)
+        self.assertListEqual(['S4'], added)
+        with open(f'{self.outdir}/patched.csv') as fh:
+            self.assertEqual('Sample,Group\nS1,A\nS3,B\nS4,\n', fh.read())
+
+    def test_generate_sample_sheet(self):
+        IO().generate_sample_sheet(file=f'{self.outdir}/sample-sheet.tsv', sample_ids=['S1', 'S2'])
+        with open(f'{self.outdir}/sample-sheet.tsv') as fh:
+            self.assertEqual('Sample\nS1\nS2\n', fh.read())
+
     def test_write_txt(self):
         IO().write(
             parameters={
@@ -0,0 +1,54 @@
+import os
+import time
+import threading
+from io import StringIO
+from invoke.exceptions import UnexpectedExit
+from src.local import LocalConnection
+from .setup import TestCase
+
+
+class TestLocalConnection(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.con = LocalConnection()
+        self.workdir = os.path.abspath(self.workdir)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_run_in_dir(self):
+        with self.con.cd(self.workdir):
+            with self.con.cd('sub'):
+                result = self.con.run('pwd', hide=True, warn=True)
+            self.assertEqual(self.workdir, self.con.run('pwd', hide=True).stdout.strip())
+        self.assertEqual(1, result.exited)  # the dir 'sub' does not exist
+        self.assertEqual(os.path.expanduser('~'), self.con.run('pwd', hide=True).stdout.strip())
+
+    def test_bad_exit_code(self):
+        with self.assertRaises(UnexpectedExit):
+            self.con.run('exit 3', hide=True)
+        self.assertEqual(3, self.con.run('exit 3', hide=True, warn=True).exited)
+
+    def test_in_stream(self):
+        self.assertEqual('S1\n', self.con.run('cat', hide=True, in_stream=StringIO('S1\n')).stdout)
+        self.assertEqual('', self.con.run('cat', hide=True).stdout)  # no stdin without it
+
+    def test_put_and_get(self):
+        with open(f'{self.workdir}/sheet.csv', 'w') as fh:
+            fh.write('ID\nS1\n')
+        os.makedirs(f'{self.workdir}/outdir')
+        self.con.put(local=f'{self.workdir}/sheet.csv', remote=f'{self.workdir}/outdir/')
+        self.con.put(local=StringIO('echo hello\n'), remote=f'{self.workdir}/outdir/command.txt')
+        self.con.get(remote=f'{self.workdir}/outdir/sheet.csv', local=f'{self.workdir}/copy.csv')
+
+        self.assertFileEqual(f'{self.workdir}/sheet.csv', f'{self.workdir}/copy.csv')
+        with self.con.cd(self.workdir):
+            self.assertEqual('hello\n', self.con.run('bash outdir/command.txt', hide=True).stdout)
+
+    def test_close_stops_running_command(self):
+        threading.Timer(0.5, self.con.close).start()
+        start = time.time()
+        result = self.con.run('sleep 30', hide=True, warn=True)
+        self.assertLess(time.time() - start, 10)
+        self.assertNotEqual(0, result.exited)
@@ -0,0 +1,63 @@
+from src.pipeline import expand_grid, parse_sweep_values, resume_stage, parse_quick_look_reads, quick_look_parameters, \
+    format_quick_look_reads, stage_choice, START_STAGE_OPTION, STOP_STAGE_OPTION
+from .setup import TestCase
+
+
+class TestPipeline(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_expand_grid(self):
+        parameters = {'outdir': 'sweep', 'heatmap-read-fraction': '0.95', 'colormap': 'Set1', 'skip-otu': True}
+        actual = expand_grid(
+            parameters=parameters,
+            sweep={'heatmap-read-fraction': ['0.9', '0.95'], 'colormap': ['Set1', 'tab 10']})
+
+        self.assertEqual(4, len(actual))
+        self.assertDictEqual({  # first values, the upstream run
+            'outdir': 'sweep/heatmap-read-fraction-0.9_colormap-Set1',
+            'heatmap-read-fraction': '0.9',
+            'colormap': 'Set1',
+            'skip-otu': True,
+        }, actual[0])
+        self.assertEqual('sweep/heatmap-read-fraction-0.95_colormap-tab-10', actual[-1]['outdir'])
+
+    def test_upstream_parameter_cannot_be_swept(self):
+        with self.assertRaises(AssertionError):
+            expand_grid(parameters={'outdir': 'sweep', 'otu-identity': '0.97'}, sweep={'otu-identity': ['0.97', '0.99']})
+
+    def test_parse_sweep_values(self):
+        self.assertListEqual(['0.9', '0.95', '0.99'], parse_sweep_values('0.9, 0.95,0.99,'))
+
+    def test_resume_stage(self):
+        self.assertEqual('Denoising', resume_stage(types=['FeatureData[Sequence]']))
+        self.assertEqual('Classification', resume_stage(types=['FeatureData[Sequence]', 'FeatureTable[Frequency]']))
+        self.assertEqual('Plotting', resume_stage(
+            types=['FeatureTable[Frequency]', 'FeatureData[Sequence]', 'FeatureData[Taxonomy]', 'Phylogeny[Rooted]', 'DistanceMatrix']))
+
+    def test_stage_choice(self):
+        schema = {START_STAGE_OPTION: {'flag': False, 'choices': ['denoising', 'classification', 'diversity'], 'default': None}}
+        self.assertEqual('diversity', stage_choice(schema=schema, option=START_STAGE_OPTION, stage='Diversity'))
+        self.assertIsNone(stage_choice(schema=schema, option=START_STAGE_OPTION, stage='Plotting'))
+        self.assertIsNone(stage_choice(schema=schema, option=STOP_STAGE_OPTION, stage='Denoising'))  # no such option
+
+    def test_parse_quick_look_reads(self):
+        self.assertEqual(10000, parse_quick_look_reads('10000'))
+        self.assertEqual(0.01, parse_quick_look_reads('0.01'))
+        for text in ['', '0', '-5', '100.5', 'all']:
+            with self.assertRaises(AssertionError):
+                parse_quick_look_reads(text)
+
+    def test_quick_look_parameters(self):
+        actual = quick_look_parameters(parameters={'outdir': 'output', 'fq-dir': 'fastq', 'threads': '8'}, reads=10000)
+        self.assertDictEqual(
+            {'outdir': 'output/quick-look-10000', 'fq-dir': 'output/quick-look-10000/fastq', 'threads': '8'}, actual)
+
+    def test_format_quick_look_reads(self):
+        self.assertEqual('1000000', format_quick_look_reads(1000000.0))
+        self.assertEqual('0.00001', format_quick_look_reads(0.00001))
+        self.assertEqual('0.25', format_quick_look_reads(0.25))
@@ -0,0 +1,528 @@
+import os
+import json
+import socket
+import zipfile
+import sys
+import subprocess
+from src.remote.job_wrapper import ReferenceCache, Placement, stage_references, run, choose_cpus, format_cpu_list
+from src.samples import parse_samples
+from src.remote.fingerprint import find_fastqs, hash_fastqs
+from src.remote.merge_shards import find_artifacts
+from src.remote import compare_runs, compact_runs, preview_fastq, index_fastq, check_artifacts, figures, subsample_fastq
+from .setup import TestCase
+
+
+class TestReferenceCache(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.cache_dir = f'{self.workdir}/cache'
+        for name in ['classifier.qza', 'seqs.qza', 'tax.qza']:
+            with open(f'{self.workdir}/{name}', 'w') as fh:
+                fh.write(os.urandom(500).hex())  # 1000 bytes
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_stage_references(self):
+        cache = ReferenceCache(cache_dir=self.cache_dir, budget_bytes=10 ** 6)
+        cmd = [
+            'python', 'qiime2_pipeline',
+            f'--nb-classifier-qza={self.workdir}/classifier.qza',
+            '--reference-sequence-qza', f'{self.workdir}/seqs.qza',
+            f'--fq-dir={self.workdir}',
+        ]
+        staged = stage_references(cmd=cmd, cache=cache)
+
+        self.assertTrue(staged[2].startswith(f'--nb-classifier-qza={os.path.abspath(self.cache_dir)}/'))
+        self.assertTrue(staged[4].startswith(os.path.abspath(self.cache_dir)))
+        self.assertEqual(cmd[-1], staged[-1])
+        self.assertFileEqual(f'{self.workdir}/seqs.qza', staged[4])
+
+        cache.release()
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ReferenceCache(cache_dir=self.cache_dir, budget_bytes=2500)  # room for two references
+        for name in ['classifier.qza', 'seqs.qza']:
+            cache.stage(f'{self.workdir}/{name}')
+            cache.release()
+        cache.stage(f'{self.workdir}/classifier.qza')  # used again, so seqs.qza is the least recently used
+        cache.release()
+        cache.stage(f'{self.workdir}/tax.qza')
+        cache.release()
+
+        staged = sorted(
+            f for entry in os.listdir(self.cache_dir) if os.path.isdir(f'{self.cache_dir}/{entry}')
+            for f in os.listdir(f'{self.cache_dir}/{entry}') if not f.startswith('.'))
+        self.assertListEqual(['classifier.qza', 'tax.qza'], staged)
+
+
+class TestSampler(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_samples_of_process_tree(self):
+        samples_file = f'{self.workdir}/samples/outdir_1.bin'
+        child = 'import time; x = bytearray(64 * 2 ** 20); t = time.time()\nwhile time.time() - t < 1: pass'
+        cmd = [sys.executable, '-c', f'import subprocess, sys; subprocess.call([sys.executable, "-c", {child!r}])']
+        exit_code = run(
+            cmd=cmd, stats_json=f'{self.workdir}/job-stats.json', threads=1,
+            samples_file=samples_file, sample_seconds=0.1)
+
+        with open(samples_file, 'rb') as fh:
+            samples = parse_samples(data=fh.read())
+        self.assertEqual(0, exit_code)
+        self.assertGreater(len(samples['seconds']), 5)
+        self.assertGreater(max(samples['rss_bytes']), 64 * 2 ** 20)  # of the grandchild
+        self.assertGreater(max(samples['cpu_cores']), 0.5)
+
+        with open(f'{self.workdir}/job-stats.json') as fh:
+            stats = json.load(fh)
+        self.assertAlmostEqual(max(samples['rss_bytes']) / 1024, stats['max_tree_rss_kb'], delta=1)  # float32 samples
+        self.assertGreater(stats['max_tree_rss_kb'], stats['max_rss_kb'])  # the parent and the grandchild together
+
+
+class TestPlacement(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.placements_dir = f'{self.workdir}/placements'
+        os.makedirs(self.placements_dir)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_choose_cpus(self):
+        self.assertListEqual([4, 5, 6, 7], choose_cpus(allowed=list(range(8)), used=[0, 1, 2, 3, 0], n=4))
+        self.assertListEqual([2, 3], choose_cpus(allowed=list(range(8)), used=list(range(8)) + [0, 1], n=2))
+        self.assertListEqual([8, 10], choose_cpus(allowed=[8, 9, 10], used=[9, 12], n=2))  # within the allowed ones
+
+    def test_format_cpu_list(self):
+        self.assertEqual('0-3,8,10-11', format_cpu_list([10, 0, 1, 2, 3, 8, 11]))
+
+    def test_place_and_release(self):
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        for name, pid in [('running', os.getpid()), ('died', dead.pid)]:
+            with open(f'{self.placements_dir}/{name}', 'w') as fh:
+                json.dump({'host': socket.gethostname(), 'pid': pid, 'cpus': [0], 'text': ''}, fh)
+
+        placement = Placement(
+            placement_file=f'{self.placements_dir}/outdir_1', threads=1, pin_cpus=True, nice=10,
+            io_priority='best-effort', cgroup_memory_gb=0)
+        placement.place()
+
+        with open(f'{self.placements_dir}/outdir_1') as fh:
+            written = json.load(fh)
+        self.assertListEqual(sorted(['running', 'outdir_1', '.lock']), sorted(os.listdir(self.placements_dir)))
+        self.assertEqual(1, len(written['cpus']))
+        self.assertIn(f'CPUs {written["cpus"][0]}, nice 10', written['text'])
+
+        placement.release()
+        self.assertFalse(os.path.exists(f'{self.placements_dir}/outdir_1'))
+
+
+class TestFingerprint(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.fq_dir = f'{self.workdir}/fq'
+        os.makedirs(self.fq_dir)
+        for name in ['S1_R1.fastq.gz', 'S1_R2.fastq.gz', 'S2_R1.fastq.gz', 'S2_R2.fastq.gz', 'notes.txt']:
+            with open(f'{self.fq_dir}/{name}', 'w') as fh:
+                fh.write(name)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_find_fastqs(self):
+        suffixes = ['_R1.fastq.gz', '_R2.fastq.gz']
+        self.assertListEqual(
+            ['S1_R1.fastq.gz', 'S1_R2.fastq.gz'],
+            find_fastqs(fq_dir=self.fq_dir, suffixes=suffixes, sample_ids=['S1']))
+        self.assertEqual(  # no sample ID matches, so all FASTQ files
+            4, len(find_fastqs(fq_dir=self.fq_dir, suffixes=suffixes, sample_ids=['Sample-1'])))
+
+    def test_hashes_are_cached_until_file_changes(self):
+        cache_json = f'{self.workdir}/hashes.json'
+        names = ['S1_R1.fastq.gz']
+        first = hash_fastqs(fq_dir=self.fq_dir, names=names, cache_json=cache_json)
+
+        os.truncate(f'{self.fq_dir}/S1_R1.fastq.gz', 0)  # changes size and mtime
+        second = hash_fastqs(fq_dir=self.fq_dir, names=names, cache_json=cache_json)
+        self.assertNotEqual(first, second)
+
+        with open(cache_json) as fh:
+            cache = json.load(fh)
+        for entry in cache.values():
+            entry['sha256'] = 'cached'
+        with open(cache_json, 'w') as fh:
+            json.dump(cache, fh)
+        self.assertDictEqual(
+            {'S1_R1.fastq.gz': 'cached'}, hash_fastqs(fq_dir=self.fq_dir, names=names, cache_json=cache_json))
+
+
+class TestMergeShards(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def write_qza(self, path: str, type_: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with zipfile.ZipFile(path, 'w') as z:
+            z.writestr('0c8a8a39/metadata.yaml', f'uuid: 0c8a8a39\ntype: {type_}\nformat: BIOMV210DirFmt\n')
+
+    def test_find_artifacts(self):
+        shard = f'{self.workdir}/shard-1'
+        self.write_qza(f'{shard}/qiime2/feature-table.qza', 'FeatureTable[Frequency]')
+        self.write_qza(f'{shard}/qiime2/representative-sequences.qza', 'FeatureData[Sequence]')
+        self.write_qza(f'{shard}/qiime2/taxonomy.qza', 'FeatureData[Taxonomy]')
+        open(f'{shard}/qiime2/broken.qza', 'w').close()
+
+        self.assertDictEqual({
+            'qiime2/feature-table.qza': 'FeatureTable[Frequency]',
+            'qiime2/representative-sequences.qza': 'FeatureData[Sequence]',
+        }, find_artifacts(shard))
+
+
+class TestCheckArtifacts(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.run_dir = f'{self.workdir}/output'
+        os.makedirs(f'{self.run_dir}/qiime2')
+        with zipfile.ZipFile(f'{self.run_dir}/qiime2/feature-table.qza', 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr('0c8a8a39/metadata.yaml', 'uuid: 0c8a8a39\ntype: FeatureTable[Frequency]\nformat: BIOMV210DirFmt\n')
+            z.writestr('0c8a8a39/data/feature-table.biom', os.urandom(2 ** 16))
+        with open(f'{self.run_dir}/qiime2/feature-table.qza', 'rb') as fh:
+            data = fh.read()
+        with open(f'{self.run_dir}/qiime2/taxonomy.qza', 'wb') as fh:
+            fh.write(data[:len(data) // 2])  # killed while writing
+        os.makedirs(f'{self.run_dir}/shard-1')
+        open(f'{self.run_dir}/shard-1/command.txt', 'w').close()
+        open(f'{self.run_dir}/shard-1/broken.qza', 'w').close()  # of its own run
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_find_artifacts(self):
+        self.assertListEqual(
+            ['qiime2/feature-table.qza', 'qiime2/taxonomy.qza'], check_artifacts.find_artifacts(self.run_dir))
+
+    def test_check_artifact(self):
+        self.assertEqual(
+            'FeatureTable[Frequency]', check_artifacts.check_artifact(f'{self.run_dir}/qiime2/feature-table.qza'))
+        self.assertIsNone(check_artifacts.check_artifact(f'{self.run_dir}/qiime2/taxonomy.qza'))
+
+    def test_remove_broken(self):
+        script = f'{os.path.dirname(check_artifacts.__file__)}/check_artifacts.py'
+        stdout = subprocess.run(
+            [sys.executable, script, f'--outdir={self.run_dir}', '--remove-broken=yes'],
+            capture_output=True, text=True, check=True).stdout
+        self.assertDictEqual({
+            'intact': {'qiime2/feature-table.qza': 'FeatureTable[Frequency]'},
+            'broken': ['qiime2/taxonomy.qza'],
+        }, json.loads(stdout))
+        self.assertListEqual(['feature-table.qza'], os.listdir(f'{self.run_dir}/qiime2'))
+
+
+class TestFigures(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.run_dir = f'{self.workdir}/output'
+        os.makedirs(f'{self.run_dir}/plots')
+        os.makedirs(f'{self.run_dir}/shard-1')
+        open(f'{self.run_dir}/shard-1/command.txt', 'w').close()
+        for path in ['plots/heatmap.png', 'plots/pcoa.pdf', 'shard-1/heatmap.png', 'feature-table.tsv']:
+            with open(f'{self.run_dir}/{path}', 'wb') as fh:
+                fh.write(b'\x89PNG\r\n' if path.endswith('.png') else b'%PDF')
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_find_figures(self):
+        actual = figures.find_figures(self.run_dir)
+        self.assertListEqual(['plots/heatmap.png', 'plots/pcoa.pdf'], [f['path'] for f in actual])  # not those of the shard
+        self.assertEqual(6, actual[0]['bytes'])
+
+    def test_thumbnail_without_pillow(self):
+        try:
+            import PIL
+            self.skipTest('Pillow is installed')
+        except ImportError:
+            pass
+        self.assertEqual(b'\x89PNG\r\n', figures.thumbnail(f'{self.run_dir}/plots/heatmap.png', size=256))  # small, sent as it is
+        self.assertIsNone(figures.thumbnail(f'{self.run_dir}/plots/pcoa.pdf', size=256))
+
+
+class TestSubsampleFastq(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        import gzip
+        self.fq_dir = f'{self.workdir}/fastq'
+        self.subsample_dir = f'{self.workdir}/subsample'
+        os.makedirs(self.fq_dir)
+        os.makedirs(self.subsample_dir)
+        for read in ['R1', 'R2']:
+            with gzip.open(f'{self.fq_dir}/S1_{read}.fastq.gz', 'wt') as fh:
+                fh.writelines(f'@read{i}/{read}\nACGT\n+\nIIII\n' for i in range(1000))
+        open(f'{self.fq_dir}/S2_R1.fastq.gz', 'w').close()  # without R2
+
+    def tearDown(self):
+        self.tear_down()
+
+    def read_names(self, file):
+        import gzip
+        with gzip.open(file, 'rt') as fh:
+            return [line.strip().split('/')[0] for line in fh.readlines()[::4]]
+
+    def test_find_samples(self):
+        self.assertDictEqual(
+            {'S1': ['S1_R1.fastq.gz', 'S1_R2.fastq.gz']},
+            subsample_fastq.find_samples(self.fq_dir, suffixes=['_R1.fastq.gz', '_R2.fastq.gz'], sample_ids=['S1', 'S3']))
+        with self.assertRaises(AssertionError):  # instead of all the FASTQ files of fq-dir
+            subsample_fastq.find_samples(self.fq_dir, suffixes=['_R1.fastq.gz', '_R2.fastq.gz'], sample_ids=['S3'])
+
+    def test_reservoir_keeps_pairs(self):
+        actual = subsample_fastq.subsample(
+            self.fq_dir, ['S1_R1.fastq.gz', 'S1_R2.fastq.gz'], self.subsample_dir, reads=100, seed=1, sample='S1')
+        self.assertTupleEqual(('S1', 1000, 100), actual)
+        r1 = self.read_names(f'{self.subsample_dir}/S1_R1.fastq.gz')
+        self.assertEqual(100, len(set(r1)))
+        self.assertListEqual(r1, self.read_names(f'{self.subsample_dir}/S1_R2.fastq.gz'))
+        self.assertListEqual(sorted(r1, key=lambda r: int(r[len('@read'):])), r1)  # in the order of the input
+        self.assertListEqual(['S1_R1.fastq.gz', 'S1_R2.fastq.gz'], sorted(os.listdir(self.subsample_dir)))
+
+    def test_same_seed_same_reads(self):
+        files = ['S1_R1.fastq.gz']
+        _, _, n = subsample_fastq.subsample(self.fq_dir, files, self.subsample_dir, reads=0.1, seed=1, sample='S1')
+        first = self.read_names(f'{self.subsample_dir}/S1_R1.fastq.gz')
+        subsample_fastq.subsample(self.fq_dir, files, self.subsample_dir, reads=0.1, seed=1, sample='S1')
+        self.assertListEqual(first, self.read_names(f'{self.subsample_dir}/S1_R1.fastq.gz'))
+        self.assertTrue(50 < n < 150)
+        subsample_fastq.subsample(self.fq_dir, files, self.subsample_dir, reads=0.1, seed=2, sample='S1')
+        self.assertNotEqual(first, self.read_names(f'{self.subsample_dir}/S1_R1.fastq.gz'))
+
+    def test_fewer_reads_than_requested(self):
+        actual = subsample_fastq.subsample(
+            self.fq_dir, ['S1_R1.fastq.gz'], self.subsample_dir, reads=5000, seed=1, sample='S1')
+        self.assertTupleEqual(('S1', 1000, 1000), actual)
+
+
+class TestCompareRuns(TestCase):
+
+    TABLE_1 = {'f1': {'S1': 10, 'S2': 30}, 'f2': {'S1': 60}}
+    TABLE_2 = {'f1': {'S1': 50}, 'f3': {'S2': 50}}
+    TAXONOMY = {
+        'f1': 'd__Bacteria; p__Firmicutes; c__Bacilli; o__Lactobacillales; f__Streptococcaceae; g__Streptococcus',
+        'f2': 'd__Bacteria; p__Firmicutes; c__Bacilli; o__Lactobacillales; f__Streptococcaceae; g__Lactococcus',
+        'f3': 'd__Bacteria; p__Bacteroidota',
+    }
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_read_taxonomy(self):
+        qza = f'{self.workdir}/taxonomy.qza'
+        with zipfile.ZipFile(qza, 'w') as z:
+            z.writestr('0c8a8a39/metadata.yaml', 'uuid: 0c8a8a39\ntype: FeatureData[Taxonomy]\n')
+            z.writestr('0c8a8a39/data/taxonomy.tsv', 'Feature ID\tTaxon\tConfidence\nf1\tg__Streptococcus\t0.99\n')
+        self.assertDictEqual({'f1': 'g__Streptococcus'}, compare_runs.read_taxonomy(qza))
+
+    def test_richness(self):
+        self.assertTupleEqual((2, 1.5, 2), compare_runs.richness(self.TABLE_1))  # S1 has 2 features, S2 has 1
+
+    def test_relative_abundance_by_level(self):
+        genus = compare_runs.relative_abundance(self.TABLE_1, self.TAXONOMY, 'genus')
+        self.assertAlmostEqual(0.4, genus['d__Bacteria;p__Firmicutes;c__Bacilli;o__Lactobacillales;f__Streptococcaceae;g__Streptococcus'])
+        phylum = compare_runs.relative_abundance(self.TABLE_2, self.TAXONOMY, 'phylum')
+        self.assertDictEqual({'d__Bacteria;p__Firmicutes': 0.5, 'd__Bacteria;p__Bacteroidota': 0.5}, phylum)
+        family = compare_runs.relative_abundance(self.TABLE_2, self.TAXONOMY, 'family')
+        self.assertIn('d__Bacteria;p__Bacteroidota;Unassigned', family)
+
+    def test_distances_and_deltas(self):
+        a = compare_runs.relative_abundance(self.TABLE_1, {}, 'feature')  # f1 0.4, f2 0.6
+        b = compare_runs.relative_abundance(self.TABLE_2, {}, 'feature')  # f1 0.5, f3 0.5
+        self.assertAlmostEqual(0.0, compare_runs.bray_curtis(a, a))
+        self.assertAlmostEqual((0.1 + 0.6 + 0.5) / 2, compare_runs.bray_curtis(a, b))
+        self.assertListEqual(['f2', 'f3'], compare_runs.top_deltas([a, b], top=2))
+
+
+class TestCompactRuns(TestCase):
+
+    DAY = 86400
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.now = 100 * self.DAY
+        self.write_run(outdir='old', days_ago=40)
+        self.write_run(outdir='old/sweep-point', days_ago=40)  # nested outdir
+        self.write_run(outdir='recent', days_ago=1)
+        self.write_run(outdir='failed', days_ago=40, exit_code='1')
+        os.makedirs(f'{self.workdir}/running')
+        open(f'{self.workdir}/running/command.txt', 'w').close()
+
+    def tearDown(self):
+        self.tear_down()
+
+    def write_run(self, outdir: str, days_ago: int, exit_code: str = '0'):
+        parameters = {'outdir': outdir, 'sample-sheet': f'{outdir}/sample-sheet.csv', 'skip-otu': True}
+        outdir = f'{self.workdir}/{outdir}'
+        os.makedirs(f'{outdir}/temp', exist_ok=True)
+        os.makedirs(f'{outdir}/qiime2', exist_ok=True)
+        with open(f'{outdir}/temp/intermediate.fastq', 'w') as fh:
+            fh.write('@read\nACGT\n+\nIIII\n' * 1000)
+        with open(f'{outdir}/qiime2/feature-table.tsv', 'w') as fh:
+            fh.write('f1\t10\t20\n' * 200000)
+        with open(f'{outdir}/qiime2/small.tsv', 'w') as fh:
+            fh.write('f1\t10\n')
+        with open(f'{outdir}/progress.txt', 'w') as fh:
+            fh.write('done\n' * 300000)
+        with open(f'{outdir}/sample-sheet.csv', 'w') as fh:
+            fh.write('sample-1,sample-1_R1.fastq.gz\n' * 50000)
+        with open(f'{outdir}/parameters.json', 'w') as fh:
+            json.dump({'pipeline': 'qiime2_pipeline-2.10.2', 'parameters': parameters}, fh)
+        with open(f'{outdir}/exit-code.txt', 'w') as fh:
+            fh.write(f'{exit_code}\n')
+        t = self.now - days_ago * self.DAY
+        os.utime(f'{outdir}/exit-code.txt', (t, t))
+
+    def test_find_finished_outdirs(self):
+        outdirs = compact_runs.find_finished_outdirs(root=self.workdir, min_age_seconds=30 * self.DAY, now=self.now)
+        self.assertListEqual(['old', 'old/sweep-point'], outdirs)  # not the failed run
+        outdirs = compact_runs.find_finished_outdirs(root=self.workdir, min_age_seconds=0, now=self.now)
+        self.assertListEqual(['old', 'old/sweep-point', 'recent'], outdirs)
+
+    def test_compact(self):
+        outdir = f'{self.workdir}/old'
+        report = compact_runs.compact(
+            outdir, threads=2, min_bytes=2 ** 20, temporary=['temp', 'missing', '..'], root=self.workdir, dry_run=True)
+        self.assertListEqual(['temp'], report['deleted'])
+        self.assertListEqual(['qiime2/feature-table.tsv'], report['compressed'])  # not the sample sheet
+        self.assertTrue(os.path.exists(f'{outdir}/temp'))
+        self.assertEqual(report['before'], report['after'])
+
+        report = compact_runs.compact(outdir, threads=2, min_bytes=2 ** 20, temporary=['temp'], root=self.workdir)
+
+        self.assertFalse(os.path.exists(f'{outdir}/temp'))
+        self.assertTrue(os.path.exists(f'{outdir}/qiime2/feature-table.tsv.gz'))
+        self.assertFalse(os.path.exists(f'{outdir}/qiime2/feature-table.tsv'))
+        self.assertTrue(os.path.exists(f'{outdir}/qiime2/small.tsv'))  # below min_bytes
+        self.assertTrue(os.path.exists(f'{outdir}/progress.txt'))  # read by the app
+        self.assertTrue(os.path.exists(f'{outdir}/sample-sheet.csv'))  # an input of the run
+        self.assertTrue(os.path.exists(f'{outdir}/sweep-point/temp'))  # the nested outdir is compacted on its own
+        self.assertDictEqual({'outdir': outdir, 'deleted': ['temp'], 'compressed': ['qiime2/feature-table.tsv']}, {
+            k: report[k] for k in ['outdir', 'deleted', 'compressed']})
+        self.assertLess(report['after'], report['before'] - 2 ** 20)
+
+        outdirs = compact_runs.find_finished_outdirs(root=self.workdir, min_age_seconds=30 * self.DAY, now=self.now)
+        self.assertListEqual(['old/sweep-point'], outdirs)  # not compacted twice
+
+
+class TestPreviewFastq(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_read_fastq_stops_at_n_reads(self):
+        import gzip
+        with gzip.open(f'{self.workdir}/S1_R1.fastq.gz', 'wt') as fh:
+            for i in range(100):
+                fh.write(f'@read{i}\nACGT\n+\nIIII\n')
+        reads = preview_fastq.read_fastq(f'{self.workdir}/S1_R1.fastq.gz', n=10)
+        self.assertEqual(10, len(reads))
+        self.assertTupleEqual(('ACGT', 'IIII'), reads[0])
+
+    def test_sample_files(self):
+        for i in range(10):
+            open(f'{self.workdir}/S{i}_R1.fastq.gz', 'w').close()
+            open(f'{self.workdir}/S{i}_R2.fastq.gz', 'w').close()
+        self.assertListEqual(
+            ['S0_R1.fastq.gz', 'S2_R1.fastq.gz', 'S5_R1.fastq.gz', 'S7_R1.fastq.gz'],
+            preview_fastq.sample_files(self.workdir, suffix='_R1.fastq.gz', n=4))
+
+    def test_detect_primer_with_spacers(self):
+        primer = 'GTGCCAGCAGCCGCGGTAA'  # 515F
+        reads = [(primer + 'TACGGAGGGTGC', 'I' * 31)] * 8 + [('AC' + primer + 'TACGGAGGGT', 'I' * 31)] * 2
+        self.assertDictEqual(
+            {'name': '515F', 'fraction': 1.0, 'end': 21},  # the end of the primer in the reads with the 2-base spacer
+            preview_fastq.detect_primer(reads))
+        self.assertIsNone(preview_fastq.detect_primer([('TACGGAGGGTGCAAGCGTTAATCGGAATTACTGG', 'I' * 34)]))
+
+    def test_quality_per_position(self):
+        reads = [('ACG', 'I5+'), ('ACG', 'I5+'), ('AC', '++')]  # I = 40, 5 = 20, + = 10
+        quality = preview_fastq.quality_per_position(reads)
+        self.assertListEqual([40, 20, 10], quality['median'])
+        self.assertListEqual([10, 10, 10], quality['q25'])
+        self.assertListEqual([30.0, 16.7, 10.0], quality['mean'])
+
+    def test_suggest(self):
+        good = [('GTGCCAGCAGCCGCGGTAA' + 'A' * 100, 'I' * 119)] * 9  # 515F, quality 40
+        bad = [('GTGCCAGCAGCCGCGGTAA' + 'A' * 100, 'I' * 19 + '+' * 100)]  # quality 10 after the primer: 10 expected errors
+        summaries = {'r1': preview_fastq.summarize(good + bad, max_ee=8.0)}
+        self.assertEqual(0.9, summaries['r1']['expected_errors']['retained_at_max_ee'])
+        self.assertDictEqual(
+            {'clip-r1-5-prime': '19', 'max-expected-error-bases': '10.0'},
+            preview_fastq.suggest(summaries))
+
+
+class TestIndexFastq(TestCase):
+
+    NAMES = [
+        'S1_R1.fastq.gz', 'S1_R2.fastq.gz',
+        'S2_R1.fastq.gz',  # no R2
+        'S3_R1.fastq.gz', 'S3_R2.fastq.gz', 'S3_R1.fastq',  # R1 twice
+        'S4_L001_R1_001.fastq.gz', 'S4_L001_R2_001.fastq.gz',
+        'S5_L001_R1_001.fastq.gz', 'S5_L001_R2_001.fastq.gz',
+        'S6_L001_R1_001.fastq.gz', 'S6_L001_R2_001.fastq.gz',
+        'S7_L001_R1_001.fastq.gz', 'S7_L001_R2_001.fastq.gz',
+    ]
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_build_index(self):
+        index, duplicates, unmatched = index_fastq.build_index(self.NAMES, suffixes=['_R1.fastq.gz', '_R2.fastq.gz'])
+        self.assertListEqual(['S1', 'S3'], index_fastq.paired_samples(index))
+        self.assertListEqual(['S2_R1.fastq.gz', None], index['S2'])
+        self.assertDictEqual({'S3': ['S3_R1.fastq']}, duplicates)
+        self.assertEqual(8, len(unmatched))
+
+    def test_suggest_suffixes(self):
+        self.assertListEqual(
+            ['_R1_001.fastq.gz', '_R2_001.fastq.gz'],  # the samples S4_L001, ...
+            index_fastq.suggest_suffixes(self.NAMES, n_suffixes=2))
+        self.assertListEqual(['.fastq.gz'], index_fastq.suggest_suffixes(self.NAMES, n_suffixes=1))
+
+    def test_listing_is_cached_until_dir_changes(self):
+        fq_dir, cache = f'{self.workdir}/fq', f'{self.workdir}/.qiime2app/fastq-index.json'
+        os.makedirs(fq_dir)
+        for name in ['S1_R1.fastq.gz', 'S1_R2.fastq.gz', 'notes.txt']:
+            open(f'{fq_dir}/{name}', 'w').close()
+
+        self.assertTupleEqual((['S1_R1.fastq.gz', 'S1_R2.fastq.gz'], False), index_fastq.list_fq_dir(fq_dir, cache_json=cache))
+        self.assertTupleEqual((['S1_R1.fastq.gz', 'S1_R2.fastq.gz'], True), index_fastq.list_fq_dir(fq_dir, cache_json=cache))
+
+        open(f'{fq_dir}/S2_R1.fastq.gz', 'w').close()
+        os.utime(fq_dir, ns=(0, os.stat(fq_dir).st_mtime_ns + 1))  # also on file systems with coarse mtimes
+        names, cached = index_fastq.list_fq_dir(fq_dir, cache_json=cache)
+        self.assertFalse(cached)
+        self.assertIn('S2_R1.fastq.gz', names)
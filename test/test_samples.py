@@ -0,0 +1,27 @@
+import struct
+from src.samples import SAMPLE_FORMAT, parse_samples, downsample_min_max
+from .setup import TestCase
+
+
+class TestFunction(TestCase):
+
+    def test_parse_samples_leaves_partial_record(self):
+        data = struct.pack(SAMPLE_FORMAT, 5, 1.5, 2048, 0, 100) + struct.pack(SAMPLE_FORMAT, 10, 2, 4096, 0, 0)
+        samples = parse_samples(data=data[:-3])
+        self.assertListEqual([5.0], samples['seconds'])
+        self.assertListEqual([1.5], samples['cpu_cores'])
+        self.assertListEqual([100.0], samples['write_bytes_per_second'])
+        self.assertListEqual([], parse_samples(data=b'')['rss_bytes'])
+
+    def test_downsample_min_max_keeps_peaks(self):
+        xs = list(range(1000))
+        ys = [0.0] * 1000
+        ys[123], ys[777] = 9.0, -9.0
+        dx, dy = downsample_min_max(xs=xs, ys=ys, n_buckets=10)
+        self.assertLessEqual(len(dx), 20)
+        self.assertIn(9.0, dy)
+        self.assertIn(-9.0, dy)
+        self.assertListEqual(sorted(dx), dx)
+
+    def test_downsample_min_max_short(self):
+        self.assertTupleEqual(([1, 2], [3, 4]), downsample_min_max(xs=[1, 2], ys=[3, 4], n_buckets=10))
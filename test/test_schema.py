@@ -0,0 +1,75 @@
+from src.schema import parse_help, merge_schema, load_schema, save_schema
+from .setup import TestCase
+
+
+HELP = '''\
+usage: qiime2_pipeline -s SAMPLE_SHEET -f FQ_DIR [-o] [--paired-end-mode {merge,pool}] [--skip-otu]
+
+required arguments:
+  -s SAMPLE_SHEET, --sample-sheet SAMPLE_SHEET
+                        path-like, sample sheet
+  -f FQ_DIR, --fq-dir FQ_DIR
+                        path-like, directory of fastq files
+
+optional arguments:
+  -o , --outdir         path-like, output directory (default:
+                        qiime2_pipeline_outdir)
+  --paired-end-mode {merge,pool}
+                        how to handle the paired-end reads, merge or pool
+                        (default: merge)
+  --skip-otu            skip OTU clustering
+  --chimera-method {denovo,reference,none}
+                        (default: denovo)
+  --min-reads MIN_READS
+                        -1 for no minimum (default: 100)
+  -h, --help            show this help message and exit
+'''
+
+
+class TestSchema(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_parse_help(self):
+        schema = parse_help(stdout=HELP)
+        self.assertListEqual(
+            ['fq-dir', 'outdir', 'paired-end-mode', 'skip-otu', 'chimera-method', 'min-reads'], list(schema.keys()))
+        self.assertDictEqual({'flag': False, 'choices': [], 'default': None}, schema['fq-dir'])
+        self.assertDictEqual({'flag': False, 'choices': [], 'default': 'qiime2_pipeline_outdir'}, schema['outdir'])
+        self.assertDictEqual({'flag': False, 'choices': ['merge', 'pool'], 'default': 'merge'}, schema['paired-end-mode'])
+        self.assertDictEqual({'flag': True, 'choices': [], 'default': None}, schema['skip-otu'])
+        self.assertEqual('100', schema['min-reads']['default'])
+
+    def test_merge_schema(self):
+        key_to_values = {
+            'fq-dir': ['data'],
+            'outdir': ['output'],
+            'paired-end-mode': ['pool', 'concat'],
+            'skip-otu': False,
+            'otu-identity': ['0.97'],  # removed by the release
+        }
+        actual = merge_schema(
+            key_to_values=key_to_values,
+            schema={
+                **parse_help(stdout=HELP),
+                'start-stage': {'flag': False, 'choices': ['denoising', 'diversity'], 'default': None},  # set by the app
+            },
+            known_keys=list(key_to_values.keys()) + ['min-reads'])  # known, but not of this mode
+        self.assertDictEqual({
+            'fq-dir': ['data'],
+            'outdir': ['output'],
+            'paired-end-mode': ['pool', 'merge'],  # 'concat' is not a choice of the release
+            'skip-otu': False,
+            'chimera-method': ['denovo', 'reference', 'none'],
+        }, actual)
+
+    def test_save_and_load(self):
+        file = f'{self.outdir}/qiime2_pipeline-2.11.0.json'
+        self.assertIsNone(load_schema(file=file))
+        schema = parse_help(stdout=HELP)
+        save_schema(file=file, schema=schema)
+        self.assertDictEqual(schema, load_schema(file=file))
@@ -0,0 +1,66 @@
+from src.timeline import Timeline, differing_args, aggregate_by_parameters
+from .setup import TestCase
+
+
+OUTPUT = b'''\
+100\tStart running the pipeline
+105\tqiime tools import --type SampleData[PairedEndSequencesWithQuality]
+130\tqiime dada2 denoise-paired --p-n-threads 4
+400\tRunning external command line: ...
+430\tqiime feature-classifier classify-sklearn
+900\tqiime diversity core-metrics-phylogenetic
+960\tDone
+'''
+
+
+class TestTimeline(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_feed_incrementally(self):
+        timeline = Timeline()
+        timeline.feed(data=OUTPUT[:70])  # ends in the middle of the second line
+        self.assertEqual(len(OUTPUT.split(b'\n')[0]) + 1, timeline.offset)
+        timeline.feed(data=OUTPUT[timeline.offset:])
+        self.assertEqual(len(OUTPUT), timeline.offset)
+        self.assertEqual('100', timeline.first_timestamp)
+
+        self.assertDictEqual({
+            'Other': 5,
+            'Import': 25,
+            'Denoising': 300,
+            'Classification': 470,
+            'Diversity': 60,
+        }, timeline.durations())
+
+    def test_save_and_load(self):
+        timeline = Timeline()
+        timeline.feed(data=OUTPUT)
+        timeline.save(file=f'{self.workdir}/timeline.json')
+        loaded = Timeline.load(file=f'{self.workdir}/timeline.json')
+        self.assertDictEqual(timeline.__dict__, loaded.__dict__)
+        self.assertEqual(0, Timeline.load(file=f'{self.workdir}/missing.json').offset)
+
+    def test_aggregate_by_parameters(self):
+        commands = {
+            'out_1': ['python', 'pipeline', "--fq-dir=data", '--outdir=out_1', '--paired-end-mode=merge'],
+            'out_2': ['python', 'pipeline', "--fq-dir=data", '--outdir=out_2', '--paired-end-mode=merge'],
+            'out_3': ['python', 'pipeline', "--fq-dir=data", '--outdir=out_3', '--paired-end-mode=pool'],
+        }
+        self.assertDictEqual(
+            {'out_1': '--paired-end-mode=merge', 'out_2': '--paired-end-mode=merge', 'out_3': '--paired-end-mode=pool'},
+            differing_args(commands=commands))
+
+        timelines = {}
+        for key, output in [('out_1', b'0\tdada2\n100\tdone\n'), ('out_2', b'0\tdada2\n300\tdone\n'), ('out_3', b'0\tdada2\n50\tdone\n')]:
+            timelines[key] = Timeline()
+            timelines[key].feed(data=output)
+        rows = aggregate_by_parameters(timelines=timelines, commands=commands)
+        self.assertListEqual([
+            ('--paired-end-mode=merge', 2, {'Denoising': 200.0}),
+            ('--paired-end-mode=pool', 1, {'Denoising': 50.0}),
+        ], rows)
@@ -0,0 +1,54 @@
+import os
+import gzip
+from src.local import LocalSFTP
+from src.upload import remote_fastq_name, compress_blocks, upload_fastq
+from .setup import TestCase
+
+
+class TestUpload(TestCase):
+
+    def setUp(self):
+        self.set_up(py_path=__file__)
+        self.reads = b''.join(
+            f'@read{i}\n{"ACGT" * 37}A\n+\n{"F" * 149}\n'.encode() for i in range(20000))  # about 6 MB
+        self.fastq = f'{self.workdir}/S1_R1_001.fastq'
+        with open(self.fastq, 'wb') as fh:
+            fh.write(self.reads)
+
+    def tearDown(self):
+        self.tear_down()
+
+    def test_remote_fastq_name(self):
+        self.assertEqual('S1_R1.fastq.gz', remote_fastq_name('S1_R1_001.fastq', '_R1.fastq.gz', '_R2.fastq.gz'))
+        self.assertEqual('S1_R2.fastq.gz', remote_fastq_name('S1.2.fq', '_R1.fastq.gz', '_R2.fastq.gz'))
+        self.assertEqual('S1_R1.fastq.gz', remote_fastq_name('S1_R1.fastq.gz', '_R1.fastq.gz', '_R2.fastq.gz'))
+        self.assertEqual('S1.fastq.gz', remote_fastq_name('S1.fastq', '.fastq.gz'))  # single-end
+        self.assertIsNone(remote_fastq_name('S1.fastq', '_R1.fastq.gz', '_R2.fastq.gz'))  # which read?
+        self.assertIsNone(remote_fastq_name('sample-sheet.csv', '.fastq.gz'))
+
+    def test_compress_blocks(self):
+        with open(self.fastq, 'rb') as fh:
+            members = list(compress_blocks(fh, threads=3, block_size=2 ** 20))
+        self.assertEqual(6, len(members))
+        self.assertEqual(self.reads, gzip.decompress(b''.join(members)))  # one gzip file of several members
+
+    def test_upload_fastq(self):
+        os.makedirs(f'{self.outdir}/fastq')
+        sftp = LocalSFTP(home=self.outdir)
+        sent = upload_fastq(sftp=sftp, local=self.fastq, remote='fastq/S1_R1.fastq.gz', threads=2)
+
+        self.assertListEqual(['S1_R1.fastq.gz'], os.listdir(f'{self.outdir}/fastq'))  # no partial file left
+        self.assertEqual(sent, os.path.getsize(f'{self.outdir}/fastq/S1_R1.fastq.gz'))
+        self.assertLess(sent, len(self.reads) / 4)
+        with gzip.open(f'{self.outdir}/fastq/S1_R1.fastq.gz', 'rb') as fh:
+            self.assertEqual(self.reads, fh.read())
+
+        upload_fastq(sftp=sftp, local=self.fastq, remote='fastq/S1_R1.fastq', threads=2)  # an uncompressed suffix
+        self.assertFileEqual(self.fastq, f'{self.outdir}/fastq/S1_R1.fastq')
+
+        gzipped = f'{self.workdir}/S2_R1.fastq.gz'
+        with gzip.open(gzipped, 'wb') as fh:
+            fh.write(self.reads)
+        sent = upload_fastq(sftp=sftp, local=gzipped, remote='fastq/S2_R1.fastq', threads=2)  # decompressed
+        self.assertEqual(len(self.reads), sent)
+        self.assertFileEqual(self.fastq, f'{self.outdir}/fastq/S2_R1.fastq')